@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import pytest
+
+from weatherbox.camera.broadcast import FrameBroadcaster
+
+
+@pytest.mark.asyncio
+async def test_every_client_gets_the_same_frame():
+    broadcaster = FrameBroadcaster()
+    clients = [broadcaster.frames() for _ in range(25)]
+    pending = [asyncio.ensure_future(anext(client)) for client in clients]
+    await asyncio.sleep(0)
+
+    frame = b"\xff\xd8 frame \xff\xd9"
+    broadcaster.publish(frame)
+    received = await asyncio.gather(*pending)
+
+    assert all(result is frame for result in received)
+    assert broadcaster.stats()["clients"] == 25
+
+    for client in clients:
+        await client.aclose()
+    assert broadcaster.stats()["clients"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_client_gets_latest_frame():
+    broadcaster = FrameBroadcaster()
+    subscriber = broadcaster.subscribe()
+
+    for i in range(5):
+        broadcaster.publish(f"frame {i}".encode())
+
+    assert await subscriber.next() == b"frame 4"
+    assert subscriber.dropped == 4
+
+    waiting = asyncio.ensure_future(subscriber.next())
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    broadcaster.publish(b"frame 5")
+    assert await waiting == b"frame 5"
+
+
+@pytest.mark.asyncio
+async def test_publish_from_encoder_thread():
+    broadcaster = FrameBroadcaster()
+    client = broadcaster.frames()
+    pending = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0)
+
+    thread = threading.Thread(target=broadcaster.publish_threadsafe, args=(b"frame",))
+    thread.start()
+    thread.join()
+
+    assert await asyncio.wait_for(pending, 1) == b"frame"
+    await client.aclose()
@@ -0,0 +1,111 @@
+import pytest
+
+from weatherbox.camera.arducam import CameraSession
+
+
+class FakeCamera:
+    """Stands in for Picamera2, recording calls and failing on demand."""
+
+    def __init__(self, fail_captures=0):
+        self.calls = []
+        self.fail_captures = fail_captures
+        self.closed = False
+
+    def create_preview_configuration(self):
+        return "preview"
+
+    def create_still_configuration(self):
+        return "still"
+
+    def configure(self, config):
+        self.calls.append(("configure", config))
+
+    def start(self):
+        self.calls.append(("start",))
+
+    def switch_mode(self, config):
+        self.calls.append(("switch_mode", config))
+
+    def capture_array(self):
+        self._capture()
+        return "frame"
+
+    def capture_file(self, path):
+        self._capture()
+        self.calls.append(("capture_file", path))
+
+    def capture_metadata(self):
+        self._capture()
+        return {}
+
+    def _capture(self):
+        if self.fail_captures:
+            self.fail_captures -= 1
+            raise RuntimeError("Camera timed out")
+
+    def stop(self):
+        self.calls.append(("stop",))
+
+    def close(self):
+        self.closed = True
+
+
+def _session(*cameras):
+    cameras = list(cameras)
+    return CameraSession(camera_factory=lambda: cameras.pop(0), warmup=0)
+
+
+def test_camera_kept_open_between_captures():
+    camera = FakeCamera()
+    session = _session(camera)
+
+    for i in range(3):
+        session.capture_file(f"{i}.jpg")
+    assert session.capture_array() == "frame"
+
+    assert session.opens == 1
+    assert [call for call in camera.calls if call[0] == "switch_mode"] == [
+        ("switch_mode", "still"),
+        ("switch_mode", "preview"),
+    ]
+    assert session.status()["mode"] == "preview"
+
+    session.close()
+    assert camera.closed
+    assert not session.status()["open"]
+
+
+def test_camera_reopened_after_failure():
+    broken, replacement = FakeCamera(fail_captures=1), FakeCamera()
+    session = _session(broken, replacement)
+
+    session.capture_file("still.jpg")
+
+    assert broken.closed
+    assert ("capture_file", "still.jpg") in replacement.calls
+    assert session.opens == 2
+    assert session.failures == 1
+
+
+def test_capture_raises_after_retry():
+    session = _session(FakeCamera(fail_captures=1), FakeCamera(fail_captures=1))
+
+    with pytest.raises(RuntimeError):
+        session.capture_array()
+    assert not session.status()["open"]
+
+
+def test_health_check_closes_unresponsive_camera():
+    camera = FakeCamera()
+    session = _session(camera, FakeCamera())
+
+    assert not session.check_health()
+    session.capture_array()
+    assert session.check_health()
+
+    camera.fail_captures = 1
+    assert not session.check_health()
+    assert camera.closed
+
+    session.capture_array()
+    assert session.opens == 2
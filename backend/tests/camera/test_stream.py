@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from weatherbox.camera import stream as stream_module
+from weatherbox.camera.stream import MjpegStream
+
+
+class FakeBackend:
+    """Stands in for Picamera2, keeping each profile's output to publish frames to."""
+
+    def __init__(self):
+        self.camera_starts = 0
+        self.camera_stops = 0
+        self.outputs = {}
+
+    def start_camera(self):
+        self.camera_starts += 1
+        return "camera"
+
+    def start_encoder(self, camera, profile, output):
+        self.outputs[profile.stream] = output
+        return profile.stream
+
+    def stop_encoder(self, camera, encoder):
+        del self.outputs[encoder]
+
+    def stop_camera(self, camera):
+        self.camera_stops += 1
+
+
+async def _connect(stream, profile="high"):
+    client = stream.frames(profile)
+    pending = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0.01)
+    return client, pending
+
+
+async def _disconnect(client, pending):
+    # Cancelling the waiting read is how a disconnect reaches the generator
+    pending.cancel()
+    await asyncio.gather(pending, return_exceptions=True)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_starts_on_first_client_and_stops_when_idle():
+    backend = FakeBackend()
+    stream = MjpegStream(backend, idle_seconds=0.05)
+    assert not stream.recording
+
+    first = await _connect(stream)
+    second = await _connect(stream)
+    backend.outputs["main"].write(b"frame")
+    assert await first[1] == b"frame"
+    assert backend.camera_starts == 1
+
+    await _disconnect(*first)
+    await _disconnect(*second)
+    assert stream.recording
+
+    await asyncio.sleep(0.1)
+    assert not stream.recording
+    assert backend.camera_stops == 1
+
+
+@pytest.mark.asyncio
+async def test_client_within_grace_period_keeps_recording():
+    backend = FakeBackend()
+    stream = MjpegStream(backend, idle_seconds=0.05)
+
+    await _disconnect(*await _connect(stream))
+    await asyncio.sleep(0.03)
+    client = await _connect(stream)
+    await asyncio.sleep(0.05)
+
+    assert stream.recording
+    assert backend.camera_starts == 1
+
+    await _disconnect(*client)
+    await stream.stop()
+    assert backend.camera_stops == 1
+
+
+@pytest.mark.asyncio
+async def test_profiles_share_one_camera():
+    backend = FakeBackend()
+    stream = MjpegStream(backend, idle_seconds=0.05)
+
+    high = await _connect(stream, "high")
+    low = await _connect(stream, "low")
+    backend.outputs["main"].write(b"1080p")
+    backend.outputs["lores"].write(b"480p")
+
+    assert await high[1] == b"1080p"
+    assert await low[1] == b"480p"
+    assert backend.camera_starts == 1
+
+    await _disconnect(*low)
+    await asyncio.sleep(0.1)
+    assert set(backend.outputs) == {"main"}
+    assert stream.recording
+
+    await _disconnect(*high)
+    await stream.stop()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_client_steps_down_when_behind(monkeypatch):
+    monkeypatch.setattr(stream_module, "ADAPTIVE_WINDOW", 4)
+    backend = FakeBackend()
+    stream = MjpegStream(backend, idle_seconds=0.05)
+
+    client = stream.frames("adaptive")
+    pending = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0.01)
+
+    # A slow client only gets every third frame
+    for i in range(12):
+        backend.outputs["main"].write(b"high")
+        await asyncio.sleep(0)
+        backend.outputs["main"].write(b"high")
+        backend.outputs["main"].write(b"high")
+        assert await pending == b"high"
+        pending = asyncio.ensure_future(anext(client))
+        await asyncio.sleep(0.01)
+        if "lores" in backend.outputs:
+            break
+
+    assert stream.adaptive_steps == 1
+    backend.outputs["lores"].write(b"low")
+    assert await pending == b"low"
+
+    await client.aclose()
+    await stream.stop()
@@ -0,0 +1,109 @@
+"""
+Bit by bit reference decoding of SPS30 measured values frames, as the driver
+decoded them before its CRC table and struct unpacking, to check those against.
+Compare their CPU time without a sensor with python -m tests.sensors.sps30_reference
+"""
+
+import random
+import time
+from typing import Optional, Sequence
+
+from weatherbox.sensors.sps30 import (
+    CRC8_INIT,
+    CRC8_POLYNOMIAL,
+    MASS_DENSITY_KEYS,
+    MEASURED_VALUES,
+    NBYTES_MEASURED_VALUES_FLOAT,
+    PARTICLE_COUNT_KEYS,
+    SIZE_FLOAT,
+    SPS30Data,
+    crc8,
+    decode_measured_values,
+)
+
+
+def bitwise_crc(data: Sequence[int]) -> int:
+    """The CRC computed bit by bit, as the table is built."""
+    crc = CRC8_INIT
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ CRC8_POLYNOMIAL if crc & 0x80 else crc << 1) & 0xFF
+    return crc
+
+
+def bitwise_float(bits: int) -> float:
+    """
+    A float rebuilt from its IEEE754 bits one mantissa bit at a time, as measured
+    values were decoded before, rounded to 3 decimals.
+    """
+    binary = "{:032b}".format(bits)
+    sign = int(binary[0])
+    exp = int(binary[1:9], 2) - 127
+
+    divider = 0
+    if exp < 0:
+        divider = abs(exp)
+        exp = 0
+
+    mantissa = binary[9:]
+    real = int(("1" + mantissa[:exp]), 2)
+    decimal = mantissa[exp:]
+
+    dec = 0.0
+    for i in range(len(decimal)):
+        dec += int(decimal[i]) / (2 ** (i + 1))
+
+    return round((((-1) ** sign * real) + dec) / pow(2, divider), 3)
+
+
+def bitwise_decode_measured_values(data: Sequence[int]) -> Optional[SPS30Data]:
+    """
+    Decode a measured values frame word by word with the bitwise CRC and float
+    conversion, for comparing against decode_measured_values.
+    """
+    values = []
+    for offset in range(0, NBYTES_MEASURED_VALUES_FLOAT, SIZE_FLOAT):
+        words = [data[offset : offset + 3], data[offset + 3 : offset + 6]]
+        if any(bitwise_crc(word[:2]) != word[2] for word in words):
+            return None
+
+        pm_data = list(words[0][:2]) + list(words[1][:2])
+        bits = pm_data[0] << 24 | pm_data[1] << 16 | pm_data[2] << 8 | pm_data[3]
+        values.append(bitwise_float(bits))
+
+    return SPS30Data(
+        mass_density=dict(zip(MASS_DENSITY_KEYS, values[:4])),
+        particle_count=dict(zip(PARTICLE_COUNT_KEYS, values[4:9])),
+        particle_size=values[9],
+    )
+
+
+def encode_measured_values(values: Sequence[float]) -> bytes:
+    """Encode ten floats as a measured values frame, as the sensor sends them."""
+    payload = MEASURED_VALUES.pack(*values)
+    frame = bytearray()
+    for i in range(0, len(payload), 2):
+        frame += payload[i : i + 2] + bytes([crc8(payload[i : i + 2])])
+    return bytes(frame)
+
+
+def benchmark(frames: int = 10000):
+    """Compare the CPU time of decoding measured values frames."""
+    frame = encode_measured_values(
+        [random.uniform(0, 100) for _ in range(MEASURED_VALUES.size // 4)]
+    )
+
+    for name, decode in [
+        ("struct", decode_measured_values),
+        ("bitwise", bitwise_decode_measured_values),
+    ]:
+        start = time.process_time()
+        for _ in range(frames):
+            decode(frame)
+        per_frame = (time.process_time() - start) / frames * 1_000_000
+        print(f"{name:>7}: {per_frame:7.1f} us CPU per frame")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+
+class FakeI2CDevice:
+    """In-memory bus, answering reads from per-address register contents."""
+
+    def __init__(self, registers):
+        self.registers = registers
+        self.pointers = {}
+        self.transfers = []
+        self.threads = set()
+        self.closed = False
+
+    def transfer(self, address, data, nbytes):
+        self.threads.add(threading.current_thread().name)
+        self.transfers.append((address, data, nbytes))
+        if data:
+            self.pointers[address] = data[:2]
+        return self.registers[address][self.pointers[address]][:nbytes]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def device():
+    return FakeI2CDevice({0x69: {b"\xd1\x00": bytes([2, 3, 0x0B])}})
+
+
+@pytest.mark.asyncio
+async def test_i2c_transfers_run_on_bus_thread(device):
+    from weatherbox.sensors.i2c import I2C, I2CBus
+
+    i2c = I2C(1, 0x69, I2CBus(1, device))
+
+    await i2c.write([0xD1, 0x00])
+    assert await i2c.read(3) == [2, 3, 0x0B]
+    assert await i2c.write_read([0xD1, 0x00], 2) == [2, 3]
+
+    assert device.transfers == [
+        (0x69, b"\xd1\x00", 0),
+        (0x69, b"", 3),
+        (0x69, b"\xd1\x00", 2),
+    ]
+    assert device.threads == {"i2c-1_0"}
+
+    i2c.close()
+    assert device.closed
+
+
+@pytest.mark.asyncio
+async def test_sps30_over_fake_bus(device, monkeypatch):
+    from weatherbox.sensors import i2c
+    from weatherbox.sensors.sps30 import SPS30
+
+    monkeypatch.setitem(i2c._buses, 1, i2c.I2CBus(1, device))
+    sps30 = SPS30(1)
+
+    assert await sps30.firmware_version() == "2.3"
+
+
+def test_shared_bus_closed_by_last_device(device, monkeypatch):
+    from weatherbox.sensors import i2c
+
+    monkeypatch.setitem(i2c._buses, 1, i2c.I2CBus(1, device))
+    first = i2c.I2C(1, 0x69)
+    second = i2c.I2C(1, 0x68)
+    assert first.transport is second.transport
+
+    first.close()
+    first.close()
+    assert not device.closed
+    assert i2c._buses[1] is second.transport
+
+    second.close()
+    assert device.closed
+    assert 1 not in i2c._buses
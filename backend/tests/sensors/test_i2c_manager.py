@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+
+async def _transaction(manager, owner, order, hold=0.0):
+    async with manager.acquire_bus(1, owner):
+        order.append(owner)
+        await asyncio.sleep(hold)
+
+
+@pytest.mark.asyncio
+async def test_waiting_transactions_by_priority():
+    from weatherbox.sensors.i2c_manager import I2CManager
+
+    manager = I2CManager()
+    order = []
+
+    first = asyncio.create_task(_transaction(manager, "BME688", order, 0.01))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.create_task(_transaction(manager, owner, order))
+        for owner in ["SPS30", "ENS160", "AS3935", "LTR390"]
+    ]
+    await asyncio.gather(first, *waiting)
+
+    assert order == ["BME688", "AS3935", "ENS160", "LTR390", "SPS30"]
+
+    stats = manager.stats()[1]
+    assert stats["busy"] is False
+    assert stats["wait_time"]["count"] == 5
+    assert stats["hold_time"]["count"] == 5
+    assert stats["transactions"]["SPS30"] == 1
+
+
+@pytest.mark.asyncio
+async def test_over_budget_sensor_waits_behind_others(monkeypatch):
+    from weatherbox.sensors import i2c_manager
+
+    monkeypatch.setitem(i2c_manager.BUDGETS, "BME688", 0.01)
+    manager = i2c_manager.I2CManager()
+    order = []
+
+    await _transaction(manager, "BME688", order, 0.02)
+    first = asyncio.create_task(_transaction(manager, "LTR390", order, 0.01))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.create_task(_transaction(manager, owner, order))
+        for owner in ["BME688", "SPS30"]
+    ]
+    await asyncio.gather(first, *waiting)
+
+    # Even the background SPS30 goes before a sensor over its budget
+    assert order == ["BME688", "LTR390", "SPS30", "BME688"]
+    assert manager.stats()[1]["over_budget"] == {"BME688": 1}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_skipped():
+    from weatherbox.sensors.i2c_manager import I2CManager
+
+    manager = I2CManager()
+    order = []
+
+    first = asyncio.create_task(_transaction(manager, "BME688", order, 0.01))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(_transaction(manager, "AS3935", order))
+    waiting = asyncio.create_task(_transaction(manager, "ENS160", order))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(first, waiting)
+
+    assert order == ["BME688", "ENS160"]
+    assert manager.stats()[1]["busy"] is False
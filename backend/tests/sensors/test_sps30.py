@@ -44,3 +44,130 @@ async def test_sps30_read_measurement():
     assert data["sensor_data"]["particle_count_unit"] == "#/cm3"
 
     await sps30.stop_measurement()
+
+
+# Measured values frame of typical indoor air, with the CRC after every word
+GOLDEN_FRAME = bytes.fromhex(
+    "40a5010e563440cba5c6a83440d6aaa7f05240d79b9db251"
+    "4230149eb8a7424da0d3f853424fc2c8b467424fc2d2f27c"
+    "424fc2d70a303f1b03645af2"
+)
+
+
+def test_sps30_decode_golden_frame():
+    from tests.sensors.sps30_reference import bitwise_decode_measured_values
+    from weatherbox.sensors.sps30 import decode_measured_values
+
+    data = decode_measured_values(GOLDEN_FRAME)
+
+    assert data == bitwise_decode_measured_values(GOLDEN_FRAME)
+    assert data.mass_density == {
+        "pm1.0": 5.158,
+        "pm2.5": 6.368,
+        "pm4.0": 6.708,
+        "pm10": 6.738,
+    }
+    assert data.particle_count["pm0.5"] == 44.155
+    assert data.particle_size == 0.607
+
+
+def test_sps30_decode_matches_bitwise():
+    import random
+
+    from tests.sensors.sps30_reference import (
+        bitwise_decode_measured_values,
+        encode_measured_values,
+    )
+    from weatherbox.sensors.sps30 import decode_measured_values
+
+    rng = random.Random(30)
+    for _ in range(1000):
+        frame = encode_measured_values([rng.uniform(0, 1000) for _ in range(10)])
+        assert decode_measured_values(frame) == bitwise_decode_measured_values(frame)
+
+    # Zero, as the sensor reports in clean air
+    frame = encode_measured_values([0.0] * 10)
+    assert decode_measured_values(frame) == bitwise_decode_measured_values(frame)
+    assert decode_measured_values(frame).particle_size == 0.0
+
+
+def test_sps30_decode_rejects_bad_crc():
+    from weatherbox.sensors.sps30 import CRC8_TABLE, crc8, decode_measured_values
+
+    # The example from the datasheet
+    assert crc8([0xBE, 0xEF]) == 0x92
+    assert len(set(CRC8_TABLE)) == 256
+
+    for offset in (2, 29, 59):
+        frame = bytearray(GOLDEN_FRAME)
+        frame[offset] ^= 0x01
+        assert decode_measured_values(frame) is None
+    assert decode_measured_values(GOLDEN_FRAME[:57]) is None
+
+
+def test_sps30_measurement_ring():
+    from weatherbox.sensors.sps30 import MeasurementRing
+
+    ring = MeasurementRing(3)
+    assert ring.latest() is None
+    assert ring.aggregate() is None
+
+    ring.append([1.0] * 10)
+    ring.append([2.0] * 9 + [4.0])
+    assert ring.latest() == [2.0] * 9 + [4.0]
+    assert ring.aggregate() == ([1.5] * 9 + [2.5], [2.0] * 9 + [4.0])
+    # Only samples added since the last aggregate are combined
+    assert ring.aggregate() is None
+
+    for value in range(5):
+        ring.append([float(value)] * 10)
+    assert len(ring) == 3
+    assert ring.overwritten == 2
+    assert ring.aggregate() == ([3.0] * 10, [4.0] * 10)
+    assert ring.latest() == [4.0] * 10
+
+
+@pytest.mark.asyncio
+async def test_sps30_read_times_out(monkeypatch):
+    import asyncio
+
+    from weatherbox.sensors import sps30 as sps30_module
+
+    monkeypatch.setattr(sps30_module, "I2C", lambda *args, **kwargs: None)
+    monkeypatch.setattr(sps30_module, "DATA_READY_TIMEOUT", 0)
+
+    sps30 = sps30_module.SPS30(1)
+    # Acquiring, but the sensor never becomes data ready
+    sps30.task = asyncio.get_running_loop().create_future()
+    with pytest.raises(TimeoutError):
+        await sps30.read()
+
+
+@pytest.mark.asyncio
+async def test_sps30_failed_initialization_stops_acquiring(monkeypatch):
+    import asyncio
+
+    from weatherbox.sensors import sps30 as sps30_module
+    from weatherbox.sensors.Sensor import SensorStatus
+
+    monkeypatch.setattr(sps30_module, "I2C", lambda *args, **kwargs: None)
+    monkeypatch.setattr(sps30_module, "DATA_READY_TIMEOUT", 0)
+
+    sps30 = sps30_module.SPS30(1)
+    task = asyncio.get_running_loop().create_future()
+
+    async def start_measurement():
+        sps30.task = task
+
+    async def respond():
+        return "ok"
+
+    sps30.firmware_version = sps30.product_type = respond
+    sps30.read_status_register = respond
+    sps30.start_measurement = start_measurement
+
+    # Acquiring, but the sensor never becomes data ready
+    assert await sps30.initialize() is False
+    assert sps30.status == SensorStatus.ERROR
+    assert task.cancelled()
+    assert sps30.task is None
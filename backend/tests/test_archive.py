@@ -0,0 +1,153 @@
+from array import array
+import os
+
+import pytest
+from sqlmodel import delete, func, select
+
+from weatherbox import archive as archive_module
+from weatherbox import downsampling, rollups
+from weatherbox.archive import Archive, query_raw, read_segment, write_segment
+from weatherbox.db import get_session
+from weatherbox.downsampling import query_buckets
+from weatherbox.models import ENS160, SPS30, to_millis
+
+# One sample every 10 minutes for two days, long enough ago to be archived
+TIMESTAMPS = [
+    f"2003-01-{day:02d}T{hour:02d}:{minute:02d}:00+00:00"
+    for day in (1, 2)
+    for hour in range(24)
+    for minute in range(0, 60, 10)
+]
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path))
+    monkeypatch.setattr(archive_module, "archive", archive)
+    monkeypatch.setattr(downsampling, "archive", archive)
+    monkeypatch.setattr(rollups, "archive", archive)
+    return archive
+
+
+@pytest.fixture
+def session():
+    with get_session() as session:
+        session.add_all(
+            ENS160(timestamp=timestamp, aqi=i % 5, tvoc=i, eco2=400.0)
+            for i, timestamp in enumerate(TIMESTAMPS)
+        )
+        session.commit()
+        yield session
+
+        session.exec(delete(ENS160).where(ENS160.timestamp < "2003-01-03"))
+        session.commit()
+
+
+def test_segment_round_trip(tmp_path):
+    path = str(tmp_path / "segment.seg")
+    columns = {
+        "id": array("q", [3, 4, 10]),
+        "timestamp": array("q", [1000, 2000, 2500]),
+        "value": array("d", [1.5, -2.0, 3.25]),
+    }
+    write_segment(path, columns)
+
+    assert read_segment(path) == columns
+    assert read_segment(path, ["value"]) == {"value": columns["value"]}
+
+
+def test_archive_old_rows(session, archive):
+    before = [
+        row.model_dump() for row in query_raw(session, ENS160, None, "2003-01-03")
+    ]
+
+    archive.archive_old_rows(session, 30)
+
+    hot_count = session.exec(
+        select(func.count(ENS160.id)).where(ENS160.timestamp < "2003-01-03")
+    ).one()
+    assert hot_count == 0
+    assert sorted(archive.days("ens160")) == ["2003-01-01", "2003-01-02"]
+    assert archive.first_timestamp("ens160") == "2003-01-01T00:00:00+00:00"
+
+    after = query_raw(session, ENS160, None, "2003-01-03")
+    assert [row.model_dump() for row in after] == before
+
+    start, end = "2003-01-01T12:00:00Z", "2003-01-02T00:00:00Z"
+    assert archive.count_rows(ENS160, start, end) == 73
+    assert len(query_raw(session, ENS160, start, end)) == 73
+
+
+def test_late_rows_merged_into_segment(session, archive):
+    archive.archive_old_rows(session, 30)
+
+    session.add(ENS160(timestamp="2003-01-01T00:05:00Z", aqi=1, tvoc=1, eco2=1))
+    session.commit()
+    archive.archive_old_rows(session, 30)
+
+    rows = archive.read_rows(ENS160, "2003-01-01", "2003-01-01T00:10:00Z")
+    assert [row.timestamp[11:19] for row in rows] == [
+        "00:00:00",
+        "00:05:00",
+        "00:10:00",
+    ]
+    assert archive.days("ens160")["2003-01-01"]["rows"] == 145
+
+
+def test_rows_stored_while_archiving_kept(session, archive):
+    day_start = to_millis("2003-01-01T00:00:00Z")
+    max_id = archive.write_day(session, ENS160, day_start)
+
+    late = ENS160(timestamp="2003-01-01T00:05:00Z", aqi=1, tvoc=1, eco2=1)
+    session.add(late)
+    session.commit()
+    archive.delete_day(session, ENS160, day_start, max_id)
+
+    remaining = session.exec(
+        select(ENS160).where(ENS160.timestamp < "2003-01-02")
+    ).all()
+    assert [row.id for row in remaining] == [late.id]
+
+
+def test_interrupted_archive_not_duplicated(session, archive):
+    before = [
+        row.model_dump() for row in query_raw(session, ENS160, None, "2003-01-03")
+    ]
+
+    # Stopped after writing the segment, before deleting the rows
+    archive.write_day(session, ENS160, to_millis("2003-01-01T00:00:00Z"))
+
+    after = query_raw(session, ENS160, None, "2003-01-03")
+    assert [row.model_dump() for row in after] == before
+
+
+def test_buckets_read_archive(session, archive):
+    start, end = "2003-01-01T00:00:00Z", "2003-01-01T00:50:00Z"
+    before = query_buckets(session, ENS160, start, end, 100)
+
+    archive.archive_old_rows(session, 30)
+
+    assert query_buckets(session, ENS160, start, end, 100) == before
+    assert sum(bucket["count"] for bucket in before) == 6
+
+
+def test_archive_keeps_null_values(archive):
+    values = dict(pm10=1, pm25=2, pm40=3, pm100=4, nc05=5, nc10=6, nc25=7, nc40=8)
+    values.update(nc100=9, typical_particle_size=0.5)
+    with get_session() as session:
+        # Stored before maximums were, then after
+        session.add(SPS30(timestamp="2003-01-01T00:00:00Z", **values))
+        session.add(SPS30(timestamp="2003-01-01T00:01:00Z", **values, pm25_max=20))
+        session.commit()
+        archive.archive_old_rows(session, 30)
+
+    rows = archive.read_rows(SPS30, None, "2003-01-02")
+    assert [row.pm25_max for row in rows] == [None, 20]
+    assert [row.pm25 for row in rows] == [2, 2]
+
+    # Segments written before the maximums existed read them as null
+    path = os.path.join(archive.directory, archive.days("sps30")["2003-01-01"]["file"])
+    columns = read_segment(path)
+    write_segment(path, {k: v for k, v in columns.items() if not k.endswith("_max")})
+    rows = archive.read_rows(SPS30, None, None)
+    assert [row.pm25_max for row in rows] == [None, None]
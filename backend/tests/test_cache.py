@@ -0,0 +1,64 @@
+from sqlmodel import delete
+
+from weatherbox.cache import ResponseCache, sensor_data_cache
+from weatherbox.db import SampleBuffer, get_session
+from weatherbox.models import LTR390, SensorRollup, to_millis
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_size=2)
+
+    for end in (1, 2):
+        _, generation = cache.get((end, None))
+        cache.put((end, None), f"response {end}", generation)
+    cache.get((1, None))
+    _, generation = cache.get((3, None))
+    cache.put((3, None), "response 3", generation)
+
+    assert cache.get((1, None))[0] == "response 1"
+    assert cache.get((2, None))[0] is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_keeps_closed_ranges():
+    cache = ResponseCache(max_size=10)
+    for end in (None, 100, 200):
+        cache.put((end, "query"), end, 0)
+
+    cache.invalidate(150)
+
+    assert cache.get((None, "query"))[0] is None
+    assert cache.get((100, "query"))[0] == 100
+    assert cache.get((200, "query"))[0] is None
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_put_dropped_after_invalidation():
+    cache = ResponseCache(max_size=10)
+    _, generation = cache.get((None, "query"))
+    cache.invalidate(0)
+    cache.put((None, "query"), "stale", generation)
+
+    assert cache.get((None, "query"))[0] is None
+
+
+def test_flush_invalidates_sensor_data_cache():
+    timestamp = "2005-01-01T00:00:00+00:00"
+    before, after = to_millis("2004-12-31"), to_millis("2005-01-02")
+    for end in (before, after):
+        sensor_data_cache.put(
+            (end, "test"), end, sensor_data_cache.get((end, "test"))[1]
+        )
+
+    buffer = SampleBuffer(max_size=10, max_age=3600)
+    buffer.add(LTR390(timestamp=timestamp, uvs=1, light=1))
+    buffer.flush()
+
+    try:
+        assert sensor_data_cache.get((before, "test"))[0] == before
+        assert sensor_data_cache.get((after, "test"))[0] is None
+    finally:
+        with get_session() as session:
+            session.exec(delete(LTR390).where(LTR390.timestamp < "2005-01-02"))
+            session.exec(delete(SensorRollup).where(SensorRollup.sensor == "ltr390"))
+            session.commit()
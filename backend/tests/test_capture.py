@@ -4,8 +4,7 @@ from sqlmodel import select
 from weatherbox.db import get_session
 from weatherbox.timelapse import capture
 from weatherbox.models import TimelapseImage
-
-IMAGE_DIR = "/home/jordan/code/weatherbox/images"
+from weatherbox.storage import image_storage
 
 
 def test_capture():
@@ -18,7 +17,7 @@ def test_capture():
     ).all()
     assert len(images) == 1
 
-    os.remove(f"{IMAGE_DIR}/{name}")
+    os.remove(image_storage.path_for(name))
 
     session.delete(images[0])
     session.commit()
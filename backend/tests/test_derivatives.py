@@ -0,0 +1,64 @@
+import asyncio
+import os
+
+from PIL import Image
+import pytest
+
+from weatherbox.derivatives import DerivativeCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "2025-01-01T00:00:00+00:00.jpg"
+    Image.new("RGB", (2592, 1944), (30, 120, 200)).save(path)
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_derivative_rendered_once(tmp_path, source):
+    cache = DerivativeCache(str(tmp_path / "derivatives"), max_bytes=10**6)
+
+    results = await asyncio.gather(
+        *(cache.get(source, "small", "jpeg", 80) for _ in range(3))
+    )
+    path, stat = await cache.get(source, "small", "jpeg", 80)
+
+    assert {result[0] for result in results} == {path}
+    assert os.listdir(tmp_path / "derivatives") == [os.path.basename(path)]
+    with Image.open(path) as img:
+        assert img.size == (320, 240)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["bytes"] == stat.st_size
+
+    # Indexed again after a restart
+    assert DerivativeCache(str(tmp_path / "derivatives"), 10**6).stats()["files"] == 1
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_evicted(tmp_path, source):
+    cache = DerivativeCache(str(tmp_path / "derivatives"), max_bytes=10**6)
+
+    small, _ = await cache.get(source, "small", "png", 80)
+    medium, _ = await cache.get(source, "medium", "png", 80)
+    large, _ = await cache.get(source, "large", "png", 80)
+    await cache.get(source, "small", "png", 80)
+
+    # Room for all but one, re-adding the largest makes the least recently used go
+    cache.max_bytes = cache.stats()["bytes"] - 1
+    cache.add(os.path.basename(large), os.path.getsize(large))
+
+    assert os.path.exists(small)
+    assert not os.path.exists(medium)
+    assert os.path.exists(large)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_render_in_background(tmp_path, source):
+    cache = DerivativeCache(str(tmp_path / "derivatives"), max_bytes=10**6)
+
+    name, future = cache.render_in_background(source, "medium", "jpeg", 80)
+    file_size = future.result(timeout=30)
+
+    assert name == "2025-01-01T00:00:00+00:00.medium.q80.jpeg"
+    assert os.path.getsize(cache.path_for(name)) == file_size
+    assert cache.stats()["files"] == 1
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+import pytest
+from sqlmodel import delete
+
+from weatherbox.db import SampleBuffer, get_session
+from weatherbox.downsampling import lttb, query_buckets, query_lttb
+from weatherbox.models import SPS30, SensorRollup
+
+# One sample every 30 seconds for two hours, with a single PM2.5 spike
+TIMESTAMPS = [
+    f"2002-01-01T{hour:02d}:{minute:02d}:{second:02d}+00:00"
+    for hour in range(2)
+    for minute in range(60)
+    for second in (0, 30)
+]
+SPIKE = 97
+FIELDS = [
+    "pm10",
+    "pm25",
+    "pm40",
+    "pm100",
+    "nc05",
+    "nc10",
+    "nc25",
+    "nc40",
+    "nc100",
+    "typical_particle_size",
+]
+
+
+def _sample(i, timestamp):
+    values = {field: 1.0 for field in FIELDS}
+    values["pm25"] = 500.0 if i == SPIKE else 10.0
+    return SPS30(timestamp=timestamp, **values)
+
+
+@pytest.fixture
+def session():
+    buffer = SampleBuffer(max_size=len(TIMESTAMPS), max_age=3600)
+    for i, timestamp in enumerate(TIMESTAMPS):
+        buffer.add(_sample(i, timestamp))
+
+    with get_session() as session:
+        yield session
+
+        session.exec(delete(SPS30).where(SPS30.timestamp < "2002-01-02"))
+        session.exec(delete(SensorRollup).where(SensorRollup.sensor == "sps30"))
+        session.commit()
+
+
+@pytest.mark.parametrize("limit", [4, 24, 1000])
+def test_buckets_keep_spike(session, limit):
+    buckets = query_buckets(session, SPS30, TIMESTAMPS[0], TIMESTAMPS[-1], limit)
+
+    assert len(buckets) == limit
+    assert sum(bucket["count"] for bucket in buckets) == len(TIMESTAMPS)
+    assert max(bucket["max"].get("pm25", 0) for bucket in buckets) == 500.0
+    assert min(bucket["min"].get("pm25", 1e9) for bucket in buckets) == 10.0
+
+
+@pytest.mark.parametrize(
+    "start,end,limit",
+    [
+        # Buckets not a whole number of minutes wide
+        ("2002-01-01T00:00:30+00:00", "2002-01-01T01:59:30+00:00", 7),
+        # Quarter-hour buckets from a quarter hour, and from a minute
+        ("2002-01-01T00:00:00+00:00", "2002-01-01T02:00:00+00:00", 8),
+        ("2002-01-01T00:07:00+00:00", "2002-01-01T01:52:10+00:00", 7),
+    ],
+)
+def test_bucket_counts_match_raw_rows(session, start, end, limit):
+    buckets = query_buckets(session, SPS30, start, end, limit)
+
+    start_seconds, end_seconds = _seconds(start), _seconds(end)
+    width = (end_seconds - start_seconds) / limit
+    expected = [0] * limit
+    for timestamp in TIMESTAMPS:
+        seconds = _seconds(timestamp)
+        if start_seconds <= seconds <= end_seconds:
+            expected[min(int((seconds - start_seconds) / width), limit - 1)] += 1
+
+    assert [bucket["count"] for bucket in buckets] == expected
+
+
+def _seconds(timestamp):
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+@pytest.mark.parametrize("limit,spike", [(30, 500.0), (20, 255.0)])
+def test_lttb_keeps_spike(session, limit, spike):
+    # 30 points picks from the raw rows, 20 from the 1-minute rollup means
+    rows = query_lttb(session, SPS30, TIMESTAMPS[0], TIMESTAMPS[-1], limit)
+
+    assert len(rows) == limit
+    assert max(row.pm25 for row in rows) == spike
+
+
+def test_lttb_small_thresholds():
+    times = [float(i) for i in range(10)]
+    values = [[float(i) for i in range(10)]]
+
+    assert lttb(times, values, 20) == list(range(10))
+    assert lttb(times, values, 2) == [0, 5]
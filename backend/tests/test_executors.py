@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from weatherbox import executors
+from weatherbox.executors import LoopLagMonitor, run_db
+
+
+@pytest.mark.asyncio
+async def test_run_db_runs_off_loop():
+    thread_name = await run_db(lambda: threading.current_thread().name)
+    assert thread_name.startswith("db")
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_detects_blocking_call():
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.05)
+
+    time.sleep(0.2)  # Block the loop
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    assert monitor.stats()["max_ms"] >= 150
+
+
+def test_image_executor_created_once(monkeypatch):
+    created = []
+
+    class SlowPool:
+        def __init__(self, max_workers):
+            time.sleep(0.05)  # Wide enough for every caller to race
+            created.append(self)
+
+    monkeypatch.setattr(executors, "ProcessPoolExecutor", SlowPool)
+    monkeypatch.setattr(executors, "_image_executor", None)
+
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        pools = list(callers.map(lambda _: executors.get_image_executor(), range(4)))
+
+    assert len(created) == 1
+    assert all(pool is created[0] for pool in pools)
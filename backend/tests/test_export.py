@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+
+import pytest
+from sqlmodel import delete
+
+from weatherbox import export
+from weatherbox.archive import Archive
+from weatherbox.db import get_session
+from weatherbox.export import export_chunks
+from weatherbox.models import ENS160, to_millis
+
+TIMESTAMPS = [f"2004-01-{day:02d}T12:00:00+00:00" for day in range(1, 31)]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 7)
+    monkeypatch.setattr(export, "archive", Archive(str(tmp_path)))
+
+    with get_session() as session:
+        session.add_all(
+            ENS160(timestamp=timestamp, aqi=1, tvoc=i, eco2=400.0)
+            for i, timestamp in enumerate(TIMESTAMPS)
+        )
+        session.commit()
+        yield session
+
+        session.exec(delete(ENS160).where(ENS160.timestamp < "2004-02-01"))
+        session.commit()
+
+
+def test_export_ndjson(session):
+    export.archive.archive_old_rows(session, 30)
+    session.add(ENS160(timestamp="2004-01-31T00:00:00Z", aqi=1, tvoc=30, eco2=400.0))
+    session.commit()
+
+    chunks = list(export_chunks(ENS160, "2004-01-02", "2004-01-31T23:00:00Z", "ndjson"))
+    rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+
+    assert len(chunks) == 5
+    assert [row["tvoc"] for row in rows] == list(range(1, 31))
+    assert rows[0]["timestamp"] == "2004-01-02T12:00:00+00:00"
+    assert set(rows[0]) == {"id", "timestamp", "aqi", "tvoc", "eco2"}
+
+
+def test_export_skips_rows_left_by_interrupted_archive(session):
+    export.archive.write_day(session, ENS160, to_millis("2004-01-01T00:00:00Z"))
+
+    text = "".join(export_chunks(ENS160, None, "2004-01-03", "csv"))
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    assert [row["timestamp"] for row in rows] == TIMESTAMPS[:2]
+
+
+def test_export_csv(session):
+    text = "".join(export_chunks(ENS160, None, "2004-01-03", "csv"))
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    assert [row["timestamp"] for row in rows] == TIMESTAMPS[:2]
+    assert float(rows[1]["tvoc"]) == 1
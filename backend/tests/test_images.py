@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from sqlmodel import delete
+
+from weatherbox.cache import image_count_cache
+from weatherbox.db import get_session
+from weatherbox.models import TimelapseImage
+from weatherbox.renders import decimate, select_frames
+from weatherbox.routes.images import get_images, router
+
+START = datetime(2004, 1, 1, tzinfo=timezone.utc)
+END = START + timedelta(days=1)
+
+app = FastAPI()
+app.include_router(router, prefix="/images")
+client = TestClient(app)
+
+
+def _add_images(minutes):
+    with get_session() as session:
+        for minute in minutes:
+            timestamp = (START + timedelta(minutes=minute)).isoformat()
+            session.add(TimelapseImage(timestamp=timestamp, file_name=f"{minute}.jpg"))
+        session.commit()
+
+
+@pytest.fixture
+def clean_images():
+    yield
+
+    with get_session() as session:
+        session.exec(
+            delete(TimelapseImage).where(TimelapseImage.timestamp < END.isoformat())
+        )
+        session.commit()
+    image_count_cache.invalidate(0)
+
+
+@pytest.fixture
+def images(clean_images):
+    # Two images share a timestamp, so pages must break ties by ID
+    _add_images([0, 1, 2, 2, 3, 4, 5])
+
+
+async def _list(**params):
+    params = {"page": 1, "limit": 3, "cursor": None, "sample": False, **params}
+    return await get_images(start_date=START, end_date=END, **params)
+
+
+@pytest.mark.asyncio
+async def test_cursor_pages_match_numbered_pages(images):
+    numbered = [await _list(page=page) for page in (1, 2, 3)]
+
+    cursor_pages = [await _list()]
+    while cursor_pages[-1]["next"] is not None:
+        cursor_pages.append(await _list(cursor=cursor_pages[-1]["next"]))
+
+    def ids(pages):
+        return [image.id for page in pages for image in page["images"]]
+
+    assert ids(cursor_pages) == ids(numbered)
+    assert len(set(ids(cursor_pages))) == 7
+    assert [image.file_name for image in numbered[0]["images"]] == [
+        "0.jpg",
+        "1.jpg",
+        "2.jpg",
+    ]
+    assert cursor_pages[1]["page"] is None
+    assert cursor_pages[1]["total_count"] == 7
+
+
+@pytest.mark.asyncio
+async def test_total_count_cached_until_capture(images):
+    assert (await _list())["total_count"] == 7
+    hits = image_count_cache.stats()["hits"]
+
+    assert (await _list(page=2))["total_count"] == 7
+    assert image_count_cache.stats()["hits"] == hits + 1
+
+    image_count_cache.invalidate(int(START.timestamp() * 1000))
+    assert image_count_cache.stats()["size"] == 0
+
+
+def test_invalid_cursor(images):
+    response = client.get("/images", params={"cursor": "not a cursor!"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.asyncio
+async def test_sampled_images_spread_over_range(clean_images):
+    _add_images(range(60))
+
+    response = await _list(limit=5, sample=True)
+    sparse = await _list(limit=100, sample=True)
+
+    assert [image.file_name for image in response["images"]] == [
+        "0.jpg",
+        "15.jpg",
+        "29.jpg",
+        "44.jpg",
+        "59.jpg",
+    ]
+    assert response["total_count"] == 60
+    # More times than images returns each image once
+    assert len(sparse["images"]) == 60
+
+
+def test_timelapse_not_found(clean_images):
+    response = client.post(
+        "/images/timelapse",
+        params={"start_date": START.isoformat(), "end_date": END.isoformat()},
+    )
+    assert response.status_code == 404
+    assert response.json() == {"detail": "No images in range"}
+
+    assert client.get("/images/timelapse/0123456789abcdef").status_code == 404
+    assert client.get("/images/timelapse/0123456789abcdef/video").status_code == 404
+
+
+def test_image_file_not_found(clean_images):
+    # The row exists but its file was never stored
+    _add_images([0])
+    listing = client.get(
+        "/images", params={"start_date": START.isoformat(), "end_date": END.isoformat()}
+    )
+    image_id = listing.json()["images"][0]["id"]
+
+    response = client.get(f"/images/{image_id}")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Image file not found"}
+
+
+def test_select_frames_matches_decimate(clean_images):
+    _add_images(range(0, 100, 3))
+    names = [f"{minute}.jpg" for minute in range(0, 100, 3)]
+
+    for max_frames in (1, 7, 10, 33, 34, 50):
+        assert select_frames(START, END, max_frames) == decimate(names, max_frames)
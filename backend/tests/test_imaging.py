@@ -0,0 +1,27 @@
+import io
+
+from PIL import Image
+import pytest
+
+from weatherbox.imaging import SIZES, resize_and_encode
+
+
+@pytest.mark.parametrize(
+    "source_size, size, expected",
+    [
+        ((2592, 1944), "small", (320, 240)),
+        ((2592, 1944), "large", (1280, 960)),
+        ((1920, 1080), "medium", (640, 360)),
+        ((1080, 1920), "small", (135, 240)),
+        ((200, 100), "small", (200, 100)),
+    ],
+)
+def test_resize_keeps_aspect_ratio(tmp_path, source_size, size, expected):
+    path = tmp_path / "still.jpg"
+    Image.new("RGB", source_size, (200, 80, 20)).save(path)
+
+    content = resize_and_encode(str(path), SIZES[size], "jpeg", 80)
+
+    with Image.open(io.BytesIO(content)) as img:
+        assert img.size == expected
+        assert img.format == "JPEG"
@@ -0,0 +1,77 @@
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from weatherbox.migrations import migrate
+from weatherbox.models import ENS160, SPS30, TimelapseImage
+
+
+def test_migrate_iso_timestamps(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'weatherbox-old.db'}")
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE ens160 (id INTEGER PRIMARY KEY, timestamp VARCHAR NOT NULL,"
+            " aqi FLOAT NOT NULL, tvoc FLOAT NOT NULL, eco2 FLOAT NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_ens160_timestamp ON ens160 (timestamp)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO ens160 VALUES"
+            " (1, '2025-06-02T23:49:43.123456+00:00', 1, 2, 3),"
+            " (2, '2025-06-03T01:49:43.5+02:00', 4, 5, 6)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE sensorrollup (id INTEGER PRIMARY KEY, sensor VARCHAR)"
+        )
+
+    migrate(engine)
+
+    with engine.connect() as connection:
+        column_types = {
+            row[1]: row[2]
+            for row in connection.exec_driver_sql("PRAGMA table_info(ens160)")
+        }
+        assert column_types["timestamp"] == "INTEGER"
+
+        rollup_columns = {
+            row[1]
+            for row in connection.exec_driver_sql("PRAGMA table_info(sensorrollup)")
+        }
+        assert "id" not in rollup_columns
+
+    with Session(engine) as session:
+        rows = session.exec(select(ENS160).order_by(ENS160.id)).all()
+        assert [row.timestamp for row in rows] == [
+            "2025-06-02T23:49:43.123000+00:00",
+            "2025-06-02T23:49:43.500000+00:00",
+        ]
+        assert rows[1].eco2 == 6
+
+        # Z and +00:00 bounds now filter the same
+        query = select(ENS160).where(ENS160.timestamp >= "2025-06-02T23:49:43.2Z")
+        assert [row.id for row in session.exec(query)] == [2]
+        assert session.exec(select(TimelapseImage)).all() == []
+
+
+def test_migrate_adds_new_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'weatherbox-old.db'}")
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE sps30 (id INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL,"
+            " pm10 FLOAT NOT NULL, pm25 FLOAT NOT NULL, pm40 FLOAT NOT NULL,"
+            " pm100 FLOAT NOT NULL, nc05 FLOAT NOT NULL, nc10 FLOAT NOT NULL,"
+            " nc25 FLOAT NOT NULL, nc40 FLOAT NOT NULL, nc100 FLOAT NOT NULL,"
+            " typical_particle_size FLOAT NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO sps30 VALUES (1, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 0.5)"
+        )
+
+    migrate(engine)
+
+    with Session(engine) as session:
+        sps30 = session.get(SPS30, 1)
+        assert sps30.pm25 == 2
+        assert sps30.pm25_max is None
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import delete, func, select
+
+from weatherbox.db import get_read_session, get_session
+from weatherbox.executors import run_read
+from weatherbox.models import TimelapseImage
+
+
+def test_database_uses_wal():
+    with get_read_session() as session:
+        journal_mode = session.connection().execute(text("PRAGMA journal_mode"))
+        assert journal_mode.scalar() == "wal"
+
+
+def test_read_session_is_read_only():
+    with get_read_session() as session:
+        session.add(TimelapseImage(timestamp="2003-01-01", file_name="read.jpg"))
+        with pytest.raises(OperationalError):
+            session.commit()
+
+
+def _count_images(file_name):
+    with get_read_session() as session:
+        return session.exec(
+            select(func.count(TimelapseImage.id)).where(
+                TimelapseImage.file_name == file_name
+            )
+        ).one()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_see_committed_rows():
+    with get_session() as session:
+        session.add(TimelapseImage(timestamp="2003-01-01", file_name="pool.jpg"))
+        session.commit()
+
+        counts = await asyncio.gather(
+            *(run_read(_count_images, "pool.jpg") for _ in range(10))
+        )
+        assert counts == [1] * 10
+
+        session.exec(
+            delete(TimelapseImage).where(TimelapseImage.file_name == "pool.jpg")
+        )
+        session.commit()
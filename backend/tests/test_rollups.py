@@ -0,0 +1,137 @@
+import pytest
+from sqlmodel import delete, select
+
+from weatherbox.db import SampleBuffer, get_session
+from weatherbox.models import LTR390, SPS30, SensorRollup
+from weatherbox.rollups import (
+    RESOLUTION_STEP,
+    backfill_rollups,
+    choose_resolution,
+    query_rollups,
+)
+
+# One sample every 30 seconds for two hours, well before any real data
+TIMESTAMPS = [
+    f"2001-01-01T{hour:02d}:{minute:02d}:{second:02d}+00:00"
+    for hour in range(2)
+    for minute in range(60)
+    for second in (0, 30)
+]
+
+
+@pytest.fixture
+def session():
+    with get_session() as session:
+        yield session
+
+        session.exec(delete(LTR390).where(LTR390.timestamp < "2001-01-02"))
+        session.exec(delete(SensorRollup).where(SensorRollup.sensor == "ltr390"))
+        session.commit()
+
+
+def _store_samples():
+    buffer = SampleBuffer(max_size=len(TIMESTAMPS), max_age=3600)
+    for i, timestamp in enumerate(TIMESTAMPS):
+        buffer.add(LTR390(timestamp=timestamp, uvs=i, light=1.0))
+
+
+def _rollups(session):
+    return {
+        (rollup.resolution, rollup.bucket, rollup.field): (
+            rollup.count,
+            rollup.min_value,
+            rollup.max_value,
+            rollup.sum_value,
+        )
+        for rollup in session.exec(
+            select(SensorRollup).where(SensorRollup.sensor == "ltr390")
+        )
+    }
+
+
+def test_rollups_updated_on_flush(session):
+    _store_samples()
+
+    rollups = _rollups(session)
+
+    assert rollups[(60, "2001-01-01T00:00:00+00:00", "uvs")] == (2, 0, 1, 1)
+    assert rollups[(3600, "2001-01-01T01:00:00+00:00", "uvs")] == (120, 120, 239, 21540)
+    assert rollups[(86400, "2001-01-01T00:00:00+00:00", "light")] == (240, 1, 1, 240)
+
+
+def test_backfill_matches_incremental_rollups(session):
+    _store_samples()
+    incremental = _rollups(session)
+
+    session.exec(delete(SensorRollup).where(SensorRollup.sensor == "ltr390"))
+    session.commit()
+    backfill_rollups(session)
+
+    assert _rollups(session) == incremental
+
+
+def test_choose_resolution(session):
+    _store_samples()
+    start, end = TIMESTAMPS[0], TIMESTAMPS[-1]
+
+    assert choose_resolution(session, LTR390, start, end, 1000) is None
+    assert choose_resolution(session, LTR390, start, end, 200) == 60
+    assert choose_resolution(session, LTR390, start, end, 10) == 900
+    assert choose_resolution(session, LTR390, start, end, 2) == 3600
+
+    rows = query_rollups(session, LTR390, 3600, start, end, 2)
+    assert [row.timestamp for row in rows] == [
+        "2001-01-01T00:00:00+00:00",
+        "2001-01-01T01:00:00+00:00",
+    ]
+    assert rows[0].uvs == pytest.approx(59.5)
+
+    # Adjacent buckets are merged weighted by their counts
+    merged = query_rollups(session, LTR390, 900, start, end, 2)
+    assert [row.timestamp for row in merged] == [row.timestamp for row in rows]
+    assert merged[0].uvs == pytest.approx(59.5)
+
+
+def test_rollup_query_fills_limit(session):
+    # One sample every 30 seconds for a whole day
+    buffer = SampleBuffer(max_size=1000, max_age=3600)
+    for i in range(24 * 60 * 2):
+        hours, seconds = divmod(i * 30, 3600)
+        timestamp = (
+            f"2001-01-01T{hours:02d}:{seconds // 60:02d}:{seconds % 60:02d}+00:00"
+        )
+        buffer.add(LTR390(timestamp=timestamp, uvs=i, light=1.0))
+    buffer.flush()
+
+    start, end = "2001-01-01T00:00:00+00:00", "2001-01-01T23:59:30+00:00"
+    for limit in (1000, 100):
+        resolution = choose_resolution(
+            session, LTR390, start, end, limit, RESOLUTION_STEP
+        )
+        rows = query_rollups(session, LTR390, resolution, start, end, limit)
+        assert limit * 0.9 <= len(rows) <= limit
+
+
+def test_rollups_skip_null_values(session):
+    values = dict(pm10=1, pm25=2, pm40=3, pm100=4, nc05=5, nc10=6, nc25=7, nc40=8)
+    values.update(nc100=9, typical_particle_size=0.5)
+    buffer = SampleBuffer(max_size=100, max_age=3600)
+    buffer.add(SPS30(timestamp=TIMESTAMPS[0], **values))
+    buffer.add(SPS30(timestamp=TIMESTAMPS[1], **values, pm25_max=20))
+    assert buffer.flush() == 2
+
+    rollups = {
+        rollup.field: rollup.count
+        for rollup in session.exec(
+            select(SensorRollup).where(
+                SensorRollup.sensor == "sps30", SensorRollup.resolution == 3600
+            )
+        )
+    }
+    assert rollups["pm25"] == 2
+    assert rollups["pm25_max"] == 1
+    assert "pm10_max" not in rollups
+
+    session.exec(delete(SPS30).where(SPS30.timestamp < "2001-01-02"))
+    session.exec(delete(SensorRollup).where(SensorRollup.sensor == "sps30"))
+    session.commit()
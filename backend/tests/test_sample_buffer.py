@@ -0,0 +1,97 @@
+from sqlmodel import delete, select
+
+from weatherbox.db import SampleBuffer, get_session
+from weatherbox.models import ENS160, SensorRollup
+
+TIMESTAMP = "2000-01-01T00:00:00+00:00"
+
+
+def _rows(session):
+    return session.exec(select(ENS160).where(ENS160.timestamp == TIMESTAMP)).all()
+
+
+def _sample():
+    return ENS160(timestamp=TIMESTAMP, aqi=1, tvoc=2, eco2=3)
+
+
+def _delete_rows(session):
+    session.exec(delete(ENS160).where(ENS160.timestamp == TIMESTAMP))
+    session.exec(delete(SensorRollup).where(SensorRollup.sensor == "ens160"))
+    session.commit()
+
+
+def test_sample_buffer_flushes_on_size():
+    buffer = SampleBuffer(max_size=3, max_age=3600)
+
+    with get_session() as session:
+        buffer.add(_sample())
+        buffer.add(_sample())
+        assert len(buffer) == 2
+        assert len(_rows(session)) == 0
+
+        buffer.add(_sample())
+        assert len(buffer) == 0
+
+        assert len(_rows(session)) == 3
+
+        _delete_rows(session)
+
+
+def test_sample_buffer_flushes_on_age():
+    buffer = SampleBuffer(max_size=100, max_age=0)
+
+    with get_session() as session:
+        buffer.add(_sample())
+        assert len(buffer) == 0
+
+        assert len(_rows(session)) == 1
+
+        _delete_rows(session)
+
+
+def test_sample_buffer_forced_flush():
+    buffer = SampleBuffer(max_size=100, max_age=3600)
+
+    assert buffer.flush() == 0
+
+    buffer.add(_sample())
+    buffer.add(_sample())
+    assert buffer.flush() == 2
+    assert len(buffer) == 0
+
+    with get_session() as session:
+        _delete_rows(session)
+
+
+def test_sample_buffer_isolates_failing_row():
+    buffer = SampleBuffer(max_size=100, max_age=3600, max_attempts=2)
+
+    buffer.add(_sample())
+    # Breaks the NOT NULL constraint on every attempt
+    buffer.add(ENS160(timestamp=TIMESTAMP, aqi=None, tvoc=2, eco2=3))
+    buffer.add(_sample())
+
+    assert buffer.flush() == 2
+    assert len(buffer) == 1
+
+    buffer.add(_sample())
+    assert buffer.flush() == 1
+    assert len(buffer) == 0
+    assert buffer.dropped == 1
+
+    with get_session() as session:
+        assert len(_rows(session)) == 3
+        _delete_rows(session)
+
+
+def test_sample_buffer_drops_oldest_when_full():
+    buffer = SampleBuffer(max_size=100, max_age=3600, max_pending=2)
+
+    first = _sample()
+    buffer.add(first)
+    buffer.add(_sample())
+    buffer.add(_sample())
+
+    assert len(buffer) == 2
+    assert buffer.dropped == 1
+    assert all(sample is not first for sample, _ in buffer._pending)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from weatherbox.sensors.Sensor import Sensor, SensorStatus
+
+
+class FakeSensor(Sensor):
+    """A sensor whose initialization only finishes once released."""
+
+    def __init__(self, name, i2c_bus, fail=False):
+        super().__init__(name)
+        self.i2c_bus = i2c_bus
+        self.fail = fail
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def initialize(self) -> bool:
+        self.started.set()
+        await self.release.wait()
+        if self.fail:
+            raise OSError("No device at address")
+        return await super().initialize()
+
+    async def read(self):
+        pass
+
+    async def read_and_store(self):
+        pass
+
+
+async def _until(condition):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), 5)
+
+
+@pytest.mark.asyncio
+async def test_buses_initialized_concurrently():
+    # Imported here, as importing the module creates the real sensors
+    from weatherbox.sensor_manager import SensorManager
+
+    a, b, c, d = [
+        FakeSensor("A", 0),
+        FakeSensor("B", 1),
+        FakeSensor("C", 1),
+        FakeSensor("D", 0, fail=True),
+    ]
+    manager = SensorManager([a, b, c, d])
+    ready = []
+    initialization = asyncio.create_task(
+        manager.initialize_all_sensors(on_ready=ready.append)
+    )
+
+    # Different buses start together, the same bus one after another
+    await _until(lambda: a.started.is_set() and b.started.is_set())
+    assert not c.started.is_set() and not d.started.is_set()
+
+    b.release.set()
+    await _until(c.started.is_set)
+    assert ready == [b]
+    assert not d.started.is_set()
+
+    for sensor in (a, c, d):
+        sensor.release.set()
+    await asyncio.wait_for(initialization, 5)
+
+    assert sorted(sensor.name for sensor in ready) == ["A", "B", "C"]
+    assert manager.get_sensor_status()["D"] == "No device at address"
+    assert manager.is_initialization_complete()
+
+
+@pytest.mark.asyncio
+async def test_slow_sensor_holds_its_bus(monkeypatch):
+    from weatherbox import sensor_manager as sensor_manager_module
+    from weatherbox.sensor_manager import SensorManager
+
+    monkeypatch.setattr(sensor_manager_module, "SENSOR_INIT_TIMEOUT", 0.01)
+    slow, fast = FakeSensor("Slow", 1), FakeSensor("Fast", 1)
+    manager = SensorManager([slow, fast])
+    ready = []
+    initialization = asyncio.create_task(
+        manager.initialize_all_sensors(on_ready=ready.append)
+    )
+
+    await _until(lambda: slow.status == SensorStatus.WARMING_UP)
+    assert not manager.is_initialization_complete()
+    # The next sensor on the bus waits for the slow one however long it takes
+    assert not fast.started.is_set()
+
+    slow.release.set()
+    fast.release.set()
+    await asyncio.wait_for(initialization, 5)
+
+    assert ready == [slow, fast]
+    assert manager.is_initialization_complete()
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from weatherbox.storage import ImageStorage
+
+
+def _write(path):
+    with open(path, "wb") as file:
+        file.write(b"image")
+
+
+def test_images_sharded_by_utc_date(tmp_path):
+    storage = ImageStorage(str(tmp_path))
+
+    path = storage.save("2025-03-04T23:30:00-02:00.jpg", _write)
+
+    assert path == str(tmp_path / "2025/03/05/2025-03-04T23:30:00-02:00.jpg")
+    assert storage.find("2025-03-04T23:30:00-02:00.jpg") == path
+    assert os.listdir(tmp_path / "2025/03/05") == ["2025-03-04T23:30:00-02:00.jpg"]
+    assert storage.find("2025-03-05T00:00:00+00:00.jpg") is None
+
+
+def test_failed_write_leaves_nothing(tmp_path):
+    storage = ImageStorage(str(tmp_path))
+
+    def fail(path):
+        _write(path)
+        raise OSError("Camera failed")
+
+    with pytest.raises(OSError):
+        storage.save("2025-03-04T00:00:00+00:00.jpg", fail)
+
+    assert os.listdir(tmp_path / "2025/03/04") == []
+
+
+def test_migrate_flat(tmp_path):
+    storage = ImageStorage(str(tmp_path))
+    names = ["2025-03-04T00:00:00+00:00.jpg", "2025-04-01T12:00:00+00:00.jpg"]
+    for name in names + ["notes.txt"]:
+        _write(tmp_path / name)
+
+    # Flat images are still found before migrating
+    assert storage.find(names[0]) == str(tmp_path / names[0])
+
+    assert storage.migrate_flat(dry_run=True) == 2
+    assert storage.migrate_flat() == 2
+    assert storage.migrate_flat() == 0
+
+    assert sorted(os.listdir(tmp_path)) == ["2025", "notes.txt"]
+    for name in names:
+        assert storage.find(name) == storage.path_for(name)
@@ -0,0 +1,109 @@
+import asyncio
+import io
+import os
+import struct
+
+from PIL import Image
+import pytest
+
+from weatherbox.renders import TimelapseRenderer, decimate
+from weatherbox.storage import ImageStorage
+from weatherbox.video import AviWriter, VideoTooLargeError, render_video
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    for i in range(6):
+        Image.new("RGB", (2592, 1944), (i * 40, 120, 200)).save(
+            directory / f"2025-01-01T00:0{i}:00+00:00.jpg"
+        )
+    return directory
+
+
+def _read_avi(path):
+    """Get the header fields and frames of an AVI written by AviWriter."""
+    with open(path, "rb") as file:
+        data = file.read()
+
+    assert data[:4] == b"RIFF" and data[8:12] == b"AVI "
+    assert struct.unpack_from("<I", data, 4)[0] == len(data) - 8
+    avih = struct.unpack_from("<14I", data, 32)
+
+    movi = data.index(b"movi")
+    idx1 = data.index(b"idx1")
+    frames = []
+    for i in range(struct.unpack_from("<I", data, idx1 + 4)[0] // 16):
+        _, _, offset, length = struct.unpack_from("<4sIII", data, idx1 + 8 + i * 16)
+        frames.append(data[movi + offset + 8 : movi + offset + 8 + length])
+    return avih, frames
+
+
+def test_decimate():
+    assert decimate(list(range(10)), 20) == list(range(10))
+    assert decimate(list(range(10)), 5) == [0, 2, 4, 6, 8]
+    assert decimate(list(range(10)), 3) == [0, 3, 6]
+
+
+def test_render_video(tmp_path, image_dir):
+    paths = sorted(str(path) for path in image_dir.iterdir())
+    dest = str(tmp_path / "video.avi")
+
+    # A missing image is skipped rather than failing the video
+    frames = render_video(
+        paths + [str(image_dir / "missing.jpg")], dest, (320, 240), 24, 80
+    )
+
+    avih, jpegs = _read_avi(dest)
+    assert frames == len(jpegs) == 6
+    assert avih[0] == 1_000_000 // 24
+    assert avih[4] == 6
+    assert avih[8:10] == (320, 240)
+    assert all(jpeg.startswith(b"\xff\xd8") for jpeg in jpegs)
+    assert set(os.listdir(tmp_path)) == {"images", "video.avi"}
+
+
+@pytest.mark.asyncio
+async def test_renderer_caches_videos(tmp_path, image_dir):
+    renderer = TimelapseRenderer(
+        str(tmp_path / "videos"), ImageStorage(str(image_dir)), 1
+    )
+    names = sorted(os.listdir(image_dir))
+
+    job = renderer.render(names, "small", 12)
+    assert renderer.render(names, "small", 12) is job
+    while job.status in ("queued", "running"):
+        await asyncio.sleep(0.05)
+
+    assert job.status == "done"
+    assert os.path.exists(renderer.path_for(job.id))
+
+    # Found on disk after a restart without rendering again
+    restarted = TimelapseRenderer(
+        str(tmp_path / "videos"), ImageStorage(str(image_dir)), 1
+    )
+    assert restarted.render(names, "small", 12).status == "done"
+
+    # A different video pushes the older one out
+    other = renderer.render(names[::2], "small", 12)
+    while other.status in ("queued", "running"):
+        await asyncio.sleep(0.05)
+    assert other.frames == 3
+    assert not os.path.exists(renderer.path_for(job.id))
+    assert renderer.get(job.id) is None
+
+
+def test_video_size_capped(tmp_path, image_dir):
+    writer = AviWriter(io.BytesIO(), 24, max_bytes=1000)
+    writer.add_frame(bytes(500), (320, 240))
+    with pytest.raises(VideoTooLargeError):
+        writer.add_frame(bytes(500), (320, 240))
+
+    # Rejected before rendering, at the longest duration and highest fps
+    renderer = TimelapseRenderer(
+        str(tmp_path / "videos"), ImageStorage(str(image_dir)), 1
+    )
+    with pytest.raises(VideoTooLargeError):
+        renderer.render([f"{i}.jpg" for i in range(600 * 60)], "large", 60)
+    assert renderer.jobs == {}
@@ -0,0 +1,404 @@
+from array import array
+from datetime import datetime, timezone
+import json
+import logging
+import math
+import os
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar
+import zlib
+
+from sqlalchemy import Integer
+from sqlmodel import Session, SQLModel, delete, func, select
+
+from weatherbox.models import SENSOR_MODELS, EpochMillis, from_millis, to_millis
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", f"archive-{os.getenv('ENV', 'dev')}")
+# Raw rows older than this many days are moved out of SQLite, 0 disables archiving
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+
+DAY_MILLIS = 24 * 60 * 60 * 1000
+
+SEGMENT_MAGIC = b"WBSEG1\n"
+
+# Nulls are stored as NaN in float columns
+NULL_FLOAT = math.nan
+
+T = TypeVar("T")
+
+
+def write_segment(path: str, columns: Dict[str, array]):
+    """
+    Write columns to a compressed columnar segment file.
+    Integer columns are delta encoded first, which makes sorted ids and timestamps
+    compress to almost nothing. The file is written atomically.
+    """
+    header = {"rows": 0, "columns": []}
+    buffers = []
+    for name, values in columns.items():
+        header["rows"] = len(values)
+        if values.typecode == "q":
+            values = array("q", _delta_encode(values))
+        buffer = zlib.compress(values.tobytes(), 9)
+        header["columns"].append(
+            {"name": name, "type": values.typecode, "length": len(buffer)}
+        )
+        buffers.append(buffer)
+
+    header_bytes = json.dumps(header).encode()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(SEGMENT_MAGIC)
+        file.write(len(header_bytes).to_bytes(4, "big"))
+        file.write(header_bytes)
+        for buffer in buffers:
+            file.write(buffer)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_segment(path: str, names: Optional[List[str]] = None) -> Dict[str, array]:
+    """Read columns from a segment file, only decompressing the ones asked for."""
+    with open(path, "rb") as file:
+        if file.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not an archive segment")
+        header = json.loads(file.read(int.from_bytes(file.read(4), "big")))
+
+        columns = {}
+        for column in header["columns"]:
+            buffer = file.read(column["length"])
+            if names is not None and column["name"] not in names:
+                continue
+
+            values = array(column["type"], zlib.decompress(buffer))
+            if column["type"] == "q":
+                values = array("q", _delta_decode(values))
+            columns[column["name"]] = values
+
+    return columns
+
+
+def _delta_encode(values: array) -> List[int]:
+    return [value - previous for previous, value in zip([0, *values], values)]
+
+
+def _delta_decode(deltas: array) -> List[int]:
+    values, total = [], 0
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+class Archive:
+    """
+    Columnar archive of raw sensor rows, one segment file per sensor per UTC day,
+    with a manifest of the archived days.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = Lock()
+        self._manifest: Dict[str, Dict[str, dict]] = {}
+
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as file:
+                self._manifest = json.load(file)
+
+    def days(self, table: str) -> Dict[str, dict]:
+        """Get the manifest entries of the archived days of a table."""
+        with self._lock:
+            return dict(self._manifest.get(table, {}))
+
+    def first_timestamp(self, table: str) -> Optional[str]:
+        """Get the earliest archived timestamp of a table."""
+        days = self.days(table)
+        if not days:
+            return None
+        return from_millis(min(day["first"] for day in days.values()))
+
+    def last_timestamp(self, table: str) -> Optional[str]:
+        """Get the latest archived timestamp of a table."""
+        days = self.days(table)
+        if not days:
+            return None
+        return from_millis(max(day["last"] for day in days.values()))
+
+    def read_rows(
+        self,
+        model_class: Type[SQLModel],
+        start_dt: Optional[str],
+        end_dt: Optional[str],
+    ) -> List[SQLModel]:
+        """Get the archived rows of a sensor model within a time range, in time order."""
+        names = [column.name for column in model_class.__table__.columns]
+        return [
+            model_class(**dict(zip(names, values)))
+            for values in self.iter_values(model_class, start_dt, end_dt)
+        ]
+
+    def iter_values(
+        self,
+        model_class: Type[SQLModel],
+        start_dt: Optional[str],
+        end_dt: Optional[str],
+    ) -> Iterator[tuple]:
+        """
+        Yield the column values of archived rows within a time range, in table column order
+        and time order, with ISO timestamps. Only one day is held in memory at a time.
+        """
+        names = [column.name for column in model_class.__table__.columns]
+        for columns in self._segments(model_class, start_dt, end_dt):
+            columns["timestamp"] = map(from_millis, columns["timestamp"])
+            yield from zip(*(columns[name] for name in names))
+
+    def count_rows(
+        self,
+        model_class: Type[SQLModel],
+        start_dt: Optional[str],
+        end_dt: Optional[str],
+    ) -> int:
+        """Count the archived rows of a sensor model within a time range."""
+        return sum(
+            len(columns["timestamp"])
+            for columns in self._segments(
+                model_class, start_dt, end_dt, names=["timestamp"]
+            )
+        )
+
+    def without_archived(
+        self, model_class: Type[SQLModel], rows: Iterable[T]
+    ) -> Iterator[T]:
+        """
+        Drop table rows that are also archived, left behind if archiving stopped between
+        writing a segment and deleting the rows. Rows must be in time order, so only one
+        day's archived ids are held in memory at a time.
+        """
+        days = self.days(model_class.__tablename__)
+        day, archived = None, set()
+        for row in rows:
+            millis = to_millis(row.timestamp)
+            row_day = from_millis(millis // DAY_MILLIS * DAY_MILLIS)[:10]
+            if row_day not in days:
+                yield row
+                continue
+
+            if row_day != day:
+                day = row_day
+                columns = read_segment(
+                    os.path.join(self.directory, days[day]["file"]),
+                    ["id", "timestamp"],
+                )
+                archived = set(zip(columns["id"], columns["timestamp"]))
+            if (row.id, millis) not in archived:
+                yield row
+
+    def _segments(self, model_class, start_dt, end_dt, names=None):
+        """Yield the columns of the segments overlapping a time range, filtered to it."""
+        start = to_millis(start_dt) if start_dt else None
+        end = to_millis(end_dt) if end_dt else None
+
+        for day, entry in sorted(self.days(model_class.__tablename__).items()):
+            if (start is not None and entry["last"] < start) or (
+                end is not None and entry["first"] > end
+            ):
+                continue
+
+            columns = read_segment(
+                os.path.join(self.directory, entry["file"]),
+                None if names is None else [*names, "timestamp"],
+            )
+            keep = [
+                i
+                for i, timestamp in enumerate(columns["timestamp"])
+                if (start is None or timestamp >= start)
+                and (end is None or timestamp <= end)
+            ]
+
+            segment = {}
+            for column in model_class.__table__.columns:
+                if names is not None and column.name not in names:
+                    continue
+                values = columns.get(column.name)
+                if values is None:
+                    # Added to the model after the segment was written
+                    segment[column.name] = [None] * len(keep)
+                elif column.nullable:
+                    segment[column.name] = [
+                        None if math.isnan(values[i]) else values[i] for i in keep
+                    ]
+                else:
+                    segment[column.name] = [values[i] for i in keep]
+            yield segment
+
+    def archive_old_rows(self, session: Session, after_days: int):
+        """
+        Move raw rows older than after_days whole days into segment files,
+        one day at a time so memory use stays bounded.
+        Rollups are kept in the database, so aggregated queries still cover archived days.
+        """
+        for model_class, day_start in self.pending_days(session, after_days):
+            max_id = self.write_day(session, model_class, day_start)
+            if max_id is not None:
+                self.delete_day(session, model_class, day_start, max_id)
+
+    def pending_days(
+        self, session: Session, after_days: int
+    ) -> List[Tuple[Type[SQLModel], int]]:
+        """Get the sensor models and day starts with raw rows older than after_days whole days."""
+        today = to_millis(datetime.now(timezone.utc)) // DAY_MILLIS * DAY_MILLIS
+        cutoff = today - after_days * DAY_MILLIS
+
+        days = []
+        for model_class in SENSOR_MODELS:
+            first = session.exec(
+                select(func.min(model_class.timestamp)).where(
+                    model_class.timestamp < cutoff
+                )
+            ).one()
+            if first is None:
+                continue
+
+            day_start = to_millis(first) // DAY_MILLIS * DAY_MILLIS
+            days.extend(
+                (model_class, day) for day in range(day_start, cutoff, DAY_MILLIS)
+            )
+        return days
+
+    def write_day(
+        self, session: Session, model_class: Type[SQLModel], day_start: int
+    ) -> Optional[int]:
+        """
+        Write a day of raw rows to its segment file and the manifest, without deleting them.
+        Only reads from the session, so it can run on a read connection.
+        Returns the largest archived id, or None if the day has no rows.
+        """
+        table = model_class.__tablename__
+        rows = session.exec(
+            select(model_class)
+            .where(*_in_day(model_class, day_start))
+            .order_by(model_class.timestamp)
+        ).all()
+        if not rows:
+            return None
+
+        day = from_millis(day_start)[:10]
+        file = os.path.join(table, f"{day}.seg")
+        path = os.path.join(self.directory, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        columns = {
+            column.name: array(
+                "q" if isinstance(column.type, (Integer, EpochMillis)) else "d",
+                [
+                    (
+                        to_millis(row.timestamp)
+                        if column.name == "timestamp"
+                        else _or_null(getattr(row, column.name))
+                    )
+                    for row in rows
+                ],
+            )
+            for column in model_class.__table__.columns
+        }
+
+        # Merge with rows archived earlier, such as late samples or an interrupted run
+        if os.path.exists(path):
+            columns = _merge(read_segment(path), columns)
+
+        write_segment(path, columns)
+        self._update_manifest(
+            table,
+            day,
+            {
+                "file": file,
+                "rows": len(columns["timestamp"]),
+                "first": columns["timestamp"][0],
+                "last": columns["timestamp"][-1],
+            },
+        )
+        logging.info(f"Archived {len(rows)} {table} rows from {day}")
+        return max(row.id for row in rows)
+
+    def delete_day(
+        self, session: Session, model_class: Type[SQLModel], day_start: int, max_id: int
+    ):
+        """
+        Delete a day of raw rows once write_day has put them on disk.
+        Rows stored since then have larger ids and are left for the next run.
+        """
+        session.exec(
+            delete(model_class)
+            .where(*_in_day(model_class, day_start), model_class.id <= max_id)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+    def _update_manifest(self, table: str, day: str, entry: dict):
+        with self._lock:
+            self._manifest.setdefault(table, {})[day] = entry
+            manifest = json.dumps(self._manifest)
+
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(manifest)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+
+def _in_day(model_class: Type[SQLModel], day_start: int) -> tuple:
+    return (
+        model_class.timestamp >= day_start,
+        model_class.timestamp < day_start + DAY_MILLIS,
+    )
+
+
+def _or_null(value):
+    return NULL_FLOAT if value is None else value
+
+
+def _merge(old: Dict[str, array], new: Dict[str, array]) -> Dict[str, array]:
+    """
+    Merge two sets of columns, dropping rows archived twice and sorting by time.
+    Columns missing from the old set, added to the model since, are null in its rows.
+    """
+    rows = {}
+    for columns in (old, new):
+        # Ids can be reused once the table has been emptied, so match on the timestamp too
+        for i, key in enumerate(zip(columns["id"], columns["timestamp"])):
+            rows[key] = {name: values[i] for name, values in columns.items()}
+
+    ordered = sorted(rows.values(), key=lambda row: (row["timestamp"], row["id"]))
+    return {
+        name: array(values.typecode, [row.get(name, NULL_FLOAT) for row in ordered])
+        for name, values in new.items()
+    }
+
+
+# Global archive instance
+archive = Archive(ARCHIVE_DIR)
+
+
+def query_raw(
+    session: Session,
+    model_class: Type[SQLModel],
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+) -> List[SQLModel]:
+    """Get the raw rows of a sensor model within a time range from the archive and the table, in time order."""
+    query = select(model_class)
+    if start_dt:
+        query = query.where(model_class.timestamp >= start_dt)
+    if end_dt:
+        query = query.where(model_class.timestamp <= end_dt)
+
+    rows = archive.read_rows(model_class, start_dt, end_dt)
+    rows.extend(
+        archive.without_archived(
+            model_class, session.exec(query.order_by(model_class.timestamp))
+        )
+    )
+    return rows
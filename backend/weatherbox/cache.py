@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from os import getenv
+from threading import Lock
+from typing import Any, Hashable, Optional, Tuple
+
+SENSOR_DATA_CACHE_SIZE = int(getenv("SENSOR_DATA_CACHE_SIZE", "128"))
+IMAGE_COUNT_CACHE_SIZE = int(getenv("IMAGE_COUNT_CACHE_SIZE", "64"))
+
+
+class ResponseCache:
+    """
+    LRU cache of responses for time range queries.
+    Entries are keyed on the range end in epoch milliseconds (None for open ranges)
+    plus any other query parameters. Closed historical ranges are kept until evicted,
+    while ranges reaching the timestamps of newly committed rows are invalidated.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[Tuple[Optional[int], Hashable], Any] = OrderedDict()
+        self._generation = 0
+        self._lock = Lock()
+
+    def get(self, key: Tuple[Optional[int], Hashable]) -> Tuple[Any, int]:
+        """
+        Get a cached response, or None on a miss, along with the generation to pass to put.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key], self._generation
+
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, key: Tuple[Optional[int], Hashable], value: Any, generation: int):
+        """
+        Cache a response computed after get returned generation.
+        It is dropped if rows were committed in the meantime, as it may predate them.
+        """
+        if self.max_size < 1:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, since: int):
+        """Drop the entries for ranges that are open or end at or after since."""
+        with self._lock:
+            self._generation += 1
+            stale = [key for key in self._entries if key[0] is None or key[0] >= since]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Global cache of /sensors/data responses
+sensor_data_cache = ResponseCache(SENSOR_DATA_CACHE_SIZE)
+
+# Global cache of /images total counts
+image_count_cache = ResponseCache(IMAGE_COUNT_CACHE_SIZE)
@@ -1,9 +1,133 @@
 import logging
+import os
+from threading import Lock
+import time
+from typing import Callable, Optional
 
-from picamera2 import Picamera2
+CAMERA_NUM = 0
+# Seconds to let exposure and white balance settle after opening the camera
+CAMERA_WARMUP = float(os.getenv("CAMERA_WARMUP", "2"))
 
 
-CAMERA_NUM = 0
+def _open_picamera2():
+    from picamera2 import Picamera2
+
+    return Picamera2(camera_num=CAMERA_NUM)
+
+
+class CameraSession:
+    """
+    Camera kept open and running between captures, so only the first capture
+    pays for opening the camera and letting it settle.
+    It runs in preview or still configuration and switches mode only when a
+    capture needs the other one. If an operation fails, the camera is closed
+    and reopened and the operation retried once.
+    camera_factory returns a Picamera2, or a fake with the same methods in tests.
+    """
+
+    def __init__(
+        self,
+        camera_factory: Callable = _open_picamera2,
+        warmup: float = CAMERA_WARMUP,
+    ):
+        self.camera_factory = camera_factory
+        self.warmup = warmup
+        self.mode: Optional[str] = None
+        self.opens = 0
+        self.failures = 0
+        self._camera = None
+        self._configs = {}
+        self._lock = Lock()
+
+    def capture_array(self):
+        """Capture a frame as an array in preview configuration."""
+        return self._run("preview", lambda camera: camera.capture_array())
+
+    def capture_file(self, path: str):
+        """Capture a full resolution still to a file in still configuration."""
+        return self._run("still", lambda camera: camera.capture_file(path))
+
+    def check_health(self) -> bool:
+        """
+        Check the camera still delivers frames, closing it if not so the next
+        capture reopens it. A closed camera is reported unhealthy.
+        """
+        with self._lock:
+            if self._camera is None:
+                return False
+
+            try:
+                self._camera.capture_metadata()
+                return True
+            except Exception as e:
+                logging.error(f"Camera health check failed: {e}")
+                self.failures += 1
+                self._close()
+                return False
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def status(self) -> dict:
+        return {
+            "open": self._camera is not None,
+            "mode": self.mode,
+            "opens": self.opens,
+            "failures": self.failures,
+        }
+
+    def _run(self, mode: str, operation: Callable):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._camera is None:
+                        self._open()
+                    if self.mode != mode:
+                        self._camera.switch_mode(self._configs[mode])
+                        self.mode = mode
+                    return operation(self._camera)
+                except Exception as e:
+                    self.failures += 1
+                    self._close()
+                    if attempt:
+                        logging.error(f"Camera capture failed: {e}")
+                        raise
+                    logging.warning(f"Camera capture failed, reopening camera: {e}")
+
+    def _open(self):
+        camera = self.camera_factory()
+        try:
+            self._configs = {
+                "preview": camera.create_preview_configuration(),
+                "still": camera.create_still_configuration(),
+            }
+            camera.configure(self._configs["preview"])
+            camera.start()
+        except Exception:
+            camera.close()
+            raise
+
+        self._camera = camera
+        self.mode = "preview"
+        self.opens += 1
+        logging.info("Camera opened")
+        time.sleep(self.warmup)
+
+    def _close(self):
+        camera, self._camera, self.mode = self._camera, None, None
+        if camera is None:
+            return
+
+        try:
+            camera.stop()
+            camera.close()
+        except Exception as e:
+            logging.error(f"Failed to close camera: {e}")
+
+
+# Global camera session instance
+camera_session = CameraSession()
 
 
 def capture_image():
@@ -11,17 +135,7 @@ def capture_image():
     Capture an image and return the array.
     Uses preview configuration for faster capture.
     """
-    camera = None
-    try:
-        camera = Picamera2(camera_num=CAMERA_NUM)
-        preview_config = camera.create_preview_configuration()
-        camera.configure(preview_config)
-        camera.start()
-        return camera.capture_array()
-    finally:
-        if camera:
-            camera.stop()
-            camera.close()
+    return camera_session.capture_array()
 
 
 def capture_and_save_image(path: str):
@@ -29,17 +143,4 @@ def capture_and_save_image(path: str):
     Capture and save an image using Picamera2.
     Uses still configuration for best quality.
     """
-    camera = None
-    try:
-        camera = Picamera2(camera_num=CAMERA_NUM)
-        still_config = camera.create_still_configuration()
-        camera.configure(still_config)
-        camera.start()
-        camera.capture_file(path)
-    except Exception as e:
-        logging.error(f"Failed to capture image: {e}")
-        raise
-    finally:
-        if camera:
-            camera.stop()
-            camera.close()
+    camera_session.capture_file(path)
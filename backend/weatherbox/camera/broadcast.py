@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional, Set
+
+
+class Subscriber:
+    """
+    A client of a FrameBroadcaster, holding only the latest frame it has not sent yet.
+    A frame still waiting when a newer one arrives is dropped, so a slow client
+    skips frames instead of falling behind.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0
+        self._frame: Optional[bytes] = None
+        self._ready = asyncio.Event()
+
+    def offer(self, frame: bytes):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._ready.set()
+
+    async def next(self) -> bytes:
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._frame = self._frame, None
+        self.sent += 1
+        return frame
+
+
+class FrameBroadcaster:
+    """
+    Fans encoded frames out to any number of asyncio clients.
+    Every client shares the same frame object, and none of them waits on a thread.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, frame: bytes):
+        """Offer a frame to every subscriber, must be called on the event loop."""
+        self.published += 1
+        for subscriber in self._subscribers:
+            subscriber.offer(frame)
+
+    def publish_threadsafe(self, frame: bytes):
+        """Offer a frame from another thread, such as the encoder's."""
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+
+        try:
+            loop.call_soon_threadsafe(self.publish, frame)
+        except RuntimeError:
+            # The loop has been closed
+            self._loop = None
+
+    def subscribe(self) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber()
+        self._subscribers.add(subscriber)
+        logging.info(f"Stream client connected, {len(self._subscribers)} connected")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        logging.info(
+            f"Stream client disconnected after {subscriber.sent} frames"
+            f" ({subscriber.dropped} dropped), {len(self._subscribers)} connected"
+        )
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """Yield the latest frames until the client disconnects."""
+        subscriber = self.subscribe()
+        try:
+            while True:
+                yield await subscriber.next()
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._subscribers),
+            "published": self.published,
+            "sent": sum(subscriber.sent for subscriber in self._subscribers),
+            "dropped": sum(subscriber.dropped for subscriber in self._subscribers),
+        }
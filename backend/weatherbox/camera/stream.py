@@ -1,80 +1,278 @@
 # https://www.picourse.dev/pi-cam#stream-video
+import asyncio
 import io
 import logging
-from threading import Condition
+import os
+from typing import AsyncIterator, Dict, Literal, NamedTuple, Optional
 
-from libcamera import Transform
-
-from picamera2 import Picamera2
-from picamera2.encoders import MJPEGEncoder, Quality
-from picamera2.outputs import FileOutput
+from starlette.concurrency import run_in_threadpool
 
+from weatherbox.camera.broadcast import FrameBroadcaster, Subscriber
 
 CAMERA_NUM = 1
+MAIN_SIZE = (1920, 1080)
+LORES_SIZE = (848, 480)
+# Seconds to keep recording after the last client leaves, in case another one connects
+STREAM_IDLE_SECONDS = float(os.getenv("STREAM_IDLE_SECONDS", "30"))
 
+FRAME_HEADER = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+FRAME_TRAILER = b"\r\n"
+
+
+class StreamProfile(NamedTuple):
+    """An MJPEG encoding of one of the camera's streams."""
+
+    stream: Literal["main", "lores"]
+    quality: str
 
-def generate_frames():
-    while True:
-        try:
-            frame = output.read()
-            if frame is not None:
-                yield (
-                    b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-                )
-        except Exception as e:
-            logging.error(f"Error in generate_frames: {str(e)}")
-            break
 
-    print("done")
+# Both profiles share one camera configuration, low encodes its lores stream
+PROFILES: Dict[str, StreamProfile] = {
+    "high": StreamProfile("main", "VERY_HIGH"),
+    "low": StreamProfile("lores", "MEDIUM"),
+}
+ProfileName = Literal["high", "low", "adaptive"]
+
+# Adaptive clients start at the first profile and step down the list when falling behind
+ADAPTIVE_PROFILES = ["high", "low"]
+# Frames per adaptive check, a client dropping more than a quarter of them steps down
+ADAPTIVE_WINDOW = 30
+# Checks in a row without a dropped frame before an adaptive client steps back up
+ADAPTIVE_RECOVER_WINDOWS = 10
 
 
 class StreamingOutput(io.BufferedIOBase):
-    def __init__(self):
-        self.frame = None
-        self.condition = Condition()
+    """Encoder output handing every frame to the broadcaster."""
+
+    def __init__(self, broadcaster: FrameBroadcaster):
+        self.broadcaster = broadcaster
 
     def write(self, buf):
-        with self.condition:
-            self.frame = buf
-            self.condition.notify_all()
-
-    def read(self):
-        with self.condition:
-            self.condition.wait()
-            return self.frame
-
-
-picam2 = Picamera2(camera_num=CAMERA_NUM)
-video_config = picam2.create_video_configuration(
-    main={"size": (1920, 1080)},
-    transform=Transform(hflip=True, vflip=True),
-)
-picam2.configure(video_config)
-output = StreamingOutput()
-picam2.start_recording(MJPEGEncoder(), FileOutput(output), Quality.VERY_HIGH)
-
-
-def stop():
-    print("Stopping recording")
-    picam2.stop_recording()
-    picam2.close()
-
-
-# class StreamManager:
-#     def __init__(self):
-#         self.camera = Picamera2(camera_num=0)
-#         self.video_config = self.camera.create_video_configuration(
-#             main={"size": (1920, 1080)}
-#         )
-#         self.camera.configure(self.video_config)
-#         self.output = StreamingOutput()
-#         self.camera.start_recording(
-#             MJPEGEncoder(), FileOutput(self.output), Quality.VERY_HIGH
-#         )
-
-#     def stop(self):
-#         self.camera.stop()
-#         self.camera.close()
-
-#     def get_frame(self):
-#         return self.output.read()
+        # Copied once here, as the encoder may reuse its buffer
+        self.broadcaster.publish_threadsafe(bytes(buf))
+        return len(buf)
+
+
+class Picamera2Backend:
+    """Runs the stream camera with Picamera2, with one MJPEG encoder per profile in use."""
+
+    def start_camera(self):
+        from libcamera import Transform
+        from picamera2 import Picamera2
+
+        picam2 = Picamera2(camera_num=CAMERA_NUM)
+        try:
+            video_config = picam2.create_video_configuration(
+                main={"size": MAIN_SIZE},
+                lores={"size": LORES_SIZE},
+                transform=Transform(hflip=True, vflip=True),
+            )
+            picam2.configure(video_config)
+            picam2.start()
+        except Exception:
+            picam2.close()
+            raise
+
+        return picam2
+
+    def start_encoder(self, picam2, profile: StreamProfile, output: StreamingOutput):
+        from picamera2.encoders import MJPEGEncoder, Quality
+        from picamera2.outputs import FileOutput
+
+        encoder = MJPEGEncoder()
+        picam2.start_encoder(
+            encoder,
+            FileOutput(output),
+            quality=Quality[profile.quality],
+            name=profile.stream,
+        )
+        return encoder
+
+    def stop_encoder(self, picam2, encoder):
+        picam2.stop_encoder(encoder)
+
+    def stop_camera(self, picam2):
+        picam2.stop()
+        picam2.close()
+
+
+class MjpegStream:
+    """
+    MJPEG streams in several profiles from one camera.
+    The camera starts when the first client connects, and each profile's encoder
+    when its first client connects. Encoders without clients for idle_seconds
+    are stopped, and the camera once none are left, so nothing runs while
+    nobody is watching.
+    backend is a Picamera2Backend, or a fake with the same methods in tests.
+    """
+
+    def __init__(self, backend=None, idle_seconds: float = STREAM_IDLE_SECONDS):
+        self.backend = backend or Picamera2Backend()
+        self.idle_seconds = idle_seconds
+        self.broadcasters = {name: FrameBroadcaster() for name in PROFILES}
+        self.adaptive_steps = 0
+        self._camera = None
+        self._encoders = {}
+        self._clients = dict.fromkeys(PROFILES, 0)
+        self._idle_since = dict.fromkeys(PROFILES, 0.0)
+        self._lock = asyncio.Lock()
+        self._idle_stop: Optional[asyncio.Task] = None
+
+    @property
+    def recording(self) -> bool:
+        return self._camera is not None
+
+    async def frames(self, profile: ProfileName = "high") -> AsyncIterator[bytes]:
+        """Yield the latest frames of a profile for one client until it disconnects."""
+        if profile == "adaptive":
+            async for frame in self._adaptive_frames():
+                yield frame
+            return
+
+        subscriber = await self._join(profile)
+        try:
+            while True:
+                yield await subscriber.next()
+        finally:
+            self._leave(profile, subscriber)
+
+    async def _adaptive_frames(self) -> AsyncIterator[bytes]:
+        """
+        Yield frames starting from the best profile, stepping down when the client
+        drops frames because its sends back up, and back up once it keeps up again.
+        """
+        level = 0
+        profile = ADAPTIVE_PROFILES[level]
+        subscriber = await self._join(profile)
+        last_dropped = 0
+        clean_windows = 0
+        try:
+            while True:
+                yield await subscriber.next()
+                if subscriber.sent % ADAPTIVE_WINDOW:
+                    continue
+
+                dropped = subscriber.dropped - last_dropped
+                last_dropped = subscriber.dropped
+                clean_windows = 0 if dropped else clean_windows + 1
+                if dropped > ADAPTIVE_WINDOW // 4:
+                    step = 1
+                elif clean_windows >= ADAPTIVE_RECOVER_WINDOWS:
+                    step = -1
+                else:
+                    continue
+
+                if not 0 <= level + step < len(ADAPTIVE_PROFILES):
+                    continue
+
+                level += step
+                new_profile = ADAPTIVE_PROFILES[level]
+                new_subscriber = await self._join(new_profile)
+                self._leave(profile, subscriber)
+                profile, subscriber = new_profile, new_subscriber
+                last_dropped = clean_windows = 0
+                self.adaptive_steps += 1
+        finally:
+            self._leave(profile, subscriber)
+
+    async def stop(self):
+        """Stop every encoder and the camera now, such as on shutdown."""
+        if self._idle_stop is not None:
+            self._idle_stop.cancel()
+            self._idle_stop = None
+        async with self._lock:
+            for profile in list(self._encoders):
+                await self._stop_encoder(profile)
+            await self._stop_camera()
+
+    async def _join(self, profile: str) -> Subscriber:
+        self._clients[profile] += 1
+        try:
+            await self._ensure_encoder(profile)
+        except Exception:
+            self._leave(profile, None)
+            raise
+        return self.broadcasters[profile].subscribe()
+
+    def _leave(self, profile: str, subscriber: Optional[Subscriber]):
+        if subscriber is not None:
+            self.broadcasters[profile].unsubscribe(subscriber)
+        self._clients[profile] -= 1
+        if not self._clients[profile]:
+            self._idle_since[profile] = asyncio.get_running_loop().time()
+            if self._idle_stop is None or self._idle_stop.done():
+                self._idle_stop = asyncio.create_task(self._stop_when_idle())
+
+    async def _ensure_encoder(self, profile: str):
+        async with self._lock:
+            if self._camera is None:
+                logging.info("Starting stream camera")
+                self._camera = await run_in_threadpool(self.backend.start_camera)
+            if profile not in self._encoders:
+                logging.info(f"Starting {profile} MJPEG stream")
+                self._encoders[profile] = await run_in_threadpool(
+                    self.backend.start_encoder,
+                    self._camera,
+                    PROFILES[profile],
+                    StreamingOutput(self.broadcasters[profile]),
+                )
+
+    async def _stop_encoder(self, profile: str):
+        encoder = self._encoders.pop(profile)
+        logging.info(f"Stopping {profile} MJPEG stream")
+        await run_in_threadpool(self.backend.stop_encoder, self._camera, encoder)
+
+    async def _stop_camera(self):
+        camera, self._camera = self._camera, None
+        if camera is not None:
+            logging.info("Stopping stream camera")
+            await run_in_threadpool(self.backend.stop_camera, camera)
+
+    async def _stop_when_idle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            idle = [profile for profile in self._encoders if not self._clients[profile]]
+            if not idle:
+                if not self._encoders and not any(self._clients.values()):
+                    # An encoder failed to start, so nothing is using the camera
+                    async with self._lock:
+                        if not self._encoders:
+                            await self._stop_camera()
+                return
+
+            # Clients may have come and gone meanwhile, so wait from the last one leaving
+            since = min(self._idle_since[profile] for profile in idle)
+            await asyncio.sleep(max(since + self.idle_seconds - loop.time(), 0))
+
+            async with self._lock:
+                for profile in list(self._encoders):
+                    idle_for = loop.time() - self._idle_since[profile]
+                    if not self._clients[profile] and idle_for >= self.idle_seconds:
+                        await self._stop_encoder(profile)
+                if not self._encoders:
+                    await self._stop_camera()
+
+    def stats(self) -> dict:
+        return {
+            "recording": self.recording,
+            "adaptive_steps": self.adaptive_steps,
+            "profiles": {
+                profile: {"encoding": profile in self._encoders, **broadcaster.stats()}
+                for profile, broadcaster in self.broadcasters.items()
+            },
+        }
+
+
+# Global MJPEG stream instance
+mjpeg_stream = MjpegStream()
+
+
+async def generate_frames(profile: ProfileName = "high"):
+    """
+    Yield the multipart MJPEG stream of a profile for one client.
+    The frame is yielded on its own so every client sends the same bytes object.
+    """
+    async for frame in mjpeg_stream.frames(profile):
+        yield FRAME_HEADER
+        yield frame
+        yield FRAME_TRAILER
@@ -1,13 +1,58 @@
 from datetime import datetime, timezone
+import logging
 from os import getenv
+from threading import Lock
+from time import monotonic
+from typing import List, Tuple
 
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Session, SQLModel, create_engine
 
+from weatherbox.cache import sensor_data_cache
+from weatherbox.migrations import migrate
 from weatherbox.models import *
+from weatherbox.rollups import update_rollups
 
-engine = create_engine(f"sqlite:///weatherbox-{getenv('ENV', 'dev')}.db")
+DB_FILE = f"weatherbox-{getenv('ENV', 'dev')}.db"
+# Number of pooled read-only connections, and threads using them
+READ_POOL_SIZE = int(getenv("READ_POOL_SIZE", "5"))
 
-SQLModel.metadata.create_all(engine)
+engine = create_engine(
+    f"sqlite:///{DB_FILE}",
+    poolclass=QueuePool,
+    connect_args={"check_same_thread": False},
+)
+
+
+@event.listens_for(engine, "connect")
+def _configure_connection(dbapi_connection, _):
+    # WAL lets readers run alongside the writer, and NORMAL sync is safe with WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+migrate(engine)
+
+read_engine = create_engine(
+    f"sqlite:///file:{DB_FILE}?mode=ro&uri=true",
+    poolclass=QueuePool,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=0,
+    connect_args={"check_same_thread": False},
+)
+
+# Flush the sample buffer once this many rows are pending...
+SAMPLE_BUFFER_SIZE = int(getenv("SAMPLE_BUFFER_SIZE", "50"))
+# ...or once the oldest pending row is this many seconds old
+SAMPLE_BUFFER_MAX_AGE = int(getenv("SAMPLE_BUFFER_MAX_AGE", "60"))
+# Rows kept while writes fail, beyond which the oldest are dropped
+SAMPLE_BUFFER_MAX_PENDING = int(getenv("SAMPLE_BUFFER_MAX_PENDING", "1000"))
+# Flushes a row may fail in before it is dropped
+SAMPLE_BUFFER_MAX_ATTEMPTS = int(getenv("SAMPLE_BUFFER_MAX_ATTEMPTS", "3"))
 
 
 def get_session():
@@ -15,5 +60,134 @@ def get_session():
     return Session(engine)
 
 
+def get_read_session():
+    """Get a read-only session from the read connection pool."""
+    return Session(read_engine)
+
+
 def utc_timestamp():
     return datetime.now(timezone.utc).isoformat()
+
+
+class SampleBuffer:
+    """
+    Write-behind buffer for sensor samples.
+    Rows are queued in memory and written in a single transaction once the buffer
+    reaches max_size rows or its oldest row is older than max_age seconds.
+    If that transaction fails, the rows are written one by one so a bad row
+    cannot hold back the rest. Rows that fail are retried on later flushes and
+    dropped after max_attempts, and at most max_pending rows are kept, dropping
+    the oldest, so a failing database cannot grow the buffer without bound.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        max_age: float,
+        max_pending: int = SAMPLE_BUFFER_MAX_PENDING,
+        max_attempts: int = SAMPLE_BUFFER_MAX_ATTEMPTS,
+    ):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        # Rows with the number of times they failed to be written
+        self._pending: List[Tuple[SQLModel, int]] = []
+        self._oldest: float = 0.0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, sample: SQLModel):
+        """Queue a row for writing, flushing if a threshold has been reached."""
+        with self._lock:
+            if not self._pending:
+                self._oldest = monotonic()
+            self._pending.append((sample, 0))
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self._dropped(overflow, "the buffer is full")
+
+        if self.should_flush():
+            self.flush()
+
+    def should_flush(self) -> bool:
+        """Check whether the size or age threshold has been reached."""
+        if not self._pending:
+            return False
+
+        return (
+            len(self._pending) >= self.max_size
+            or monotonic() - self._oldest >= self.max_age
+        )
+
+    def flush(self) -> int:
+        """
+        Write all pending rows, in one transaction unless it fails.
+        Returns the number of rows written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        if not pending:
+            return 0
+
+        samples = [sample for sample, _ in pending]
+        # Read before committing, as committing expires the rows
+        earliest = min(to_millis(sample.timestamp) for sample in samples)
+
+        try:
+            self._write(samples)
+            written = len(samples)
+            retry = []
+        except Exception as e:
+            logging.warning(f"Failed to write {len(samples)} buffered samples: {e}")
+            written, retry = self._write_each(pending)
+
+        if retry:
+            with self._lock:
+                self._pending[:0] = retry
+                if len(retry) == len(self._pending):
+                    self._oldest = monotonic()
+
+        if written:
+            sensor_data_cache.invalidate(earliest)
+        return written
+
+    def _write(self, samples: List[SQLModel]):
+        with get_session() as session:
+            session.add_all(samples)
+            update_rollups(session, samples)
+            session.commit()
+
+    def _write_each(
+        self, pending: List[Tuple[SQLModel, int]]
+    ) -> Tuple[int, List[Tuple[SQLModel, int]]]:
+        """
+        Write rows in a transaction each, so only the bad ones fail.
+        Returns the number written and the failed rows to retry.
+        """
+        written = 0
+        retry = []
+        for sample, attempts in pending:
+            try:
+                self._write([sample])
+                written += 1
+            except Exception as e:
+                if attempts + 1 < self.max_attempts:
+                    retry.append((sample, attempts + 1))
+                else:
+                    logging.error(f"Failed to write sample {sample!r}: {e}")
+                    self._dropped(1, f"it failed {self.max_attempts} times")
+        return written, retry
+
+    def _dropped(self, count: int, reason: str):
+        self.dropped += count
+        logging.error(f"Dropped {count} buffered samples as {reason}")
+
+
+# Global sample buffer instance
+sample_buffer = SampleBuffer(SAMPLE_BUFFER_SIZE, SAMPLE_BUFFER_MAX_AGE)
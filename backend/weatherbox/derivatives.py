@@ -0,0 +1,177 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+import logging
+import os
+from threading import Lock
+from typing import Dict, Tuple
+
+from weatherbox.executors import get_image_executor, run_image
+from weatherbox.imaging import SIZES, render_derivative
+
+DERIVATIVE_DIR = os.getenv("DERIVATIVE_DIR", "derivatives")
+DERIVATIVE_CACHE_MAX_BYTES = (
+    int(os.getenv("DERIVATIVE_CACHE_MAX_MB", "256")) * 1024 * 1024
+)
+
+
+class DerivativeCache:
+    """
+    On-disk cache of resized and re-encoded images, capped at max_bytes by
+    evicting the least recently used files.
+    Derivatives are generated ahead of time or on first request, and concurrent
+    requests for the same one share a single render.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self._lock = Lock()
+
+        if os.path.isdir(directory):
+            self._load()
+
+    def _load(self):
+        """Index derivatives left from a previous run, oldest first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def name_for(file_name: str, size: str, format: str, quality: int) -> str:
+        stem = os.path.splitext(file_name)[0]
+        return f"{stem}.{size}.q{quality}.{format}"
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def get(
+        self, source_path: str, size: str, format: str, quality: int
+    ) -> Tuple[str, os.stat_result]:
+        """
+        Get the path and stat of the derivative of an image, rendering it in the
+        image process pool if it is not cached yet.
+        """
+        name = self.name_for(os.path.basename(source_path), size, format, quality)
+        path = self.path_for(name)
+
+        with self._lock:
+            cached = name in self._files
+            if cached:
+                self._files.move_to_end(name)
+
+        if cached:
+            try:
+                stat = os.stat(path)
+                self.hits += 1
+                return path, stat
+            except FileNotFoundError:
+                # Removed from under us, so forget it and render it again
+                self._remove(name)
+
+        self.misses += 1
+        if name not in self._rendering:
+            self._rendering[name] = asyncio.ensure_future(
+                self._render(source_path, name, size, format, quality)
+            )
+        await asyncio.shield(self._rendering[name])
+
+        return path, os.stat(path)
+
+    async def _render(self, source_path, name, size, format, quality):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            file_size = await run_image(
+                render_derivative,
+                source_path,
+                self.path_for(name),
+                SIZES[size],
+                format,
+                quality,
+            )
+            self.add(name, file_size)
+        finally:
+            del self._rendering[name]
+
+    def render_in_background(
+        self, source_path: str, size: str, format: str, quality: int
+    ) -> Tuple[str, Future]:
+        """
+        Start rendering a derivative in the image process pool without waiting for it.
+        Returns its name and a future for its file size, it is added to the cache once done.
+        """
+        name = self.name_for(os.path.basename(source_path), size, format, quality)
+        os.makedirs(self.directory, exist_ok=True)
+
+        future = get_image_executor().submit(
+            render_derivative,
+            source_path,
+            self.path_for(name),
+            SIZES[size],
+            format,
+            quality,
+        )
+
+        def on_done(done: Future):
+            if done.exception() is None:
+                self.add(name, done.result())
+
+        future.add_done_callback(on_done)
+
+        return name, future
+
+    def add(self, name: str, file_size: int):
+        """Record a derivative written to the cache directory, evicting old ones to fit."""
+        evicted = []
+        with self._lock:
+            self._total_bytes += file_size - self._files.pop(name, 0)
+            self._files[name] = file_size
+
+            # Never evict the file just added, it is about to be served
+            while self._total_bytes > self.max_bytes and len(self._files) > 1:
+                old_name, old_size = self._files.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_name)
+            self.evictions += len(evicted)
+
+        for old_name in evicted:
+            try:
+                os.remove(self.path_for(old_name))
+            except FileNotFoundError:
+                pass
+
+        if evicted:
+            logging.debug(f"Evicted {len(evicted)} image derivatives")
+
+    def _remove(self, name: str):
+        with self._lock:
+            self._total_bytes -= self._files.pop(name, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Global derivative cache instance
+derivative_cache = DerivativeCache(DERIVATIVE_DIR, DERIVATIVE_CACHE_MAX_BYTES)
@@ -0,0 +1,286 @@
+from datetime import datetime
+from typing import List, Optional, Sequence, Type
+
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel
+
+from weatherbox.archive import archive, query_raw
+from weatherbox.models import from_millis, to_millis
+from weatherbox.rollups import (
+    RESOLUTIONS,
+    choose_resolution,
+    parse_timestamp,
+    resolve_range,
+    rollup_means,
+    to_model,
+    value_fields,
+)
+
+# LTTB picks from at most this many times limit candidate points
+LTTB_OVERSAMPLING = 10
+
+
+def query_buckets(
+    session: Session,
+    model_class: Type[SQLModel],
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+    limit: int,
+) -> List[dict]:
+    """
+    Split the time range into exactly limit equal buckets and get the count, min,
+    max and mean of every field in each, computed in SQL.
+    Reads from the coarsest rollup whose buckets each fall inside a single bucket,
+    and the raw rows, archived ones included, for the rest of the range.
+    """
+    time_range = resolve_range(session, model_class, start_dt, end_dt)
+    if time_range is None or limit < 1:
+        return []
+
+    start, end = map(parse_timestamp, time_range)
+    width = max((end - start).total_seconds() / limit, 1e-3)
+    fields = value_fields(model_class)
+
+    rows = []
+    raw_start = to_millis(start)
+    resolution = _aligned_resolution(raw_start, width)
+    if resolution is not None:
+        # Only rollup buckets wholly inside the range, the rest is read from raw rows
+        millis = resolution * 1000
+        raw_start += (to_millis(end) + 1 - raw_start) // millis * millis
+        rows += _aggregate_rollups(
+            session, model_class, resolution, start, raw_start, width, limit
+        )
+
+    if raw_start <= to_millis(end):
+        rows += _aggregate_raw(
+            session, model_class, fields, start, raw_start, end, width, limit
+        )
+        rows += _aggregate_archived(
+            model_class, fields, start, raw_start, end, width, limit
+        )
+
+    buckets = [
+        {
+            "timestamp": datetime.fromtimestamp(
+                start.timestamp() + i * width, start.tzinfo
+            ).isoformat(),
+            "count": 0,
+            "min": {},
+            "max": {},
+            "mean": {},
+        }
+        for i in range(limit)
+    ]
+
+    # Combine buckets holding both archived and stored rows
+    aggregates = {}
+    for index, field, count, min_value, max_value, sum_value in rows:
+        if not count:
+            continue
+        key = (min(max(int(index), 0), limit - 1), field)
+        if key in aggregates:
+            previous = aggregates[key]
+            count += previous[0]
+            min_value = min(min_value, previous[1])
+            max_value = max(max_value, previous[2])
+            sum_value += previous[3]
+        aggregates[key] = (count, min_value, max_value, sum_value)
+
+    for (index, field), (count, min_value, max_value, sum_value) in aggregates.items():
+        bucket = buckets[index]
+        bucket["count"] = max(bucket["count"], count)
+        bucket["min"][field] = min_value
+        bucket["max"][field] = max_value
+        bucket["mean"][field] = sum_value / count
+
+    return buckets
+
+
+def _aligned_resolution(start_millis: int, width: float) -> Optional[int]:
+    """
+    Get the coarsest rollup resolution whose buckets never straddle two buckets,
+    as it divides both the bucket width and the start of the range.
+    """
+    width_millis = width * 1000
+    if not width_millis.is_integer():
+        return None
+
+    for resolution in reversed(RESOLUTIONS):
+        millis = resolution * 1000
+        if int(width_millis) % millis == 0 and start_millis % millis == 0:
+            return resolution
+    return None
+
+
+def _aggregate_rollups(
+    session, model_class, resolution, start, rollups_end, width, limit
+):
+    result = session.connection().execute(
+        text("""
+            SELECT
+                MIN(CAST((bucket - :start) / :width AS INTEGER), :last),
+                field,
+                SUM(count),
+                MIN(min_value),
+                MAX(max_value),
+                SUM(sum_value)
+            FROM sensorrollup
+            WHERE sensor = :sensor AND resolution = :resolution
+                AND bucket >= :start AND bucket < :rollups_end
+            GROUP BY 1, field
+            """),
+        {
+            "sensor": model_class.__tablename__,
+            "resolution": resolution,
+            "start": to_millis(start),
+            "rollups_end": rollups_end,
+            "width": width * 1000,
+            "last": limit - 1,
+        },
+    )
+    return result.all()
+
+
+def _aggregate_raw(session, model_class, fields, start, raw_start, end, width, limit):
+    aggregates = ", ".join(
+        f"COUNT({field}), MIN({field}), MAX({field}), SUM({field})" for field in fields
+    )
+    result = session.connection().execute(
+        text(f"""
+            SELECT
+                MIN(CAST((timestamp - :start) / :width AS INTEGER), :last),
+                {aggregates}
+            FROM {model_class.__tablename__}
+            WHERE timestamp >= :raw_start AND timestamp <= :end
+            GROUP BY 1
+            """),
+        {
+            "start": to_millis(start),
+            "raw_start": raw_start,
+            "end": to_millis(end),
+            "width": width * 1000,
+            "last": limit - 1,
+        },
+    )
+
+    # Reshape into the same one-row-per-field layout as the rollup query
+    return [
+        (row[0], field, *row[1 + i * 4 : 5 + i * 4])
+        for row in result.all()
+        for i, field in enumerate(fields)
+    ]
+
+
+def _aggregate_archived(model_class, fields, start, raw_start, end, width, limit):
+    """Aggregate archived raw rows into the same layout as the SQL queries."""
+    aggregates = {}
+    start_millis = to_millis(start)
+    for row in archive.read_rows(model_class, from_millis(raw_start), end.isoformat()):
+        index = min(
+            int((to_millis(row.timestamp) - start_millis) / (width * 1000)), limit - 1
+        )
+        for field in fields:
+            value = getattr(row, field)
+            if value is None:
+                continue
+            aggregate = aggregates.get((index, field))
+            if aggregate is None:
+                aggregates[(index, field)] = [1, value, value, value]
+            else:
+                aggregate[0] += 1
+                aggregate[1] = min(aggregate[1], value)
+                aggregate[2] = max(aggregate[2], value)
+                aggregate[3] += value
+
+    return [
+        (index, field, *aggregate) for (index, field), aggregate in aggregates.items()
+    ]
+
+
+def query_lttb(
+    session: Session,
+    model_class: Type[SQLModel],
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+    limit: int,
+) -> Sequence[SQLModel]:
+    """
+    Pick limit points that preserve the visual shape of the data using
+    Largest-Triangle-Three-Buckets, from a candidate set of raw rows or rollup means.
+    """
+    candidates_limit = limit * LTTB_OVERSAMPLING
+    resolution = choose_resolution(
+        session, model_class, start_dt, end_dt, candidates_limit
+    )
+    # Nullable fields are left out of the shape, as older rows have no values for them
+    fields = value_fields(model_class, required=True)
+
+    if resolution is None:
+        rows = query_raw(session, model_class, start_dt, end_dt)
+
+        times = [to_millis(row.timestamp) for row in rows]
+        values = [[float(getattr(row, field)) for row in rows] for field in fields]
+        return [rows[i] for i in lttb(times, values, limit)]
+
+    # Only build model instances for the picked buckets, as building them is the slow part
+    buckets = rollup_means(session, model_class, resolution, start_dt, end_dt)
+    times = list(buckets)
+    values = [[buckets[bucket][field] for bucket in times] for field in fields]
+
+    return [
+        to_model(model_class, from_millis(times[i]), buckets[times[i]])
+        for i in lttb(times, values, limit)
+    ]
+
+
+def lttb(times: List[float], values: List[List[float]], threshold: int) -> List[int]:
+    """
+    Get the indexes of threshold points picked with Largest-Triangle-Three-Buckets.
+    values holds one series per field. Every series is normalized to 0-1 and the
+    triangle areas are summed across them, so a spike in any one field is kept.
+    """
+    n = len(times)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [i * n // threshold for i in range(threshold)]
+
+    x = _normalize(times)
+    ys = [_normalize(series) for series in values]
+
+    sampled = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average point of the next bucket
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / next_count
+        avg_ys = [sum(y[next_start:next_end]) / next_count for y in ys]
+
+        # Point in this bucket forming the largest triangle with a and the average
+        best, best_area = -1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = 0.0
+            for y, avg_y in zip(ys, avg_ys):
+                area += abs(
+                    (x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])
+                )
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(best)
+        a = best
+
+    sampled.append(n - 1)
+
+    return sampled
+
+
+def _normalize(values: List[float]) -> List[float]:
+    low = min(values)
+    span = max(values) - low or 1.0
+    return [(value - low) / span for value in values]
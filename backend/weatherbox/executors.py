@@ -0,0 +1,128 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import logging
+import os
+from threading import Lock
+from typing import Callable, Optional, TypeVar
+
+from weatherbox.db import READ_POOL_SIZE
+
+T = TypeVar("T")
+
+# Run blocking work directly on the event loop, for measuring loop lag without the executors
+INLINE_EXECUTORS = os.getenv("INLINE_EXECUTORS", "false").lower() == "true"
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# SQLite only allows one writer at a time, so a single thread serializes all writes
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+# One thread per pooled read connection, so readers never wait on the pool
+read_executor = ThreadPoolExecutor(
+    max_workers=READ_POOL_SIZE, thread_name_prefix="db-read"
+)
+_image_executor: Optional[ProcessPoolExecutor] = None
+# Reached from the event loop and worker threads, so only one pool is ever created
+_image_executor_lock = Lock()
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """Get the process pool used for image decoding and encoding, creating it on first use."""
+    global _image_executor
+    with _image_executor_lock:
+        if _image_executor is None:
+            _image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        return _image_executor
+
+
+async def _run(executor: Executor, func: Callable[..., T], *args, **kwargs) -> T:
+    if INLINE_EXECUTORS:
+        return func(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+async def run_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking database call on the database thread."""
+    return await _run(db_executor, func, *args, **kwargs)
+
+
+async def run_read(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking database read on the read thread pool."""
+    return await _run(read_executor, func, *args, **kwargs)
+
+
+async def run_image(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a CPU-bound image call on the image process pool.
+    The function and its arguments must be picklable.
+    """
+    return await _run(get_image_executor(), func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """Wait for pending work and shut down the executors."""
+    global _image_executor
+    db_executor.shutdown(wait=True)
+    read_executor.shutdown(wait=True)
+    with _image_executor_lock:
+        image_executor, _image_executor = _image_executor, None
+    if image_executor is not None:
+        image_executor.shutdown(wait=True)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a fixed sleep.
+    Any lag is time the loop spent running something else, such as a blocking call.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+            if lag > 0.1:
+                logging.warning(f"Event loop lagged by {lag * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        """Get loop lag statistics in milliseconds over the recent window."""
+        samples = list(self.samples)
+        return {
+            "inline_executors": INLINE_EXECUTORS,
+            "current_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+            "mean_ms": (
+                round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0
+            ),
+            "window_max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+# Global loop lag monitor instance
+loop_lag_monitor = LoopLagMonitor()
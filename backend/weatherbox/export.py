@@ -0,0 +1,78 @@
+import csv
+import io
+from itertools import chain
+import json
+from typing import Iterator, Literal, Optional, Type
+
+from sqlmodel import SQLModel, select
+
+from weatherbox.archive import archive
+from weatherbox.db import get_read_session
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Rows fetched from the cursor, and written per response chunk, at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_values(
+    model_class: Type[SQLModel], start_dt: Optional[str], end_dt: Optional[str]
+) -> Iterator[tuple]:
+    """
+    Yield the column values of every raw row of a sensor model within a time range,
+    archived ones first, in time order.
+    Stored rows are read through a server-side cursor in batches rather than all at once.
+    """
+    yield from archive.iter_values(model_class, start_dt, end_dt)
+
+    table = model_class.__table__
+    query = select(table)
+    if start_dt:
+        query = query.where(table.c.timestamp >= start_dt)
+    if end_dt:
+        query = query.where(table.c.timestamp <= end_dt)
+
+    with get_read_session() as session:
+        result = (
+            session.connection()
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+            .execute(query.order_by(table.c.timestamp))
+        )
+        yield from archive.without_archived(
+            model_class, chain.from_iterable(result.partitions())
+        )
+
+
+def export_chunks(
+    model_class: Type[SQLModel],
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+    format: ExportFormat,
+) -> Iterator[str]:
+    """Yield a sensor model's rows within a time range as NDJSON or CSV text chunks."""
+    names = [column.name for column in model_class.__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if format == "csv":
+        writer.writerow(names)
+
+    for i, values in enumerate(export_values(model_class, start_dt, end_dt), 1):
+        if format == "csv":
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(names, values))))
+            buffer.write("\n")
+
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
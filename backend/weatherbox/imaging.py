@@ -0,0 +1,80 @@
+import io
+import os
+import sys
+import time
+from typing import Tuple
+
+from PIL import Image
+
+SIZES = {
+    "small": (320, 240),
+    "medium": (640, 480),
+    "large": (1280, 960),
+}
+
+# Final resampling step shrinks by at least this factor, see Image.thumbnail
+REDUCING_GAP = 2.0
+
+
+def resize_and_encode(
+    path: str, size: Tuple[int, int], format: str, quality: int
+) -> bytes:
+    """
+    Resize an image file to fit within size, keeping its aspect ratio, and encode
+    it in the given format.
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale where that stays at least
+    REDUCING_GAP times larger than the result, so small sizes decode a fraction
+    of the pixels.
+    Kept free of app imports so it can run in a worker process.
+    """
+    with Image.open(path) as img:
+        img.thumbnail(size, reducing_gap=REDUCING_GAP)
+
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format=format, quality=quality, optimize=True)
+        return img_buffer.getvalue()
+
+
+def render_derivative(
+    path: str, dest: str, size: Tuple[int, int], format: str, quality: int
+) -> int:
+    """
+    Resize and encode an image file into dest, written atomically so a partly
+    written file is never served. Returns the size of the written file.
+    """
+    tmp_dest = f"{dest}.{os.getpid()}.tmp"
+    with open(tmp_dest, "wb") as file:
+        file.write(resize_and_encode(path, size, format, quality))
+    os.replace(tmp_dest, dest)
+
+    return os.path.getsize(dest)
+
+
+def _full_decode_resize(path: str, size: Tuple[int, int], format: str, quality: int):
+    """The previous resize, decoding the full image first, for comparison."""
+    with Image.open(path) as img:
+        img = img.resize(size)
+
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format=format, quality=quality, optimize=True)
+        return img_buffer.getvalue()
+
+
+def _benchmark(path: str, runs: int = 10):
+    """Print the CPU time per request of the previous and current resize for every size."""
+    for name, size in SIZES.items():
+        for label, func in (
+            ("full", _full_decode_resize),
+            ("draft", resize_and_encode),
+        ):
+            start = time.process_time()
+            for _ in range(runs):
+                func(path, size, "jpeg", 80)
+            per_request = (time.process_time() - start) / runs * 1000
+            print(f"{name:>6} {label:>5}: {per_request:7.1f} ms CPU per request")
+
+
+if __name__ == "__main__":
+    # Compare resize CPU time on a still, e.g. python -m weatherbox.imaging images/still.jpg
+    for path in sys.argv[1:]:
+        _benchmark(path)
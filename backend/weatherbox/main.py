@@ -1,6 +1,6 @@
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 import psutil
@@ -8,24 +8,34 @@ import uvicorn
 
 from weatherbox.sensors.Sensor import Sensor
 from weatherbox.sensor_manager import sensor_manager
+from weatherbox.sensors.i2c_manager import i2c_manager
 from weatherbox.scheduler import (
     initialize_and_start_scheduler,
     shutdown_scheduler,
     get_interval,
 )
 from weatherbox.timelapse import TIMELAPSE_DISABLED
-from weatherbox.camera.stream import generate_frames
+from weatherbox.executors import loop_lag_monitor, shutdown_executors
+from weatherbox.derivatives import derivative_cache
+from weatherbox.renders import timelapse_renderer
+from weatherbox.camera.arducam import camera_session
+from weatherbox.camera.stream import ProfileName, generate_frames, mjpeg_stream
 from weatherbox.routes.sensors import router as sensors
 from weatherbox.routes.images import router as images
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
+    loop_lag_monitor.start()
     # Initialize sensors and start scheduler
     await initialize_and_start_scheduler()
     yield
     # Shutdown scheduler and sensors
     await shutdown_scheduler()
+    await mjpeg_stream.stop()
+    await timelapse_renderer.stop()
+    await loop_lag_monitor.stop()
+    shutdown_executors()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -52,9 +62,15 @@ def health_check():
 
 
 @app.get("/mjpeg")
-async def mjpeg():
+async def mjpeg(
+    profile: ProfileName = Query(
+        "high",
+        description="Stream profile (high for 1080p, low for 480p, adaptive to step down when the client falls behind)",
+    ),
+):
     return StreamingResponse(
-        generate_frames(), media_type="multipart/x-mixed-replace; boundary=frame"
+        generate_frames(profile),
+        media_type="multipart/x-mixed-replace; boundary=frame",
     )
 
 
@@ -70,6 +86,11 @@ def get_system_stats():
         "uptime": psutil.boot_time(),
         "fan_rpm": psutil.sensors_fans()["pwmfan"][0][1],
         "cpu_temperature": psutil.sensors_temperatures()["cpu_thermal"][0][1],
+        "loop_lag": loop_lag_monitor.stats(),
+        "image_cache": derivative_cache.stats(),
+        "camera": camera_session.status(),
+        "stream": mjpeg_stream.stats(),
+        "i2c": i2c_manager.stats(),
     }
 
 
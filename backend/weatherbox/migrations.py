@@ -0,0 +1,100 @@
+import logging
+import sys
+
+from sqlalchemy import Engine, Table, create_engine
+from sqlmodel import SQLModel
+
+from weatherbox.models import *
+
+# Epoch milliseconds of an ISO timestamp column, exact to the millisecond
+_ISO_TO_MILLIS = (
+    "CAST(strftime('%s', timestamp) AS INTEGER) * 1000"
+    " + CAST(substr(strftime('%f', timestamp), 4) AS INTEGER)"
+)
+
+
+def migrate(engine: Engine):
+    """
+    Bring a database up to the current schema, creating it if it does not exist.
+    Tables with ISO string timestamps are rewritten with integer epoch milliseconds,
+    new nullable columns are added, and rollups in an older layout are dropped so
+    they are backfilled again.
+    """
+    migrated = False
+
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            columns = {
+                row[1]: row[2]
+                for row in connection.exec_driver_sql(
+                    f"PRAGMA table_info({table.name})"
+                )
+            }
+            if not columns:
+                continue
+
+            if table.name == SensorRollup.__tablename__:
+                if "id" in columns:
+                    logging.info("Dropping rollups in old layout")
+                    connection.exec_driver_sql(f"DROP TABLE {table.name}")
+                    migrated = True
+            elif columns.get("timestamp", "INTEGER").upper() != "INTEGER":
+                _migrate_timestamps(connection, table, columns)
+                migrated = True
+            else:
+                _add_columns(connection, table, columns)
+
+    SQLModel.metadata.create_all(engine)
+
+    # Add indexes introduced after a table was created
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+    if migrated:
+        # Reclaim the space freed by the smaller rows
+        with engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+
+
+def _add_columns(connection, table: Table, existing: dict):
+    """Add nullable columns introduced after a table was created."""
+    for column in table.columns:
+        if column.name in existing or not column.nullable:
+            continue
+
+        logging.info(f"Adding {table.name}.{column.name}")
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+        )
+
+
+def _migrate_timestamps(connection, table: Table, existing: dict):
+    logging.info(f"Migrating {table.name} timestamps to epoch milliseconds")
+
+    indexes = connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master"
+        " WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table.name,),
+    ).all()
+    for (index,) in indexes:
+        connection.exec_driver_sql(f"DROP INDEX {index}")
+
+    connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {table.name}_old")
+    table.create(connection)
+
+    columns = [column.name for column in table.columns if column.name in existing]
+    values = [_ISO_TO_MILLIS if column == "timestamp" else column for column in columns]
+    connection.exec_driver_sql(
+        f"INSERT INTO {table.name} ({', '.join(columns)})"
+        f" SELECT {', '.join(values)} FROM {table.name}_old"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {table.name}_old")
+
+
+if __name__ == "__main__":
+    # Migrate database files without starting the app, e.g. python -m weatherbox.migrations weatherbox-prod.db
+    logging.basicConfig(level=logging.INFO)
+    for path in sys.argv[1:]:
+        migrate(create_engine(f"sqlite:///{path}"))
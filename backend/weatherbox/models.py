@@ -1,14 +1,52 @@
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
 
+from sqlalchemy import Index, Integer, TypeDecorator
 from sqlmodel import Field, SQLModel
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_millis(timestamp: Union[str, datetime]) -> int:
+    """Convert an ISO timestamp to integer epoch milliseconds, treating naive timestamps as UTC."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_millis(millis: int) -> str:
+    """Convert integer epoch milliseconds to a UTC ISO timestamp."""
+    return (EPOCH + timedelta(milliseconds=millis)).isoformat()
+
+
+class EpochMillis(TypeDecorator):
+    """
+    Timestamp stored as integer epoch milliseconds and exposed as a UTC ISO string.
+    Compared values are converted too, so Z, +00:00 and other offsets filter correctly.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return to_millis(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_millis(value)
+
 
 # https://www.sparkfun.com/sparkfun-lightning-detector-as3935.html
 class AS3935(SQLModel, table=True):
     """Timestamped AS3935 lightning detector data."""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, index=True, nullable=False)
     distance: int = Field(nullable=False)
     energy: int = Field(nullable=False)
 
@@ -18,7 +56,7 @@ class AS7341(SQLModel, table=True):
     """Timestamped AS7341 spectrometer data."""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, index=True, nullable=False)
     violet: float = Field(nullable=False)
     indigo: float = Field(nullable=False)
     blue: float = Field(nullable=False)
@@ -36,7 +74,7 @@ class BME688(SQLModel, table=True):
     """Timestamped BME688 data with temperature, humidity, pressure, gas, and altitude."""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, index=True, nullable=False)
     temperature: float = Field(nullable=False)
     humidity: float = Field(nullable=False)
     pressure: float = Field(nullable=False)
@@ -49,7 +87,7 @@ class ENS160(SQLModel, table=True):
     """Timestamped ENS160 MOX gas sensor data."""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, index=True, nullable=False)
     aqi: float = Field(nullable=False)
     tvoc: float = Field(nullable=False)
     eco2: float = Field(nullable=False)
@@ -60,7 +98,7 @@ class LTR390(SQLModel, table=True):
     """Timestamped LTR390 UV sensor data."""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, index=True, nullable=False)
     uvs: float = Field(nullable=False)
     # uvi: float = Field(nullable=False)
     light: float = Field(nullable=False)
@@ -72,7 +110,7 @@ class SPS30(SQLModel, table=True):
     """Timestamped SPS30 particulate matter sensor data."""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, index=True, nullable=False)
     pm10: float = Field(nullable=False)
     pm25: float = Field(nullable=False)
     pm40: float = Field(nullable=False)
@@ -83,11 +121,48 @@ class SPS30(SQLModel, table=True):
     nc40: float = Field(nullable=False)
     nc100: float = Field(nullable=False)
     typical_particle_size: float = Field(nullable=False)
+    # The values above are means of the samples acquired between stored rows,
+    # these their maximums, so short peaks are kept. Null in rows stored before.
+    pm10_max: Optional[float] = Field(default=None)
+    pm25_max: Optional[float] = Field(default=None)
+    pm40_max: Optional[float] = Field(default=None)
+    pm100_max: Optional[float] = Field(default=None)
+    nc05_max: Optional[float] = Field(default=None)
+    nc10_max: Optional[float] = Field(default=None)
+    nc25_max: Optional[float] = Field(default=None)
+    nc40_max: Optional[float] = Field(default=None)
+    nc100_max: Optional[float] = Field(default=None)
+    typical_particle_size_max: Optional[float] = Field(default=None)
 
 
 class TimelapseImage(SQLModel, table=True):
     """An image from a timelapse."""
 
+    # Covers listing and counting images by time range without reading the table
+    __table_args__ = (
+        Index("ix_timelapseimage_timestamp_file_name", "timestamp", "file_name"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: str = Field(index=True, nullable=False)
+    timestamp: str = Field(sa_type=EpochMillis, nullable=False)
     file_name: str = Field(max_length=255, nullable=False)
+
+
+class SensorRollup(SQLModel, table=True):
+    """Count, min, max and sum of one sensor field over a fixed time bucket."""
+
+    # Clustered on the primary key, so bucket range scans read only the table itself
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    sensor: str = Field(primary_key=True)
+    resolution: int = Field(primary_key=True)
+    bucket: str = Field(sa_type=EpochMillis, primary_key=True)
+    field: str = Field(primary_key=True)
+    count: int = Field(nullable=False)
+    min_value: float = Field(nullable=False)
+    max_value: float = Field(nullable=False)
+    sum_value: float = Field(nullable=False)
+
+
+# Models of timestamped sensor readings
+SENSOR_MODELS = [AS3935, AS7341, BME688, ENS160, LTR390, SPS30]
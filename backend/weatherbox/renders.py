@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
+
+from sqlmodel import col, func, select
+from starlette.concurrency import run_in_threadpool
+
+from weatherbox.db import get_read_session
+from weatherbox.executors import run_image
+from weatherbox.imaging import SIZES
+from weatherbox.models import TimelapseImage
+from weatherbox.storage import ImageStorage, image_storage
+from weatherbox.video import (
+    MAX_AVI_BYTES,
+    VideoTooLargeError,
+    estimate_video_bytes,
+    render_video,
+)
+
+VIDEO_DIR = os.getenv("VIDEO_DIR", "videos")
+# Rendered videos kept on disk, the least recently rendered go first
+VIDEO_CACHE_MAX_FILES = int(os.getenv("VIDEO_CACHE_MAX_FILES", "20"))
+VIDEO_QUALITY = 85
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+
+
+class RenderJob:
+    """A timelapse video render, identified by the frames and settings it renders."""
+
+    def __init__(self, id: str, frames: int, status: JobStatus = "queued"):
+        self.id = id
+        self.frames = frames
+        self.status: JobStatus = status
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = time.time() if status == "done" else None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "frames": self.frames,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+def select_frames(
+    start_date: Optional[datetime], end_date: Optional[datetime], max_frames: int
+) -> List[str]:
+    """
+    Get the file names of the images in a range, oldest first, decimated to at
+    most max_frames evenly spaced ones the same way as decimate.
+    The images are counted first and decimated in SQL, so only the chosen names are read.
+    """
+    in_range = []
+    if start_date:
+        in_range.append(TimelapseImage.timestamp >= start_date)
+    if end_date:
+        in_range.append(TimelapseImage.timestamp <= end_date)
+
+    numbered = (
+        select(
+            TimelapseImage.file_name,
+            (func.row_number().over(order_by=TimelapseImage.timestamp) - 1).label(
+                "position"
+            ),
+        )
+        .where(*in_range)
+        .subquery()
+    )
+    query = select(numbered.c.file_name).order_by(numbered.c.position)
+
+    if max_frames < 1:
+        return []
+
+    with get_read_session() as session:
+        total = session.exec(
+            select(func.count(col(TimelapseImage.id))).where(*in_range)
+        ).one()
+        if total > max_frames:
+            # Keep position p only if it is i * total // max_frames for some frame i
+            frame = (numbered.c.position * max_frames + total - 1) // total
+            query = query.where(frame * total // max_frames == numbered.c.position)
+
+        return list(session.exec(query.execution_options(yield_per=1000)))
+
+
+def decimate(items: list, count: int) -> list:
+    """Pick count evenly spaced items, keeping the first, or all of them if there are fewer."""
+    if len(items) <= count:
+        return list(items)
+    return [items[i * len(items) // count] for i in range(count)]
+
+
+class TimelapseRenderer:
+    """
+    Renders timelapse videos from stored images in the background, one at a time
+    so renders never take over the image process pool.
+    Videos are cached on disk by their frames and settings, so the same request
+    returns the finished video again without rendering.
+    """
+
+    def __init__(self, directory: str, storage: ImageStorage, max_files: int):
+        self.directory = directory
+        self.storage = storage
+        self.max_files = max_files
+        self.jobs: Dict[str, RenderJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(1)
+
+    @staticmethod
+    def job_id_for(file_names: List[str], size: str, fps: int) -> str:
+        digest = hashlib.sha256(f"{size}:{fps}:{VIDEO_QUALITY}".encode())
+        for name in file_names:
+            digest.update(b"\0" + name.encode())
+        return digest.hexdigest()[:16]
+
+    def path_for(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.avi")
+
+    def render(self, file_names: List[str], size: str, fps: int) -> RenderJob:
+        """
+        Start rendering a video of the given images, or get the job already rendering it.
+        Raises VideoTooLargeError if the video could outgrow an AVI file.
+        """
+        if estimate_video_bytes(len(file_names), SIZES[size]) > MAX_AVI_BYTES:
+            raise VideoTooLargeError(
+                f"{len(file_names)} {size} frames could exceed the {MAX_AVI_BYTES} byte AVI limit"
+            )
+
+        job_id = self.job_id_for(file_names, size, fps)
+
+        job = self.jobs.get(job_id)
+        if job is not None and job.status != "failed":
+            return job
+
+        if os.path.exists(self.path_for(job_id)):
+            job = RenderJob(job_id, len(file_names), "done")
+            self.jobs[job_id] = job
+            return job
+
+        job = RenderJob(job_id, len(file_names))
+        self.jobs[job_id] = job
+        self._tasks[job_id] = asyncio.create_task(
+            self._render(job, file_names, size, fps)
+        )
+        return job
+
+    async def _render(self, job: RenderJob, file_names: List[str], size: str, fps: int):
+        try:
+            paths = await run_in_threadpool(self._find_images, file_names)
+            async with self._semaphore:
+                job.status = "running"
+                logging.info(
+                    f"Rendering timelapse video {job.id} of {len(paths)} images"
+                )
+                os.makedirs(self.directory, exist_ok=True)
+                job.frames = await run_image(
+                    render_video,
+                    paths,
+                    self.path_for(job.id),
+                    SIZES[size],
+                    fps,
+                    VIDEO_QUALITY,
+                )
+            job.status = "done"
+            self._prune()
+        except Exception as e:
+            logging.error(f"Failed to render timelapse video {job.id}: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            del self._tasks[job.id]
+
+    def _find_images(self, file_names: List[str]) -> List[str]:
+        paths = [self.storage.find(name) for name in file_names]
+        return [path for path in paths if path is not None]
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        job = self.jobs.get(job_id)
+        if job is None and os.path.exists(self.path_for(job_id)):
+            # Rendered before a restart
+            job = RenderJob(job_id, 0, "done")
+        return job
+
+    def _prune(self):
+        """Remove the oldest videos beyond max_files, along with their jobs."""
+        videos = sorted(
+            (entry.stat().st_mtime, entry.name)
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".avi")
+        )
+        for _, name in videos[: max(len(videos) - self.max_files, 0)]:
+            os.remove(os.path.join(self.directory, name))
+            self.jobs.pop(name.removesuffix(".avi"), None)
+
+    async def stop(self):
+        """Cancel running renders, such as on shutdown."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+# Global timelapse renderer instance
+timelapse_renderer = TimelapseRenderer(VIDEO_DIR, image_storage, VIDEO_CACHE_MAX_FILES)
@@ -0,0 +1,336 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Type
+
+from sqlalchemy import Integer, text, type_coerce
+from sqlmodel import Session, SQLModel, col, func, select
+
+from weatherbox.archive import archive
+from weatherbox.models import SENSOR_MODELS, SensorRollup, from_millis, to_millis
+
+# Bucket sizes in seconds, finest first
+RESOLUTIONS = [60, 15 * 60, 60 * 60, 24 * 60 * 60]
+# Largest factor between one resolution and the next coarser one
+RESOLUTION_STEP = max(
+    coarser // finer for finer, coarser in zip(RESOLUTIONS, RESOLUTIONS[1:])
+)
+
+ROLLUP_MODELS: List[Type[SQLModel]] = SENSOR_MODELS
+_ROLLUP_TABLES = {model_class.__tablename__ for model_class in ROLLUP_MODELS}
+
+_UPSERT = text("""
+    INSERT INTO sensorrollup
+        (sensor, resolution, bucket, field, count, min_value, max_value, sum_value)
+    VALUES
+        (:sensor, :resolution, :bucket, :field, :count, :min_value, :max_value, :sum_value)
+    ON CONFLICT (sensor, resolution, bucket, field) DO UPDATE SET
+        count = count + excluded.count,
+        min_value = min(min_value, excluded.min_value),
+        max_value = max(max_value, excluded.max_value),
+        sum_value = sum_value + excluded.sum_value
+    """)
+
+
+def value_fields(model_class: Type[SQLModel], required: bool = False) -> List[str]:
+    """
+    Get the names of the measured columns of a sensor model, or with required
+    only those no row leaves null.
+    """
+    return [
+        column.name
+        for column in model_class.__table__.columns
+        if column.name not in ("id", "timestamp") and not (required and column.nullable)
+    ]
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Parse an ISO timestamp, treating naive timestamps as UTC."""
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def bucket_millis(timestamp: str, resolution: int) -> int:
+    """Get the epoch milliseconds of the start of the bucket containing a timestamp."""
+    millis = to_millis(timestamp)
+    return millis - millis % (resolution * 1000)
+
+
+def bucket_start(timestamp: str, resolution: int) -> str:
+    """Get the ISO timestamp of the start of the bucket containing a timestamp."""
+    return from_millis(bucket_millis(timestamp, resolution))
+
+
+def update_rollups(session: Session, samples: Iterable[SQLModel]):
+    """
+    Fold new samples into the rollup tables.
+    Runs in the caller's transaction so samples and rollups are committed together.
+    """
+    aggregates: Dict[Tuple[str, int, int, str], List[float]] = {}
+    fields_by_table: Dict[str, List[str]] = {}
+
+    for sample in samples:
+        table = sample.__tablename__
+        if table not in _ROLLUP_TABLES:
+            continue
+
+        if table not in fields_by_table:
+            fields_by_table[table] = value_fields(type(sample))
+
+        for resolution in RESOLUTIONS:
+            bucket = bucket_millis(sample.timestamp, resolution)
+            for field in fields_by_table[table]:
+                value = getattr(sample, field)
+                if value is None:
+                    continue
+                key = (table, resolution, bucket, field)
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregates[key] = [1, value, value, value]
+                else:
+                    aggregate[0] += 1
+                    aggregate[1] = min(aggregate[1], value)
+                    aggregate[2] = max(aggregate[2], value)
+                    aggregate[3] += value
+
+    if not aggregates:
+        return
+
+    session.connection().execute(
+        _UPSERT,
+        [
+            {
+                "sensor": table,
+                "resolution": resolution,
+                "bucket": bucket,
+                "field": field,
+                "count": count,
+                "min_value": min_value,
+                "max_value": max_value,
+                "sum_value": sum_value,
+            }
+            for (table, resolution, bucket, field), (
+                count,
+                min_value,
+                max_value,
+                sum_value,
+            ) in aggregates.items()
+        ],
+    )
+
+
+def backfill_rollups(session: Session):
+    """
+    Build rollups from raw rows for any sensor that has data but no rollups yet,
+    such as databases created before rollups existed.
+    """
+    for model_class in ROLLUP_MODELS:
+        table = model_class.__tablename__
+
+        has_rollups = session.exec(
+            select(SensorRollup.sensor).where(SensorRollup.sensor == table).limit(1)
+        ).first()
+        has_rows = session.exec(select(model_class.id).limit(1)).first()
+        if has_rollups is not None or has_rows is None:
+            continue
+
+        logging.info(f"Backfilling rollups for {table}")
+        for resolution in RESOLUTIONS:
+            for field in value_fields(model_class):
+                session.connection().execute(
+                    text(f"""
+                    INSERT INTO sensorrollup
+                        (sensor, resolution, bucket, field, count, min_value, max_value, sum_value)
+                    SELECT
+                        :sensor,
+                        :resolution,
+                        timestamp / (:resolution * 1000) * (:resolution * 1000) AS rollup_bucket,
+                        :field,
+                        COUNT({field}),
+                        MIN({field}),
+                        MAX({field}),
+                        SUM({field})
+                    FROM {table}
+                    WHERE {field} IS NOT NULL
+                    GROUP BY rollup_bucket
+                    """),
+                    {"sensor": table, "resolution": resolution, "field": field},
+                )
+
+        session.commit()
+
+
+def resolve_range(
+    session: Session,
+    model_class: Type[SQLModel],
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+) -> Optional[Tuple[str, str]]:
+    """
+    Fill open ends of a time range from the first and last stored timestamps,
+    including archived ones.
+    Returns None if there is no stored data to fill them from.
+    """
+    if not start_dt or not end_dt:
+        first, last = session.exec(
+            select(func.min(model_class.timestamp), func.max(model_class.timestamp))
+        ).one()
+        archived_first = archive.first_timestamp(model_class.__tablename__)
+        if archived_first is not None:
+            # Archived rows are always older than the ones still in the table
+            last = last or archive.last_timestamp(model_class.__tablename__)
+            first = archived_first
+        if first is None:
+            return None
+        start_dt = start_dt or first
+        end_dt = end_dt or last
+
+    return start_dt, end_dt
+
+
+def choose_resolution(
+    session: Session,
+    model_class: Type[SQLModel],
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+    limit: int,
+    oversampling: int = 1,
+) -> Optional[int]:
+    """
+    Choose the finest rollup resolution whose bucket count fits within
+    limit * oversampling, estimated from the time span so it costs the same
+    however much data there is.
+    Returns None if the raw rows themselves fit within limit.
+    """
+    time_range = resolve_range(session, model_class, start_dt, end_dt)
+    if time_range is None:
+        return None
+    start_dt, end_dt = time_range
+
+    span = (parse_timestamp(end_dt) - parse_timestamp(start_dt)).total_seconds()
+
+    for resolution in RESOLUTIONS:
+        if span // resolution + 1 <= limit * oversampling:
+            break
+    else:
+        return RESOLUTIONS[-1]
+
+    if resolution == RESOLUTIONS[0]:
+        # Small range, so counting the raw rows through the timestamp index is cheap
+        raw_count = session.exec(
+            select(func.count(col(model_class.id))).where(
+                model_class.timestamp >= start_dt, model_class.timestamp <= end_dt
+            )
+        ).one() + archive.count_rows(model_class, start_dt, end_dt)
+        if raw_count <= limit:
+            return None
+
+    return resolution
+
+
+def rollup_means(
+    session: Session,
+    model_class: Type[SQLModel],
+    resolution: int,
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+) -> Dict[int, Dict[str, float]]:
+    """Get the mean of every field per bucket start in epoch milliseconds, in time order."""
+    query = select(
+        # Read the raw integer, only the returned buckets need converting to ISO
+        type_coerce(SensorRollup.bucket, Integer),
+        SensorRollup.field,
+        SensorRollup.sum_value / SensorRollup.count,
+    ).where(
+        SensorRollup.sensor == model_class.__tablename__,
+        SensorRollup.resolution == resolution,
+    )
+    if start_dt:
+        query = query.where(SensorRollup.bucket >= bucket_start(start_dt, resolution))
+    if end_dt:
+        query = query.where(SensorRollup.bucket <= bucket_start(end_dt, 1))
+
+    buckets: Dict[int, Dict[str, float]] = defaultdict(dict)
+    for bucket, field, mean in session.exec(query.order_by(SensorRollup.bucket)):
+        buckets[bucket][field] = mean
+
+    return buckets
+
+
+def to_model(
+    model_class: Type[SQLModel], timestamp: str, values: Dict[str, float]
+) -> SQLModel:
+    """Build a sensor model instance from field means, rounding integer fields."""
+    integer_fields = _integer_fields(model_class)
+    return model_class(
+        timestamp=timestamp,
+        **{
+            field: round(value) if field in integer_fields else value
+            for field, value in values.items()
+        },
+    )
+
+
+def _integer_fields(model_class: Type[SQLModel]) -> Set[str]:
+    return {
+        column.name
+        for column in model_class.__table__.columns
+        if isinstance(column.type, Integer)
+    }
+
+
+def query_rollups(
+    session: Session,
+    model_class: Type[SQLModel],
+    resolution: int,
+    start_dt: Optional[str],
+    end_dt: Optional[str],
+    limit: int,
+) -> Sequence[SQLModel]:
+    """
+    Get bucket means as instances of the sensor model, timestamped at the bucket start.
+    If there are more than limit buckets, runs of adjacent buckets are evenly
+    merged into limit, weighting each by its sample count.
+    """
+    query = select(
+        type_coerce(SensorRollup.bucket, Integer),
+        SensorRollup.field,
+        SensorRollup.count,
+        SensorRollup.sum_value,
+    ).where(
+        SensorRollup.sensor == model_class.__tablename__,
+        SensorRollup.resolution == resolution,
+    )
+    if start_dt:
+        query = query.where(SensorRollup.bucket >= bucket_start(start_dt, resolution))
+    if end_dt:
+        query = query.where(SensorRollup.bucket <= bucket_start(end_dt, 1))
+
+    # Count and sum of every field per bucket start, in time order
+    buckets: Dict[int, Dict[str, Tuple[int, float]]] = defaultdict(dict)
+    for bucket, field, count, sum_value in session.exec(
+        query.order_by(SensorRollup.bucket)
+    ):
+        buckets[bucket][field] = (count, sum_value)
+
+    keys = list(buckets)
+    groups = min(len(keys), limit)
+    rows = []
+    for i in range(groups):
+        merged: Dict[str, List[float]] = {}
+        for bucket in keys[i * len(keys) // groups : (i + 1) * len(keys) // groups]:
+            for field, (count, sum_value) in buckets[bucket].items():
+                total = merged.setdefault(field, [0, 0.0])
+                total[0] += count
+                total[1] += sum_value
+
+        means = {
+            field: sum_value / count for field, (count, sum_value) in merged.items()
+        }
+        rows.append(
+            to_model(model_class, from_millis(keys[i * len(keys) // groups]), means)
+        )
+
+    return rows
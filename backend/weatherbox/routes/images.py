@@ -1,61 +1,294 @@
-from typing import Literal, Optional
-import io
+import asyncio
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import List, Literal, Optional, Tuple
 
-from fastapi import APIRouter, Query, Path
-from fastapi.responses import StreamingResponse
-from sqlmodel import col, func, select
-from PIL import Image
+from fastapi import APIRouter, HTTPException, Query, Path, Request
+from fastapi.responses import FileResponse, Response
+from sqlmodel import col, func, select, tuple_
+from starlette.concurrency import run_in_threadpool
 
-from weatherbox.db import get_session
-from weatherbox.models import TimelapseImage
-from weatherbox.timelapse import IMAGE_DIR
+from weatherbox.cache import image_count_cache
+from weatherbox.db import get_read_session
+from weatherbox.derivatives import derivative_cache
+from weatherbox.executors import run_read
+from weatherbox.models import TimelapseImage, to_millis
+from weatherbox.renders import select_frames, timelapse_renderer
+from weatherbox.storage import image_storage
+from weatherbox.video import VideoTooLargeError
 
 router = APIRouter()
 
 
 @router.get("")
-def get_images(
+async def get_images(
     page: int = Query(1, description="Page number for pagination"),
     limit: int = Query(10, description="Number of evenly spaced data points to return"),
-    start_date: Optional[str] = Query(
+    start_date: Optional[datetime] = Query(
         None, description="Start date in ISO format (e.g., 2024-01-01T00:00:00Z)"
     ),
-    end_date: Optional[str] = Query(
+    end_date: Optional[datetime] = Query(
         None, description="Start date in ISO format (e.g., 2024-01-01T00:00:00Z)"
     ),
+    cursor: Optional[str] = Query(
+        None,
+        description="The next token of a previous response, to get the page after it instead of by number",
+    ),
+    sample: bool = Query(
+        False,
+        description="Return limit images evenly spread over the range instead of a page",
+    ),
 ):
     """
-    Get the list of images captured by the camera.
+    Get the list of images captured by the camera, oldest first.
+    Pages can be requested by number, or by passing the next token of the previous
+    page as the cursor, which costs the same however deep the page is.
+    With sample, the images captured nearest to limit evenly spaced times across
+    the range are returned instead, for an overview of a long range.
     """
-    base_query = select(TimelapseImage)
-
-    if start_date:
-        base_query = base_query.where(TimelapseImage.timestamp >= start_date)
-    if end_date:
-        base_query = base_query.where(TimelapseImage.timestamp <= end_date)
+    if sample:
+        total_count, images = await asyncio.gather(
+            _count_images(start_date, end_date),
+            run_read(_read_sampled_images, start_date, end_date, limit),
+        )
+        return {
+            "total_count": total_count,
+            "total_pages": 1,
+            "page": None,
+            "limit": limit,
+            "images": images,
+            "next": None,
+        }
 
-    session = get_session()
+    after = None
+    if cursor is not None:
+        after = _decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    # Get the total count to calculate sampling interval
-    count_query = select(func.count(col(TimelapseImage.id))).select_from(TimelapseImage)
-    if base_query.whereclause is not None:
-        count_query = count_query.where(base_query.whereclause)
-    total_count = session.exec(count_query).all()[0]
-
-    query = base_query.offset((page - 1) * limit).limit(limit)
-    images = session.exec(query).all()
+    total_count, images = await asyncio.gather(
+        _count_images(start_date, end_date),
+        run_read(_read_images, start_date, end_date, page, limit, after),
+    )
 
     return {
         "total_count": total_count,
         "total_pages": (total_count + limit - 1) // limit,  # Ceiling division
-        "page": page,
+        "page": page if cursor is None else None,
         "limit": limit,
         "images": images,
+        "next": _encode_cursor(images[-1]) if len(images) == limit else None,
     }
 
 
+def _read_images(
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    page: int,
+    limit: int,
+    after: Optional[Tuple[int, int]],
+) -> List[TimelapseImage]:
+    query = select(TimelapseImage).order_by(
+        col(TimelapseImage.timestamp), col(TimelapseImage.id)
+    )
+    query = _filter_range(query, start_date, end_date)
+
+    if after is not None:
+        # Seeks straight to the cursor on the timestamp index
+        query = query.where(
+            tuple_(col(TimelapseImage.timestamp), col(TimelapseImage.id))
+            > tuple_(*after)
+        )
+    else:
+        query = query.offset((page - 1) * limit)
+
+    with get_read_session() as session:
+        return session.exec(query.limit(limit)).all()
+
+
+def _read_sampled_images(
+    start_date: Optional[datetime], end_date: Optional[datetime], count: int
+) -> List[TimelapseImage]:
+    """
+    Get the images captured nearest to count evenly spaced times between the
+    first and last image in a range, oldest first.
+    Each time costs two seeks on the timestamp index, however many images there are.
+    """
+    bounds_query = select(
+        func.min(TimelapseImage.timestamp), func.max(TimelapseImage.timestamp)
+    )
+    bounds_query = _filter_range(bounds_query, start_date, end_date)
+
+    with get_read_session() as session:
+        first, last = session.exec(bounds_query).one()
+        if first is None or count < 1:
+            return []
+
+        first, last = to_millis(first), to_millis(last)
+        targets = [
+            first + (last - first) * i // max(count - 1, 1) for i in range(count)
+        ]
+
+        # Nearby times can share an image when captures are sparse
+        images = {}
+        for target in targets:
+            image = _nearest_image(session, target)
+            images.setdefault(image.id, image)
+
+    return list(images.values())
+
+
+def _nearest_image(session, target: int) -> TimelapseImage:
+    """Get the image captured nearest to a time in epoch milliseconds, the earlier one on a tie."""
+    before = session.exec(
+        select(TimelapseImage)
+        .where(TimelapseImage.timestamp <= target)
+        .order_by(col(TimelapseImage.timestamp).desc())
+        .limit(1)
+    ).first()
+    after = session.exec(
+        select(TimelapseImage)
+        .where(TimelapseImage.timestamp >= target)
+        .order_by(col(TimelapseImage.timestamp))
+        .limit(1)
+    ).first()
+
+    if before is None or after is None:
+        return before or after
+    if to_millis(after.timestamp) - target < target - to_millis(before.timestamp):
+        return after
+    return before
+
+
+async def _count_images(
+    start_date: Optional[datetime], end_date: Optional[datetime]
+) -> int:
+    """
+    Count the images in a range, cached until an image is captured within it.
+    """
+    cache_key = (
+        to_millis(end_date) if end_date else None,
+        to_millis(start_date) if start_date else None,
+    )
+    cached, generation = image_count_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    total_count = await run_read(_read_image_count, start_date, end_date)
+    image_count_cache.put(cache_key, total_count, generation)
+    return total_count
+
+
+def _read_image_count(
+    start_date: Optional[datetime], end_date: Optional[datetime]
+) -> int:
+    query = select(func.count(col(TimelapseImage.id)))
+    query = _filter_range(query, start_date, end_date)
+
+    with get_read_session() as session:
+        return session.exec(query).one()
+
+
+def _filter_range(query, start_date: Optional[datetime], end_date: Optional[datetime]):
+    if start_date:
+        query = query.where(TimelapseImage.timestamp >= start_date)
+    if end_date:
+        query = query.where(TimelapseImage.timestamp <= end_date)
+    return query
+
+
+def _encode_cursor(image: TimelapseImage) -> str:
+    """Make an opaque next token from the last image of a page."""
+    key = f"{to_millis(image.timestamp)}:{image.id}"
+    return urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Optional[Tuple[int, int]]:
+    """Get the timestamp in epoch milliseconds and ID from a next token, or None if invalid."""
+    try:
+        key = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, image_id = key.split(":")
+        return int(timestamp), int(image_id)
+    except ValueError:
+        return None
+
+
+@router.post("/timelapse")
+async def render_timelapse(
+    start_date: Optional[datetime] = Query(
+        None, description="Start date in ISO format (e.g., 2024-01-01T00:00:00Z)"
+    ),
+    end_date: Optional[datetime] = Query(
+        None, description="End date in ISO format (e.g., 2024-01-01T00:00:00Z)"
+    ),
+    duration: int = Query(
+        10, description="Target video length in seconds", ge=1, le=600
+    ),
+    fps: int = Query(24, description="Frames per second", ge=1, le=60),
+    size: Literal["small", "medium", "large"] = Query(
+        "medium", description="Size of the video frames (small, medium, large)"
+    ),
+):
+    """
+    Start rendering a timelapse video of the images in a range, decimated to
+    fit the target duration. Returns the render job, poll it until done.
+    """
+    file_names = await run_read(select_frames, start_date, end_date, duration * fps)
+    if not file_names:
+        raise HTTPException(status_code=404, detail="No images in range")
+
+    try:
+        job = timelapse_renderer.render(file_names, size, fps)
+    except VideoTooLargeError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{e}, use a smaller size, shorter duration or lower fps",
+        )
+    return job.to_dict()
+
+
+@router.get("/timelapse/{job_id}")
+def get_timelapse_job(
+    job_id: str = Path(
+        ..., description="The ID of the render job", pattern="^[0-9a-f]{16}$"
+    ),
+):
+    """
+    Get the status of a timelapse render job.
+    """
+    job = timelapse_renderer.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Render job not found")
+
+    return job.to_dict()
+
+
+@router.get("/timelapse/{job_id}/video")
+def get_timelapse_video(
+    job_id: str = Path(
+        ..., description="The ID of the render job", pattern="^[0-9a-f]{16}$"
+    ),
+):
+    """
+    Get the video of a finished timelapse render job.
+    """
+    job = timelapse_renderer.get(job_id)
+    if job is None or job.status != "done":
+        raise HTTPException(status_code=404, detail="Video not rendered")
+
+    # Videos are named by their content, so clients can keep them
+    return FileResponse(
+        timelapse_renderer.path_for(job_id),
+        media_type="video/x-msvideo",
+        filename=f"timelapse-{job_id}.avi",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
 @router.get("/{image_id}")
-def get_image(
+async def get_image(
+    request: Request,
     image_id: int = Path(..., description="The ID of the image to get"),
     size: Literal["small", "medium", "large"] = Query(
         "small", description="Size of the image to return (small, medium, large)"
@@ -72,25 +305,57 @@ def get_image(
 ):
     """
     Get a specific image by its ID.
+    Resized images are cached on disk and sent straight from the file.
     """
-    session = get_session()
-    image = session.get(TimelapseImage, image_id)
+    image = await run_read(_get_image_row, image_id)
 
     if not image:
-        return {"error": "Image not found"}, 404
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    source_path = await run_in_threadpool(image_storage.find, image.file_name)
+    if not source_path:
+        raise HTTPException(status_code=404, detail="Image file not found")
+
+    path, stat = await derivative_cache.get(source_path, size, format, quality)
+
+    # Images never change once captured, so clients can keep them
+    response = FileResponse(
+        path,
+        media_type=f"image/{format.lower()}",
+        stat_result=stat,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+    if _not_modified(request, response):
+        return Response(
+            status_code=304,
+            headers={
+                name: response.headers[name]
+                for name in ("etag", "last-modified", "cache-control")
+            },
+        )
+
+    return response
+
+
+def _not_modified(request: Request, response: Response) -> bool:
+    """Check a request's conditional headers against a response's ETag and Last-Modified."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+        return "*" in etags or response.headers["etag"] in etags
 
-    img = Image.open(f"{IMAGE_DIR}/{image.file_name}")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(response.headers["last-modified"]) <= since
 
-    if size == "small":
-        img = img.resize((320, 240))
-    elif size == "medium":
-        img = img.resize((640, 480))
-    elif size == "large":
-        img = img.resize((1280, 960))
+    return False
 
-    # Convert to bytes
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format=format, quality=quality, optimize=True)
-    img_buffer.seek(0)
 
-    return StreamingResponse(img_buffer, media_type=f"image/{format.lower()}")
+def _get_image_row(image_id: int) -> Optional[TimelapseImage]:
+    with get_read_session() as session:
+        return session.get(TimelapseImage, image_id)
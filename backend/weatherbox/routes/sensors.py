@@ -1,10 +1,26 @@
-from typing import Optional, Sequence
+import asyncio
+from datetime import datetime
+from typing import Dict, Literal, Optional, Sequence, Union
 from fastapi import APIRouter, Query
-from sqlmodel import select
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from weatherbox.db import get_session
-from weatherbox.models import AS7341, BME688, ENS160, LTR390, SPS30
+from weatherbox.archive import query_raw
+from weatherbox.cache import sensor_data_cache
+from weatherbox.db import get_read_session
+from weatherbox.export import MEDIA_TYPES, ExportFormat, export_chunks
+from weatherbox.models import (
+    AS7341,
+    BME688,
+    ENS160,
+    LTR390,
+    SPS30,
+    SENSOR_MODELS,
+    to_millis,
+)
+from weatherbox.downsampling import query_buckets, query_lttb
+from weatherbox.executors import run_read
+from weatherbox.rollups import RESOLUTION_STEP, choose_resolution, query_rollups
 from weatherbox.sensor_manager import sensor_manager
 
 router = APIRouter()
@@ -20,52 +36,63 @@ class SensorData(BaseModel):
     sps30: Sequence[SPS30]
 
 
-def _query_sensor_data(model_class, session, start_dt, end_dt, limit=1000):
-    """Query sensor data from the database with evenly spaced sampling."""
-    # First, create a base query with time filters
-    base_query = select(model_class)
-    if start_dt:
-        base_query = base_query.where(model_class.timestamp >= start_dt)
-    if end_dt:
-        base_query = base_query.where(model_class.timestamp <= end_dt)
-
-    # Get the total count to calculate sampling interval
-    count_query = select(model_class.id)
-    if base_query.whereclause is not None:
-        count_query = count_query.where(base_query.whereclause)
-    total_count = len(session.exec(count_query).all())
-
-    if total_count <= limit:
-        # If we have fewer rows than the limit, return all of them
-        return session.exec(base_query).all()
-
-    # Calculate the sampling interval
-    interval = max(1, total_count // limit)
-
-    # Use SQL window function to get evenly spaced rows
-    # We need to use raw SQL for this specific operation
-    where_clause = ""
-    if base_query.whereclause is not None:
-        where_clause = f"WHERE {base_query.whereclause.compile(compile_kwargs={'literal_binds': True})}"
-
-    from sqlalchemy import text
-
-    sql_query = text(
-        f"""
-    WITH numbered_rows AS (
-        SELECT *, ROW_NUMBER() OVER (ORDER BY timestamp) as row_num
-        FROM {model_class.__tablename__}
-        {where_clause}
-    )
-    SELECT * FROM numbered_rows
-    WHERE row_num % {interval} = 0
-    ORDER BY timestamp
-    LIMIT {limit}
+class SensorBucket(BaseModel):
+    """Count, min, max and mean of each sensor field over a time bucket."""
+
+    timestamp: str
+    count: int
+    min: Dict[str, float]
+    max: Dict[str, float]
+    mean: Dict[str, float]
+
+
+class SensorBucketData(BaseModel):
+    """Response model containing bucketed data from all sensors."""
+
+    ltr390: Sequence[SensorBucket]
+    as7341: Sequence[SensorBucket]
+    bme688: Sequence[SensorBucket]
+    ens160: Sequence[SensorBucket]
+    sps30: Sequence[SensorBucket]
+
+
+Downsample = Literal["rollup", "bucket", "lttb"]
+
+EXPORT_MODELS = {
+    model_class.__tablename__: model_class for model_class in SENSOR_MODELS
+}
+ExportSensor = Literal["as3935", "as7341", "bme688", "ens160", "ltr390", "sps30"]
+
+
+def _query_sensor_data(
+    model_class, session, start_dt, end_dt, limit=1000, downsample="rollup"
+):
     """
+    Query sensor data from the database, downsampled to at most limit points.
+    rollup merges the finest rollup that fits into limit points once there are more raw rows than that,
+    bucket returns exactly limit buckets with min/max/mean per field,
+    lttb picks the points that best preserve the shape of the data.
+    """
+    if downsample == "bucket":
+        return query_buckets(session, model_class, start_dt, end_dt, limit)
+    if downsample == "lttb":
+        return query_lttb(session, model_class, start_dt, end_dt, limit)
+
+    # A finer rollup merged down to limit, as the next coarser one can give far fewer points
+    resolution = choose_resolution(
+        session, model_class, start_dt, end_dt, limit, RESOLUTION_STEP
     )
 
-    result = session.exec(sql_query)
-    return result.all()
+    if resolution is not None:
+        return query_rollups(session, model_class, resolution, start_dt, end_dt, limit)
+
+    return query_raw(session, model_class, start_dt, end_dt)
+
+
+def _read_sensor_data(model_class, *args):
+    """Query sensor data in its own read-only session, for running concurrently."""
+    with get_read_session() as session:
+        return _query_sensor_data(model_class, session, *args)
 
 
 @router.get("")
@@ -79,25 +106,87 @@ def get_sensor_status():
     }
 
 
-@router.get("/data", response_model=SensorData)
-def get_sensor_data(
-    start_date: Optional[str] = Query(
+@router.get("/data", response_model=Union[SensorData, SensorBucketData])
+async def get_sensor_data(
+    start_date: Optional[datetime] = Query(
         None, description="Start date in ISO format (e.g., 2024-01-01T00:00:00Z)"
     ),
-    end_date: Optional[str] = Query(
+    end_date: Optional[datetime] = Query(
         None, description="End date in ISO format (e.g., 2024-01-01T23:59:59Z)"
     ),
     limit: int = Query(
-        1000, description="Number of evenly spaced data points to return"
+        1000, description="Number of evenly spaced data points to return", ge=1
     ),
-) -> SensorData:
+    downsample: Downsample = Query(
+        "rollup",
+        description="Downsampling method (rollup, bucket for min/max/mean buckets, lttb)",
+    ),
+) -> Union[SensorData, SensorBucketData]:
     """Get evenly spaced data from all sensors with optional date filtering."""
-    session = get_session()
-
-    return SensorData(
-        ltr390=_query_sensor_data(LTR390, session, start_date, end_date, limit),
-        as7341=_query_sensor_data(AS7341, session, start_date, end_date, limit),
-        bme688=_query_sensor_data(BME688, session, start_date, end_date, limit),
-        ens160=_query_sensor_data(ENS160, session, start_date, end_date, limit),
-        sps30=_query_sensor_data(SPS30, session, start_date, end_date, limit),
+    response_class = SensorBucketData if downsample == "bucket" else SensorData
+    args = (
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        limit,
+        downsample,
+    )
+
+    # Normalized so equivalent dates in other time zones share an entry
+    cache_key = (
+        to_millis(end_date) if end_date else None,
+        (to_millis(start_date) if start_date else None, limit, downsample),
+    )
+    cached, generation = sensor_data_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    ltr390, as7341, bme688, ens160, sps30 = await asyncio.gather(
+        run_read(_read_sensor_data, LTR390, *args),
+        run_read(_read_sensor_data, AS7341, *args),
+        run_read(_read_sensor_data, BME688, *args),
+        run_read(_read_sensor_data, ENS160, *args),
+        run_read(_read_sensor_data, SPS30, *args),
+    )
+
+    response = response_class(
+        ltr390=ltr390,
+        as7341=as7341,
+        bme688=bme688,
+        ens160=ens160,
+        sps30=sps30,
+    )
+    sensor_data_cache.put(cache_key, response, generation)
+
+    return response
+
+
+@router.get("/data/cache")
+def get_sensor_data_cache_stats():
+    """Get the hit, miss and size counters of the /sensors/data response cache."""
+    return sensor_data_cache.stats()
+
+
+@router.get("/export")
+def export_sensor_data(
+    sensor: ExportSensor = Query(..., description="Sensor to export data from"),
+    start_date: Optional[datetime] = Query(
+        None, description="Start date in ISO format (e.g., 2024-01-01T00:00:00Z)"
+    ),
+    end_date: Optional[datetime] = Query(
+        None, description="End date in ISO format (e.g., 2024-01-01T23:59:59Z)"
+    ),
+    format: ExportFormat = Query("ndjson", description="Export format (ndjson, csv)"),
+):
+    """Stream every raw row of a sensor with optional date filtering, archived rows included."""
+    chunks = export_chunks(
+        EXPORT_MODELS[sensor],
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        format,
+    )
+
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{sensor}.{format}"'},
     )
@@ -1,7 +1,15 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import asyncio
 import logging
+from typing import Optional
 
+from weatherbox.archive import ARCHIVE_AFTER_DAYS, archive
+from weatherbox.camera.arducam import camera_session
+from weatherbox.db import get_read_session, get_session, sample_buffer
+from weatherbox.executors import run_db, run_read
+from weatherbox.rollups import backfill_rollups
 from weatherbox.sensor_manager import sensor_manager
+from weatherbox.sensors.Sensor import Sensor
 from weatherbox.timelapse import capture, TIMELAPSE_DISABLED
 
 INTERVALS = {
@@ -11,8 +19,12 @@ INTERVALS = {
     "LTR390": 30,
     "SPS30": 30,
     "timelapse": 60,
+    "archive": 6 * 60 * 60,
+    "camera_health": 5 * 60,
 }
 
+_sensor_initialization: Optional[asyncio.Task] = None
+
 scheduler = AsyncIOScheduler(
     job_defaults={
         "max_instances": 1,
@@ -30,29 +42,68 @@ def get_interval(sensor_name: str) -> int:
     return INTERVALS.get(sensor_name, 30)
 
 
-async def initialize_and_start_scheduler():
+def _backfill_rollups():
+    with get_session() as session:
+        backfill_rollups(session)
+
+
+def _with_session(func, *args):
+    with get_session() as session:
+        return func(session, *args)
+
+
+def _with_read_session(func, *args):
+    with get_read_session() as session:
+        return func(session, *args)
+
+
+async def _archive_old_rows():
     """
-    Initialize all sensors and then start the scheduler with jobs.
-    This ensures all sensors are ready before any sampling begins.
+    Archive old raw rows one day at a time.
+    Rows are read and compressed on a read thread, so the database thread is only
+    held for each day's delete and sample flushes keep running in between.
     """
-    await sensor_manager.initialize_all_sensors()
+    days = await run_read(_with_read_session, archive.pending_days, ARCHIVE_AFTER_DAYS)
+    for model_class, day_start in days:
+        max_id = await run_read(
+            _with_read_session, archive.write_day, model_class, day_start
+        )
+        if max_id is not None:
+            await run_db(
+                _with_session, archive.delete_day, model_class, day_start, max_id
+            )
 
-    scheduler.start()
 
-    for sensor in sensor_manager.sensors:
-        if not sensor.is_ready():
-            continue
+def schedule_sensor(sensor: Sensor):
+    """Start sampling a sensor that has become ready."""
+    interval = get_interval(sensor.name)
 
-        interval = get_interval(sensor.name)
+    scheduler.add_job(
+        sensor.read_and_store,
+        "interval",
+        seconds=interval,
+        id=sensor.name,
+        name=sensor.name,
+        replace_existing=True,
+    )
+    logging.info(f"{sensor.name} scheduled with interval {interval} seconds.")
 
-        scheduler.add_job(
-            sensor.read_and_store,
-            "interval",
-            seconds=interval,
-            id=sensor.name,
-            name=sensor.name,
-        )
-        logging.info(f"{sensor.name} scheduled with interval {interval} seconds.")
+
+async def initialize_and_start_scheduler():
+    """
+    Start the scheduler with jobs and initialize all sensors in the background.
+    Each sensor is scheduled as soon as it is ready, so startup never waits for
+    a slow sensor and sampling never begins before a sensor is ready.
+    """
+    global _sensor_initialization
+
+    await run_db(_backfill_rollups)
+
+    scheduler.start()
+
+    _sensor_initialization = asyncio.create_task(
+        sensor_manager.initialize_all_sensors(on_ready=schedule_sensor)
+    )
 
     if not TIMELAPSE_DISABLED:
         interval = get_interval("timelapse")
@@ -65,6 +116,35 @@ async def initialize_and_start_scheduler():
         )
         logging.info(f"Timelapse capture scheduled with interval {interval} seconds.")
 
+        scheduler.add_job(
+            camera_session.check_health,
+            "interval",
+            seconds=get_interval("camera_health"),
+            id="CameraHealth",
+            name="Camera Health Check",
+        )
+
+    # Make sure buffered samples are written even if sensors stop producing them
+    scheduler.add_job(
+        run_db,
+        "interval",
+        args=[sample_buffer.flush],
+        seconds=sample_buffer.max_age,
+        id="SampleBufferFlush",
+        name="Sample Buffer Flush",
+    )
+
+    if ARCHIVE_AFTER_DAYS > 0:
+        interval = get_interval("archive")
+        scheduler.add_job(
+            _archive_old_rows,
+            "interval",
+            seconds=interval,
+            id="Archive",
+            name="Archive Old Sensor Data",
+        )
+        logging.info(f"Archiving scheduled with interval {interval} seconds.")
+
 
 async def shutdown_scheduler():
     """
@@ -72,5 +152,11 @@ async def shutdown_scheduler():
     """
     logging.info("Shutting down scheduler...")
     scheduler.shutdown()
+    if _sensor_initialization is not None:
+        _sensor_initialization.cancel()
+        await asyncio.gather(_sensor_initialization, return_exceptions=True)
     await sensor_manager.shutdown()
+    camera_session.close()
+    flushed = await run_db(sample_buffer.flush)
+    logging.info(f"Flushed {flushed} buffered samples")
     logging.info("Scheduler and sensors shutdown complete")
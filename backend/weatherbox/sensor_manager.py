@@ -1,6 +1,8 @@
+import asyncio
+from collections import defaultdict
 import logging
 import os
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 
 from weatherbox.sensors.Sensor import Sensor, SensorStatus
 
@@ -9,35 +11,77 @@ from weatherbox.sensors import AS7341, BME688, ENS160, LTR390, SPS30
 I2C_BUS_0 = 0
 I2C_BUS_1 = 1
 
+# Seconds after which a sensor still initializing is reported as warming up
+SENSOR_INIT_TIMEOUT = float(os.getenv("SENSOR_INIT_TIMEOUT", "15"))
+
 
 class SensorManager:
-    def __init__(self):
-        self.sensors: List[Sensor] = [
-            AS7341(I2C_BUS_0),
-            BME688(I2C_BUS_1),
-            ENS160(I2C_BUS_1),
-            LTR390(I2C_BUS_0),
-            SPS30(I2C_BUS_1),
-        ]
-
-    async def initialize_all_sensors(self):
+    def __init__(self, sensors: Optional[List[Sensor]] = None):
+        if sensors is None:
+            sensors = [
+                AS7341(I2C_BUS_0),
+                BME688(I2C_BUS_1),
+                ENS160(I2C_BUS_1),
+                LTR390(I2C_BUS_0),
+                SPS30(I2C_BUS_1),
+            ]
+        self.sensors: List[Sensor] = sensors
+
+    async def initialize_all_sensors(
+        self, on_ready: Optional[Callable[[Sensor], None]] = None
+    ):
         """
-        Initialize all sensors with proper warm-up and configuration.
-        Returns True if all sensors are ready, False otherwise.
+        Initialize all sensors, buses concurrently and the sensors sharing a bus
+        strictly one at a time, each starting once the one before it is ready or
+        has failed. A sensor still initializing after SENSOR_INIT_TIMEOUT seconds
+        is reported as warming up, and the rest of its bus keeps waiting for it.
+        on_ready is called with each sensor as soon as it is ready, so sampling
+        starts without waiting for the other buses.
         """
+        by_bus: Dict[Optional[int], List[Sensor]] = defaultdict(list)
         for sensor in self.sensors:
             if os.getenv(f"{sensor.name.upper()}_DISABLED", "false").lower() == "true":
                 sensor.status = SensorStatus.DISABLED
                 logging.info(f"{sensor.name} is disabled, skipping.")
                 continue
 
-            try:
-                await sensor.initialize()
-            except Exception as e:
-                logging.error(f"Failed to initialize {sensor.name}: {e}")
-                sensor.status = SensorStatus.ERROR
-                sensor.error = str(e)
-                continue
+            sensor.status = SensorStatus.INITIALIZING
+            by_bus[getattr(sensor, "i2c_bus", None)].append(sensor)
+
+        await asyncio.gather(
+            *(self._initialize_bus(sensors, on_ready) for sensors in by_bus.values())
+        )
+
+    async def _initialize_bus(
+        self, sensors: List[Sensor], on_ready: Optional[Callable[[Sensor], None]]
+    ):
+        for sensor in sensors:
+            await self._initialize(sensor, on_ready)
+
+    async def _initialize(
+        self, sensor: Sensor, on_ready: Optional[Callable[[Sensor], None]]
+    ):
+        initialization = asyncio.create_task(sensor.initialize())
+        try:
+            done, _ = await asyncio.wait({initialization}, timeout=SENSOR_INIT_TIMEOUT)
+            if not done:
+                sensor.status = SensorStatus.WARMING_UP
+                logging.warning(
+                    f"{sensor.name} not ready after {SENSOR_INIT_TIMEOUT} seconds,"
+                    " still waiting for it before the next sensor on its bus"
+                )
+            await initialization
+        except asyncio.CancelledError:
+            initialization.cancel()
+            raise
+        except Exception as e:
+            logging.error(f"Failed to initialize {sensor.name}: {e}")
+            sensor.status = SensorStatus.ERROR
+            sensor.error = str(e)
+            return
+
+        if sensor.is_ready() and on_ready is not None:
+            on_ready(sensor)
 
     def get_sensor_status(self) -> Dict[str, str]:
         """Get the status of all sensors."""
@@ -2,6 +2,11 @@ from abc import ABC, abstractmethod
 from enum import Enum
 from typing import Optional
 
+from sqlmodel import SQLModel
+
+from weatherbox.db import sample_buffer
+from weatherbox.executors import run_db
+
 
 class SensorStatus(Enum):
     DISABLED = "disabled"
@@ -70,6 +75,13 @@ class Sensor(ABC):
         """
         pass
 
+    async def store(self, sample: SQLModel):
+        """
+        Queue a sample for writing to the database.
+        Runs on the database thread so a buffer flush never blocks the event loop.
+        """
+        await run_db(sample_buffer.add, sample)
+
     @abstractmethod
     async def read_and_store(self):
         """
@@ -1,4 +1,4 @@
-from weatherbox.db import get_session
+from weatherbox.db import sample_buffer
 from weatherbox.models import AS3935
 
 I2C_ADDRESS = 0x03
@@ -11,6 +11,4 @@ def setup_trigger():
 
 def register_strike(timestamp: str, distance: int, energy: int):
     as3935 = AS3935(timestamp=timestamp, distance=distance, energy=energy)
-    session = get_session()
-    session.add(as3935)
-    session.commit()
+    sample_buffer.add(as3935)
@@ -3,7 +3,7 @@ from typing import NamedTuple
 
 import adafruit_as7341
 
-from weatherbox.db import get_session, utc_timestamp
+from weatherbox.db import utc_timestamp
 from weatherbox.models import AS7341 as AS7341Model
 from weatherbox.sensors.i2c_manager import get_i2c_bus, i2c_manager
 from weatherbox.sensors.Sensor import I2CSensor
@@ -36,7 +36,7 @@ class AS7341(I2CSensor):
         )
 
     async def initialize(self) -> bool:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             self.as7341 = adafruit_as7341.AS7341(
                 get_i2c_bus(self.i2c_bus), self.i2c_address
             )
@@ -45,7 +45,7 @@ class AS7341(I2CSensor):
         return await super().initialize()
 
     async def read(self) -> AS7341Data:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             return AS7341Data(
                 violet=self.as7341.channel_415nm,
                 indigo=self.as7341.channel_445nm,
@@ -75,8 +75,6 @@ class AS7341(I2CSensor):
             clear=data.clear,
             nir=data.nir,
         )
-        session = get_session()
-        session.add(as7341_data)
-        session.commit()
+        await self.store(as7341_data)
 
         logging.info("Sampled AS7341")
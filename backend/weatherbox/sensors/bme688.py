@@ -3,7 +3,7 @@ from typing import NamedTuple
 
 import adafruit_bme680
 
-from weatherbox.db import get_session, utc_timestamp
+from weatherbox.db import utc_timestamp
 from weatherbox.models import BME688 as BME688Model
 from weatherbox.sensors.i2c_manager import get_i2c_bus, i2c_manager
 from weatherbox.sensors.Sensor import I2CSensor
@@ -31,7 +31,7 @@ class BME688(I2CSensor):
         )
 
     async def initialize(self) -> bool:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             self.bme680 = adafruit_bme680.Adafruit_BME680_I2C(
                 get_i2c_bus(self.i2c_bus), self.i2c_address
             )
@@ -52,7 +52,7 @@ class BME688(I2CSensor):
         }
 
     async def read(self) -> BME688Data:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             return BME688Data(
                 temperature=self.bme680.temperature,
                 humidity=self.bme680.relative_humidity,
@@ -72,8 +72,6 @@ class BME688(I2CSensor):
             gas=data.gas,
             altitude=data.altitude,
         )
-        session = get_session()
-        session.add(bme688_data)
-        session.commit()
+        await self.store(bme688_data)
 
         logging.info("Sampled BME688")
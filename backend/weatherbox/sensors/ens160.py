@@ -3,7 +3,7 @@ from typing import NamedTuple
 
 import adafruit_ens160
 
-from weatherbox.db import get_session, utc_timestamp
+from weatherbox.db import utc_timestamp
 from weatherbox.models import ENS160 as ENS160Model
 from weatherbox.sensors.i2c_manager import get_i2c_bus, i2c_manager
 from weatherbox.sensors.Sensor import I2CSensor
@@ -29,7 +29,7 @@ class ENS160(I2CSensor):
         )
 
     async def initialize(self) -> bool:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             self.ens160 = adafruit_ens160.ENS160(
                 get_i2c_bus(self.i2c_bus), self.i2c_address
             )
@@ -37,7 +37,7 @@ class ENS160(I2CSensor):
         return await super().initialize()
 
     async def read(self) -> ENS160Data:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             return ENS160Data(
                 aqi=self.ens160.AQI,
                 tvoc=self.ens160.TVOC,
@@ -53,8 +53,6 @@ class ENS160(I2CSensor):
             tvoc=data.tvoc,
             eco2=data.eco2,
         )
-        session = get_session()
-        session.add(ens160_data)
-        session.commit()
+        await self.store(ens160_data)
 
         logging.info("Sampled ENS160")
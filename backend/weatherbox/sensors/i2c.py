@@ -1,32 +1,167 @@
 # https://github.com/dvsu/sps30/blob/b732f2af929ab7a824b3c95f84c2b499a08bac7d/i2c/i2c.py
-import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
 from fcntl import ioctl
+import os
+from typing import Dict, Optional, Sequence
 
 from weatherbox.sensors.i2c_manager import i2c_manager
 
-I2C_SLAVE = 0x0703
+# From linux/i2c-dev.h and linux/i2c.h
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
 
 
-class I2C:
+class _I2CMessage(ctypes.Structure):
+    _fields_ = [
+        ("addr", ctypes.c_uint16),
+        ("flags", ctypes.c_uint16),
+        ("len", ctypes.c_uint16),
+        ("buf", ctypes.POINTER(ctypes.c_uint8)),
+    ]
+
+
+class _I2CTransfer(ctypes.Structure):
+    _fields_ = [
+        ("msgs", ctypes.POINTER(_I2CMessage)),
+        ("nmsgs", ctypes.c_uint32),
+    ]
+
+
+class LinuxI2CDevice:
+    """
+    A bus's /dev/i2c-N device file, opened once and shared by every address on it.
+    Each transfer addresses its target itself, so no I2C_SLAVE switching is needed.
+    """
+
+    def __init__(self, bus: int):
+        self.fd = os.open(f"/dev/i2c-{bus}", os.O_RDWR)
+
+    def transfer(self, address: int, data: bytes, nbytes: int) -> bytes:
+        """
+        Write data then read nbytes from a device in one transaction, with a
+        repeated start between them. Either part may be empty.
+        """
+        messages = []
+        if data:
+            write_buffer = (ctypes.c_uint8 * len(data)).from_buffer_copy(data)
+            messages.append(_I2CMessage(address, 0, len(data), write_buffer))
+        if nbytes:
+            read_buffer = (ctypes.c_uint8 * nbytes)()
+            messages.append(_I2CMessage(address, I2C_M_RD, nbytes, read_buffer))
+        if not messages:
+            return b""
 
-    def __init__(self, bus: int, address: int):
+        ioctl(
+            self.fd,
+            I2C_RDWR,
+            _I2CTransfer((_I2CMessage * len(messages))(*messages), len(messages)),
+        )
+        return bytes(read_buffer) if nbytes else b""
+
+    def close(self):
+        os.close(self.fd)
+
+
+class I2CBus:
+    """
+    Runs the transfers of one bus in order on the bus's own worker thread, so
+    the event loop never waits on the bus.
+    device is a LinuxI2CDevice, opened on the first transfer so creating sensors
+    never touches the bus, or a fake with the same methods in tests.
+    """
+
+    def __init__(self, bus: int, device=None):
         self.bus = bus
+        self.device = device
+        # Devices holding the bus through get_bus
+        self.users = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"i2c-{bus}"
+        )
+
+    async def transfer(self, address: int, data: Sequence[int], nbytes: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._transfer, address, bytes(data), nbytes
+        )
+
+    def _transfer(self, address: int, data: bytes, nbytes: int) -> bytes:
+        # Only ever runs on the worker thread, so the device is opened once
+        if self.device is None:
+            self.device = LinuxI2CDevice(self.bus)
+        return self.device.transfer(address, data, nbytes)
 
-        self.fr = io.open("/dev/i2c-" + str(bus), "rb", buffering=0)
-        self.fw = io.open("/dev/i2c-" + str(bus), "wb", buffering=0)
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self.device is not None:
+            self.device.close()
+
+
+_buses: Dict[int, I2CBus] = {}
+
+
+def get_bus(bus: int) -> I2CBus:
+    """
+    Get the shared transport of a bus, opening it on first use.
+    Each call must be matched by a release_bus once the caller is done with it.
+    """
+    if bus not in _buses:
+        _buses[bus] = I2CBus(bus)
+    _buses[bus].users += 1
+    return _buses[bus]
+
+
+def release_bus(bus: int):
+    """Release the shared transport of a bus, closing it once no device holds it."""
+    transport = _buses.get(bus)
+    if transport is None:
+        return
 
-        # set device address
-        ioctl(self.fr, I2C_SLAVE, address)
-        ioctl(self.fw, I2C_SLAVE, address)
+    transport.users -= 1
+    if transport.users <= 0:
+        del _buses[bus]
+        transport.close()
+
+
+class I2C:
+    """A device on an I2C bus, holding the bus for each transaction on behalf of owner."""
+
+    def __init__(
+        self,
+        bus: int,
+        address: int,
+        transport: Optional[I2CBus] = None,
+        owner: str = "unknown",
+    ):
+        self.bus = bus
+        self.address = address
+        self.owner = owner
+        self._shared = transport is None
+        self._closed = False
+        self.transport = transport or get_bus(bus)
 
     async def write(self, data: list):
-        async with i2c_manager.acquire_bus(self.bus):
-            self.fw.write(bytearray(data))
+        async with i2c_manager.acquire_bus(self.bus, self.owner):
+            await self.transport.transfer(self.address, data, 0)
 
     async def read(self, nbytes: int) -> list:
-        async with i2c_manager.acquire_bus(self.bus):
-            return list(self.fr.read(nbytes))
+        async with i2c_manager.acquire_bus(self.bus, self.owner):
+            return list(await self.transport.transfer(self.address, [], nbytes))
+
+    async def write_read(self, data: list, nbytes: int) -> list:
+        """Write data then read nbytes with a repeated start, so no other transfer comes between."""
+        async with i2c_manager.acquire_bus(self.bus, self.owner):
+            return list(await self.transport.transfer(self.address, data, nbytes))
 
     def close(self):
-        self.fw.close()
-        self.fr.close()
+        """Release the bus, which is only closed once no other device on it is open."""
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._shared:
+            release_bus(self.bus)
+        else:
+            self.transport.close()
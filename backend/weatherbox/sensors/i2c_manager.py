@@ -1,37 +1,186 @@
 import asyncio
+from bisect import bisect_left
+from collections import defaultdict
 from contextlib import asynccontextmanager
-import board
-import busio
+from enum import IntEnum
+import heapq
+import itertools
+import os
+import time
+from typing import Dict, List
 
 
-i2c_bus0 = busio.I2C(board.D1, board.D0)
-i2c_bus1 = board.I2C()
+class Priority(IntEnum):
+    """Transaction priority classes, lower goes first."""
 
+    INTERRUPT = 0
+    NORMAL = 1
+    BACKGROUND = 2
 
-def get_i2c_bus(bus_number: int):
-    if bus_number == 0:
-        return i2c_bus0
-    elif bus_number == 1:
-        return i2c_bus1
-    else:
-        raise ValueError(f"Invalid I2C bus number: {bus_number}")
 
+# Sensors not listed are NORMAL
+PRIORITIES = {
+    "AS3935": Priority.INTERRUPT,
+    "SPS30": Priority.BACKGROUND,
+}
 
-class I2CManager:
-    def __init__(self):
-        self._lock_bus_0 = asyncio.Lock()
-        self._lock_bus_1 = asyncio.Lock()
+# Seconds of bus time a sensor may hold per budget window before its
+# transactions wait behind every other sensor's for the rest of the window
+BUDGETS = {
+    "SPS30": 0.5,
+}
+BUDGET_WINDOW = float(os.getenv("I2C_BUDGET_WINDOW", "10"))
+
+_adafruit_buses = {}
+
+
+def get_i2c_bus(bus_number: int):
+    """Get the busio I2C object of a bus for Adafruit drivers, creating it on first use."""
+    if bus_number not in _adafruit_buses:
+        import board
+        import busio
 
-    @asynccontextmanager
-    async def acquire_bus(self, bus_number: int):
         if bus_number == 0:
-            async with self._lock_bus_0:
-                yield
+            _adafruit_buses[0] = busio.I2C(board.D1, board.D0)
         elif bus_number == 1:
-            async with self._lock_bus_1:
-                yield
+            _adafruit_buses[1] = board.I2C()
         else:
             raise ValueError(f"Invalid I2C bus number: {bus_number}")
 
+    return _adafruit_buses[bus_number]
+
+
+class Histogram:
+    """Counts of durations by upper bound in milliseconds."""
+
+    BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(self.BOUNDS_MS, seconds * 1000)] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> dict:
+        count = sum(self.counts)
+        labels = [f"<={bound}ms" for bound in self.BOUNDS_MS]
+        labels.append(f">{self.BOUNDS_MS[-1]}ms")
+        return {
+            "count": count,
+            "mean_ms": self.total / count * 1000 if count else 0.0,
+            "max_ms": self.max * 1000,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class BusScheduler:
+    """
+    Grants one bus to one transaction at a time.
+    Waiting transactions go by priority class, then in arrival order, except that
+    a sensor over its time budget waits behind everyone else until the window
+    resets, so a busy sensor cannot starve the others on its bus.
+    """
+
+    def __init__(self, budget_window: float = BUDGET_WINDOW):
+        self.budget_window = budget_window
+        self.wait_times = Histogram()
+        self.hold_times = Histogram()
+        self.transactions: Dict[str, int] = defaultdict(int)
+        self.over_budget: Dict[str, int] = defaultdict(int)
+        self._busy = False
+        self._waiting: List[tuple] = []
+        self._sequence = itertools.count()
+        self._used: Dict[str, float] = defaultdict(float)
+        self._window_start = time.monotonic()
+
+    @asynccontextmanager
+    async def acquire(self, owner: str, priority: Priority):
+        requested = time.monotonic()
+
+        if self._busy:
+            over_budget = self._over_budget(owner)
+            if over_budget:
+                self.over_budget[owner] += 1
+
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(
+                self._waiting,
+                (over_budget, priority, next(self._sequence), future),
+            )
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as it was cancelled, so pass it on
+                    self._release()
+                raise
+        else:
+            self._busy = True
+
+        acquired = time.monotonic()
+        self.wait_times.record(acquired - requested)
+        try:
+            yield
+        finally:
+            held = time.monotonic() - acquired
+            self.hold_times.record(held)
+            self.transactions[owner] += 1
+            self._used[owner] += held
+            self._release()
+
+    def _over_budget(self, owner: str) -> bool:
+        now = time.monotonic()
+        if now - self._window_start >= self.budget_window:
+            self._used.clear()
+            self._window_start = now
+
+        budget = BUDGETS.get(owner)
+        return budget is not None and self._used[owner] >= budget
+
+    def _release(self):
+        """Hand the bus to the next waiting transaction, skipping cancelled ones."""
+        while self._waiting:
+            future = heapq.heappop(self._waiting)[-1]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._busy = False
+
+    def stats(self) -> dict:
+        return {
+            "busy": self._busy,
+            "waiting": sum(not entry[-1].done() for entry in self._waiting),
+            "wait_time": self.wait_times.stats(),
+            "hold_time": self.hold_times.stats(),
+            "transactions": dict(self.transactions),
+            "over_budget": dict(self.over_budget),
+        }
+
+
+class I2CManager:
+    """Schedules the transactions on every I2C bus, each bus independently."""
+
+    def __init__(self):
+        self.buses: Dict[int, BusScheduler] = {}
+
+    def acquire_bus(self, bus_number: int, owner: str = "unknown"):
+        """
+        Hold a bus for one transaction, at the priority of the sensor owning it.
+        Use as async with i2c_manager.acquire_bus(bus, sensor name).
+        """
+        if bus_number not in self.buses:
+            self.buses[bus_number] = BusScheduler()
+
+        priority = PRIORITIES.get(owner, Priority.NORMAL)
+        return self.buses[bus_number].acquire(owner, priority)
+
+    def stats(self) -> dict:
+        return {bus: scheduler.stats() for bus, scheduler in self.buses.items()}
+
 
+# Global I2C manager instance
 i2c_manager = I2CManager()
@@ -3,7 +3,7 @@ from typing import NamedTuple
 
 import adafruit_ltr390
 
-from weatherbox.db import get_session, utc_timestamp
+from weatherbox.db import utc_timestamp
 from weatherbox.models import LTR390 as LTR390Model
 from weatherbox.sensors.i2c_manager import get_i2c_bus, i2c_manager
 from weatherbox.sensors.Sensor import I2CSensor
@@ -28,7 +28,7 @@ class LTR390(I2CSensor):
         )
 
     async def initialize(self) -> bool:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             self.ltr390 = adafruit_ltr390.LTR390(
                 get_i2c_bus(self.i2c_bus), self.i2c_address
             )
@@ -37,7 +37,7 @@ class LTR390(I2CSensor):
         return await super().initialize()
 
     async def read(self) -> LTR390Data:
-        async with i2c_manager.acquire_bus(self.i2c_bus):
+        async with i2c_manager.acquire_bus(self.i2c_bus, self.name):
             return LTR390Data(light=self.ltr390.light, uvs=self.ltr390.uvs)
 
     async def read_and_store(self):
@@ -48,8 +48,6 @@ class LTR390(I2CSensor):
             light=data.light,
             uvs=data.uvs,
         )
-        session = get_session()
-        session.add(ltr390_data)
-        session.commit()
+        await self.store(ltr390_data)
 
         logging.info("Sampled LTR390")
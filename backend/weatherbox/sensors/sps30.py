@@ -1,10 +1,12 @@
 import asyncio
+from array import array
 import logging
+import os
+import struct
 import sys
-from queue import Queue
-from typing import Dict, NamedTuple
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
 
-from weatherbox.db import get_session, utc_timestamp
+from weatherbox.db import utc_timestamp
 from weatherbox.models import SPS30 as SPS30Model
 from weatherbox.sensors.i2c import I2C
 from weatherbox.sensors.Sensor import I2CSensor, SensorStatus
@@ -46,18 +48,163 @@ SIZE_FLOAT = 6  # IEEE754 float
 SIZE_INTEGER = 3  # unsigned 16 bit integer
 
 
+# CRC-8 over each 2 byte word, polynomial 0x31 starting from 0xFF
+CRC8_POLYNOMIAL = 0x31
+CRC8_INIT = 0xFF
+
+# Measured values frame, ten big-endian floats once the CRC bytes are removed
+MEASURED_VALUES = struct.Struct(">10f")
+MASS_DENSITY_KEYS = ["pm1.0", "pm2.5", "pm4.0", "pm10"]
+PARTICLE_COUNT_KEYS = ["pm0.5", "pm1.0", "pm2.5", "pm4.0", "pm10"]
+# Model columns of the measured values, in frame order
+MODEL_FIELDS = [
+    "pm10",
+    "pm25",
+    "pm40",
+    "pm100",
+    "nc05",
+    "nc10",
+    "nc25",
+    "nc40",
+    "nc100",
+    "typical_particle_size",
+]
+# Model columns of the maximum of each value between stored rows
+MODEL_MAX_FIELDS = [f"{field}_max" for field in MODEL_FIELDS]
+
+# Samples kept from continuous acquisition, enough for a few missed scheduler ticks
+SPS30_RING_SIZE = int(os.getenv("SPS30_RING_SIZE", "120"))
+# Seconds to wait for the first sample once measurement starts
+DATA_READY_TIMEOUT = 60
+
+
 class SPS30Data(NamedTuple):
     mass_density: Dict[str, float]
     particle_count: Dict[str, float]
     particle_size: float
 
 
+def _crc8_table() -> bytes:
+    """CRC of every byte value, so the CRC of a word takes two lookups."""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ CRC8_POLYNOMIAL if crc & 0x80 else crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data: Sequence[int]) -> int:
+    crc = CRC8_INIT
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def decode_measured_values(data: Sequence[int]) -> Optional[SPS30Data]:
+    """
+    Decode a measured values frame of 20 words, each followed by its CRC, in IEEE754
+    float format, checking every CRC before unpacking all ten values at once.
+    Returns None if the frame has the wrong length or any CRC does not match.
+    Values are rounded to 3 decimals, as they always have been.
+    """
+    values = unpack_measured_values(data)
+    if values is None:
+        return None
+    return to_sps30_data(values)
+
+
+def unpack_measured_values(data: Sequence[int]) -> Optional[List[float]]:
+    """Decode a measured values frame into its ten values in frame order, see decode_measured_values."""
+    frame = bytes(data)
+    if len(frame) != NBYTES_MEASURED_VALUES_FLOAT:
+        logging.warning(f"SPS30 measured values frame of {len(frame)} bytes")
+        return None
+
+    for word, (high, low, crc) in enumerate(zip(frame[::3], frame[1::3], frame[2::3])):
+        if CRC8_TABLE[CRC8_TABLE[CRC8_INIT ^ high] ^ low] != crc:
+            logging.warning(f"SPS30 measured values CRC mismatched in word {word}")
+            return None
+
+    payload = bytearray(frame)
+    del payload[2::PACKET_SIZE]
+    return [round(value, 3) for value in MEASURED_VALUES.unpack(payload)]
+
+
+def to_sps30_data(values: Sequence[float]) -> SPS30Data:
+    return SPS30Data(
+        mass_density=dict(zip(MASS_DENSITY_KEYS, values[:4])),
+        particle_count=dict(zip(PARTICLE_COUNT_KEYS, values[4:9])),
+        particle_size=values[9],
+    )
+
+
+class MeasurementRing:
+    """
+    The latest measured values, capacity samples of ten floats in one array
+    allocated up front and overwritten oldest first.
+    Tracks the samples added since the last aggregate, so each scheduler tick
+    combines exactly the samples acquired since the previous one.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.width = len(MODEL_FIELDS)
+        self.overwritten = 0
+        self._values = array("d", bytes(8 * capacity * self.width))
+        self._next = 0
+        self._count = 0
+        self._pending = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, values: Sequence[float]):
+        start = self._next * self.width
+        for i, value in enumerate(values):
+            self._values[start + i] = value
+
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        if self._pending == self.capacity:
+            # Not aggregated before being overwritten
+            self.overwritten += 1
+        else:
+            self._pending += 1
+
+    def latest(self) -> Optional[List[float]]:
+        if not self._count:
+            return None
+        return self._sample(1)
+
+    def aggregate(self) -> Optional[Tuple[List[float], List[float]]]:
+        """
+        Combine the samples added since the last aggregate into their means and
+        maximums per value, or None if there are none.
+        """
+        pending, self._pending = self._pending, 0
+        if not pending:
+            return None
+
+        columns = list(zip(*(self._sample(age) for age in range(1, pending + 1))))
+        means = [round(sum(column) / pending, 3) for column in columns]
+        return means, [max(column) for column in columns]
+
+    def _sample(self, age: int) -> List[float]:
+        """Get a sample by how many samples ago it was added, 1 being the latest."""
+        start = (self._next - age) % self.capacity * self.width
+        return self._values[start : start + self.width].tolist()
+
+
 class SPS30(I2CSensor):
     sampling_period: int
     i2c: I2C
-    task: asyncio.Task
-    __data: Queue
-    __valid: Dict[str, bool]
+    task: Optional[asyncio.Task]
+    samples: MeasurementRing
 
     def __init__(
         self,
@@ -67,13 +214,9 @@ class SPS30(I2CSensor):
     ):
         super().__init__("SPS30", i2c_bus, i2c_address)
         self.sampling_period = sampling_period
-        self.i2c = I2C(self.i2c_bus, self.i2c_address)
-        self.__data = Queue(maxsize=20)
-        self.__valid = {
-            "mass_density": False,
-            "particle_count": False,
-            "particle_size": False,
-        }
+        self.i2c = I2C(self.i2c_bus, self.i2c_address, owner=self.name)
+        self.task = None
+        self.samples = MeasurementRing(SPS30_RING_SIZE)
 
     async def initialize(self) -> bool:
         """Initialize SPS30 sensor with proper startup sequence."""
@@ -89,19 +232,16 @@ class SPS30(I2CSensor):
             # Start measurement mode
             await self.start_measurement()
 
-            # Wait for first data to be ready
-            max_wait_time = 60  # 60 seconds max wait
-            wait_time = 0
-            while not await self.read_data_ready_flag():
-                await asyncio.sleep(1)
-                wait_time += 1
-                if wait_time >= max_wait_time:
-                    raise TimeoutError("SPS30 data not ready within timeout period")
+            await self._wait_for_sample()
 
             logging.info("SPS30 measurement started successfully")
 
         except Exception as e:
             logging.error(f"SPS30 initialization failed: {e}")
+            # Stop acquiring in the background, as stop_measurement does
+            if self.task is not None:
+                self.task.cancel()
+                self.task = None
             self.status = SensorStatus.ERROR
             return False
 
@@ -119,61 +259,51 @@ class SPS30(I2CSensor):
         return await super().deinitialize()
 
     async def read(self) -> SPS30Data:
-        await self.start_measurement()
-
-        while not await self.read_data_ready_flag():
-            await asyncio.sleep(0.1)
+        """Get the latest measurement from continuous acquisition."""
+        if self.task is None or self.task.done():
+            await self.start_measurement()
 
-        data = await self.get_measurement()
-        await self.stop_measurement()
+        await self._wait_for_sample()
+        return to_sps30_data(self.samples.latest())
 
-        return SPS30Data(
-            mass_density=data["sensor_data"]["mass_density"],
-            particle_count=data["sensor_data"]["particle_count"],
-            particle_size=data["sensor_data"]["particle_size"],
-        )
+    async def _wait_for_sample(self):
+        """Wait for the first sample to be acquired, raising TimeoutError if it never is."""
+        wait_time = 0
+        while not len(self.samples):
+            if wait_time >= DATA_READY_TIMEOUT:
+                raise TimeoutError("SPS30 data not ready within timeout period")
+            await asyncio.sleep(1)
+            wait_time += 1
 
     async def read_and_store(self):
-        if not await self.read_data_ready_flag():
-            return  # No data ready, skip this reading
-
-        data = await self.get_measurement()
+        """
+        Store the means and maximums of the samples acquired since the last call
+        in one row, without touching the bus, as acquisition runs in the background.
+        """
+        aggregate = self.samples.aggregate()
 
-        if not data:  # Empty data, skip this reading
+        if aggregate is None:  # No samples since the last call, skip this reading
             return
 
+        means, maxes = aggregate
         sps30_data = SPS30Model(
             timestamp=utc_timestamp(),
-            pm10=data["sensor_data"]["mass_density"]["pm1.0"],
-            pm25=data["sensor_data"]["mass_density"]["pm2.5"],
-            pm40=data["sensor_data"]["mass_density"]["pm4.0"],
-            pm100=data["sensor_data"]["mass_density"]["pm10"],
-            nc05=data["sensor_data"]["particle_count"]["pm0.5"],
-            nc10=data["sensor_data"]["particle_count"]["pm1.0"],
-            nc25=data["sensor_data"]["particle_count"]["pm2.5"],
-            nc40=data["sensor_data"]["particle_count"]["pm4.0"],
-            nc100=data["sensor_data"]["particle_count"]["pm10"],
-            typical_particle_size=data["sensor_data"]["particle_size"],
+            **dict(zip(MODEL_FIELDS, means)),
+            **dict(zip(MODEL_MAX_FIELDS, maxes)),
         )
-        session = get_session()
-        session.add(sps30_data)
-        session.commit()
+        await self.store(sps30_data)
 
         logging.info("Sampled SPS30")
 
+    def get_settings(self) -> dict:
+        return {
+            **super().get_settings(),
+            "sampling_period": self.sampling_period,
+            "ring_size": self.samples.capacity,
+        }
+
     def crc_calc(self, data: list) -> int:
-        crc = 0xFF
-        for i in range(2):
-            crc ^= data[i]
-            for _ in range(8, 0, -1):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
-
-        # The checksum only contains 8-bit,
-        # so the calculated value has to be masked with 0xFF
-        return crc & 0x0000FF
+        return crc8(data[:2])
 
     async def firmware_version(self) -> str:
         await self._write(CMD_FIRMWARE_VERSION)
@@ -294,112 +424,6 @@ class SPS30(I2CSensor):
     async def reset(self) -> None:
         await self.i2c.write(CMD_RESET)
 
-    def __ieee754_number_conversion(self, data: int) -> float:
-        binary = "{:032b}".format(data)
-
-        sign = int(binary[0:1])
-        exp = int(binary[1:9], 2) - 127
-
-        divider = 0
-        if exp < 0:
-            divider = abs(exp)
-            exp = 0
-
-        mantissa = binary[9:]
-
-        real = int(("1" + mantissa[:exp]), 2)
-        decimal = mantissa[exp:]
-
-        dec = 0.0
-        for i in range(len(decimal)):
-            dec += int(decimal[i]) / (2 ** (i + 1))
-
-        if divider == 0:
-            return round((((-1) ** (sign) * real) + dec), 3)
-        else:
-            return round((((-1) ** (sign) * real) + dec) / pow(2, divider), 3)
-
-    def __mass_density_measurement(self, data: list) -> dict:
-        category = ["pm1.0", "pm2.5", "pm4.0", "pm10"]
-
-        density = {"pm1.0": 0.0, "pm2.5": 0.0, "pm4.0": 0.0, "pm10": 0.0}
-
-        for block, (pm) in enumerate(category):
-            pm_data = []
-            for i in range(0, SIZE_FLOAT, PACKET_SIZE):
-                offset = (block * SIZE_FLOAT) + i
-                if self.crc_calc(data[offset : offset + 2]) != data[offset + 2]:
-                    logging.warning(
-                        "'__mass_density_measurement' CRC mismatched!"
-                        + f"  Data: {data[offset:offset+2]}"
-                        + f"  Calculated CRC: {self.crc_calc(data[offset:offset+2])}"
-                        + f"  Expected: {data[offset+2]}"
-                    )
-                    self.__valid["mass_density"] = False
-                    return {}
-
-                pm_data.extend(data[offset : offset + 2])
-
-            density[pm] = self.__ieee754_number_conversion(
-                pm_data[0] << 24 | pm_data[1] << 16 | pm_data[2] << 8 | pm_data[3]
-            )
-
-        self.__valid["mass_density"] = True
-
-        return density
-
-    def __particle_count_measurement(self, data: list) -> dict:
-        category = ["pm0.5", "pm1.0", "pm2.5", "pm4.0", "pm10"]
-
-        count = {"pm0.5": 0.0, "pm1.0": 0.0, "pm2.5": 0.0, "pm4.0": 0.0, "pm10": 0.0}
-
-        for block, (pm) in enumerate(category):
-            pm_data = []
-            for i in range(0, SIZE_FLOAT, PACKET_SIZE):
-                offset = (block * SIZE_FLOAT) + i
-                if self.crc_calc(data[offset : offset + 2]) != data[offset + 2]:
-                    logging.warning(
-                        "'__particle_count_measurement' CRC mismatched!"
-                        + f"  Data: {data[offset:offset+2]}"
-                        + f"  Calculated CRC: {self.crc_calc(data[offset:offset+2])}"
-                        + f"  Expected: {data[offset+2]}"
-                    )
-
-                    self.__valid["particle_count"] = False
-                    return {}
-
-                pm_data.extend(data[offset : offset + 2])
-
-            count[pm] = self.__ieee754_number_conversion(
-                pm_data[0] << 24 | pm_data[1] << 16 | pm_data[2] << 8 | pm_data[3]
-            )
-
-        self.__valid["particle_count"] = True
-
-        return count
-
-    def __particle_size_measurement(self, data: list) -> float:
-        size = []
-        for i in range(0, SIZE_FLOAT, PACKET_SIZE):
-            if self.crc_calc(data[i : i + 2]) != data[i + 2]:
-                logging.warning(
-                    "'__particle_size_measurement' CRC mismatched!"
-                    + f"  Data: {data[i:i+2]}"
-                    + f"  Calculated CRC: {self.crc_calc(data[i:i+2])}"
-                    + f"  Expected: {data[i+2]}"
-                )
-
-                self.__valid["particle_size"] = False
-                return 0.0
-
-            size.extend(data[i : i + 2])
-
-        self.__valid["particle_size"] = True
-
-        return self.__ieee754_number_conversion(
-            size[0] << 24 | size[1] << 16 | size[2] << 8 | size[3]
-        )
-
     async def __read_measured_value(self) -> None:
         while True:
             try:
@@ -409,24 +433,9 @@ class SPS30(I2CSensor):
                 await self._write(CMD_READ_MEASURED_VALUES)
                 data = await self._read(NBYTES_MEASURED_VALUES_FLOAT)
 
-                if self.__data.full():
-                    self.__data.get()
-
-                result = {
-                    "sensor_data": {
-                        "mass_density": self.__mass_density_measurement(data[:24]),
-                        "particle_count": self.__particle_count_measurement(
-                            data[24:54]
-                        ),
-                        "particle_size": self.__particle_size_measurement(data[54:]),
-                        "mass_density_unit": "ug/m3",
-                        "particle_count_unit": "#/cm3",
-                        "particle_size_unit": "um",
-                    },
-                    "timestamp": utc_timestamp(),
-                }
-
-                self.__data.put(result if all(self.__valid.values()) else {})
+                values = unpack_measured_values(data)
+                if values is not None:
+                    self.samples.append(values)
 
             except KeyboardInterrupt:
                 logging.warning("Stopping measurement...")
@@ -443,8 +452,8 @@ class SPS30(I2CSensor):
     async def start_measurement(self) -> None:
         data_format = {"IEEE754_float": 0x03, "unsigned_16_bit_integer": 0x05}
 
-        data = CMD_START_MEASUREMENT
-        data.extend([data_format["IEEE754_float"], 0x00])
+        # Copied, so the command is the same on every call
+        data = CMD_START_MEASUREMENT + [data_format["IEEE754_float"], 0x00]
         data.append(self.crc_calc(data[2:4]))
         await self.i2c.write(data)
         await asyncio.sleep(0.05)
@@ -463,11 +472,18 @@ class SPS30(I2CSensor):
         await self._write(CMD_READ_MEASURED_VALUES)
         data = await self._read(NBYTES_MEASURED_VALUES_FLOAT)
 
-        result = {
+        return self.__measurement_result(data)
+
+    def __measurement_result(self, data: list) -> dict:
+        measurement = decode_measured_values(data)
+        if measurement is None:
+            return {}
+
+        return {
             "sensor_data": {
-                "mass_density": self.__mass_density_measurement(data[:24]),
-                "particle_count": self.__particle_count_measurement(data[24:54]),
-                "particle_size": self.__particle_size_measurement(data[54:]),
+                "mass_density": measurement.mass_density,
+                "particle_count": measurement.particle_count,
+                "particle_size": measurement.particle_size,
                 "mass_density_unit": "ug/m3",
                 "particle_count_unit": "#/cm3",
                 "particle_size_unit": "um",
@@ -475,12 +491,15 @@ class SPS30(I2CSensor):
             "timestamp": utc_timestamp(),
         }
 
-        return result if all(self.__valid.values()) else {}
-
     async def stop_measurement(self) -> None:
         await self.i2c.write(CMD_STOP_MEASUREMENT)
-        self.task.cancel()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
         # self.i2c.close()
 
     def __run(self) -> None:
+        """Start acquiring samples into the ring in the background."""
+        if self.task is not None:
+            self.task.cancel()
         self.task = asyncio.create_task(self.__read_measured_value())
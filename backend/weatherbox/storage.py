@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+import logging
+import os
+import sys
+from typing import Callable, Optional
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "images")
+
+
+class ImageStorage:
+    """
+    Stored images, kept in one directory per day (YYYY/MM/DD) by the UTC date
+    in their timestamp file names, so no directory grows past a day of captures.
+    Images are written under a temporary name and renamed into place, so a
+    crash mid-write never leaves a partial image behind.
+    Images from the older flat layout are still found until migrated.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, name: str) -> str:
+        """Get the sharded path of an image, whether or not it exists yet."""
+        try:
+            timestamp = datetime.fromisoformat(os.path.splitext(name)[0])
+        except ValueError:
+            # Not named by timestamp, so kept at the top level
+            return os.path.join(self.root, name)
+
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc)
+        return os.path.join(self.root, timestamp.strftime("%Y/%m/%d"), name)
+
+    def find(self, name: str) -> Optional[str]:
+        """Get the path of a stored image, or None if it is not stored."""
+        for path in (self.path_for(name), os.path.join(self.root, name)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def save(self, name: str, write: Callable[[str], None]) -> str:
+        """
+        Store an image by calling write with a temporary path to write it to,
+        then renaming it into place. Returns its path.
+        """
+        path = self.path_for(name)
+        directory, file_name = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Keeps the extension, which writers such as Picamera2 take the format from
+        tmp_path = os.path.join(directory, f".tmp-{file_name}")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return path
+
+    def migrate_flat(self, dry_run: bool = False) -> int:
+        """
+        Move images from the older flat layout into their day directories.
+        Returns the number of images moved, or that would be with dry_run.
+        """
+        moved = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+
+            path = self.path_for(entry.name)
+            if path == entry.path:
+                continue
+
+            if not dry_run:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(entry.path, path)
+            moved += 1
+
+        action = "Would move" if dry_run else "Moved"
+        logging.info(f"{action} {moved} images into day directories in {self.root}")
+        return moved
+
+
+# Global image storage instance
+image_storage = ImageStorage(IMAGE_DIR)
+
+
+if __name__ == "__main__":
+    # Move images from the flat layout without starting the app, e.g. python -m weatherbox.storage [--dry-run]
+    logging.basicConfig(level=logging.INFO)
+    image_storage.migrate_flat(dry_run="--dry-run" in sys.argv[1:])
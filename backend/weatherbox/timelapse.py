@@ -1,26 +1,57 @@
+from concurrent.futures import Future
+from functools import partial
 import logging
 import os
 
+from weatherbox.cache import image_count_cache
 from weatherbox.camera.arducam import capture_and_save_image
 from weatherbox.db import get_session, utc_timestamp
-from weatherbox.models import TimelapseImage
-
-IMAGE_DIR = "/home/jordan/code/weatherbox/backend/images"
+from weatherbox.derivatives import derivative_cache
+from weatherbox.models import TimelapseImage, to_millis
+from weatherbox.storage import image_storage
 
 TIMELAPSE_DISABLED = os.getenv("TIMELAPSE_DISABLED", "false").lower() == "true"
 
+# Thumbnails rendered after each capture, matching the /images/{id} defaults
+THUMBNAIL_SIZES = ["small", "medium"]
+THUMBNAIL_FORMAT = "jpeg"
+THUMBNAIL_QUALITY = 80
+
 
 def capture() -> str:
     now = utc_timestamp()
     name = f"{now}.jpg"
 
-    capture_and_save_image(f"{IMAGE_DIR}/{name}")
+    image_storage.save(name, capture_and_save_image)
 
     image = TimelapseImage(timestamp=now, file_name=name)
-    session = get_session()
-    session.add(image)
-    session.commit()
+    with get_session() as session:
+        session.add(image)
+        session.commit()
+        image_id = image.id
+    image_count_cache.invalidate(to_millis(now))
 
     logging.info("Captured timelapse image")
 
+    generate_thumbnails(image_id, name)
+
     return name
+
+
+def generate_thumbnails(image_id: int, name: str):
+    """
+    Render the thumbnails of a captured image into the derivative cache in the
+    background, without waiting for them, so the gallery finds them cached.
+    """
+    for size in THUMBNAIL_SIZES:
+        _, future = derivative_cache.render_in_background(
+            image_storage.path_for(name), size, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY
+        )
+        future.add_done_callback(partial(_thumbnail_done, image_id, size))
+
+
+def _thumbnail_done(image_id: int, size: str, done: Future):
+    if done.exception() is not None:
+        logging.error(
+            f"Failed to render {size} thumbnail of image {image_id}: {done.exception()}"
+        )
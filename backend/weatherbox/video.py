@@ -0,0 +1,195 @@
+import io
+import os
+import struct
+from typing import BinaryIO, List, Tuple
+
+from PIL import Image
+
+from weatherbox.imaging import resize_and_encode
+
+# RIFF header, hdrl list and movi list header, rewritten once all frames are known
+AVI_HEADER_SIZE = 224
+# Frame offsets in the index count from the movi list's fourcc
+MOVI_OFFSET = AVI_HEADER_SIZE - 4
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+# Sizes and offsets in the RIFF headers and index are 32-bit
+MAX_AVI_BYTES = 2**32 - 1
+# Generous estimate of a JPEG frame's size, to check a video fits before rendering it
+JPEG_BYTES_PER_PIXEL = 0.5
+# Chunk header and index entry of each frame
+FRAME_OVERHEAD = 8 + 16
+
+
+class VideoTooLargeError(ValueError):
+    """The video would not fit in an AVI file."""
+
+
+def estimate_video_bytes(frames: int, size: Tuple[int, int]) -> int:
+    """Estimate the file size of a video of frames at size, erring on the large side."""
+    width, height = size
+    frame_bytes = int(width * height * JPEG_BYTES_PER_PIXEL) + FRAME_OVERHEAD
+    return AVI_HEADER_SIZE + 8 + frames * frame_bytes
+
+
+class AviWriter:
+    """
+    Writes JPEG frames into a Motion JPEG AVI file as they come.
+    Only each frame's offset and size are kept, so memory use does not grow
+    with the frame data.
+    A frame that would take the file past max_bytes raises VideoTooLargeError
+    before it is written, rather than the header failing once all are written.
+    """
+
+    def __init__(self, file: BinaryIO, fps: int, max_bytes: int = MAX_AVI_BYTES):
+        self.file = file
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.size = (0, 0)
+        self._index: List[Tuple[int, int]] = []
+        self.file.write(bytes(AVI_HEADER_SIZE))
+
+    def add_frame(self, jpeg: bytes, size: Tuple[int, int]):
+        if not self._index:
+            self.size = size
+
+        # The frame's chunk, then the index with an entry for it
+        end = self.file.tell() + 8 + len(jpeg) + len(jpeg) % 2
+        end += 8 + (len(self._index) + 1) * 16
+        if end > self.max_bytes:
+            raise VideoTooLargeError(
+                f"Video would exceed {self.max_bytes} bytes after {len(self._index)} frames"
+            )
+
+        self._index.append((self.file.tell() - MOVI_OFFSET, len(jpeg)))
+        self.file.write(b"00dc" + struct.pack("<I", len(jpeg)) + jpeg)
+        if len(jpeg) % 2:
+            self.file.write(b"\0")
+
+    def close(self):
+        movi_size = self.file.tell() - MOVI_OFFSET
+
+        self.file.write(b"idx1" + struct.pack("<I", len(self._index) * 16))
+        for offset, length in self._index:
+            self.file.write(
+                b"00dc" + struct.pack("<III", AVIIF_KEYFRAME, offset, length)
+            )
+
+        riff_size = self.file.tell() - 8
+        self.file.seek(0)
+        self.file.write(self._header(riff_size, movi_size))
+        self.file.seek(0, os.SEEK_END)
+
+    def _header(self, riff_size: int, movi_size: int) -> bytes:
+        width, height = self.size
+        frames = len(self._index)
+        max_frame = max((length for _, length in self._index), default=0)
+
+        avih = struct.pack(
+            "<14I",
+            1_000_000 // self.fps,  # Microseconds per frame
+            max_frame * self.fps,  # Max bytes per second
+            0,
+            AVIF_HASINDEX,
+            frames,
+            0,
+            1,  # Streams
+            max_frame,  # Suggested buffer size
+            width,
+            height,
+            0,
+            0,
+            0,
+            0,
+        )
+        strh = (
+            b"vids"
+            + b"MJPG"
+            + struct.pack(
+                "<IHHIIIIIIiI4h",
+                0,
+                0,
+                0,
+                0,
+                1,  # Scale, with rate gives frames per second
+                self.fps,
+                0,
+                frames,
+                max_frame,
+                -1,  # Default quality
+                0,
+                0,
+                0,
+                width,
+                height,
+            )
+        )
+        strf = struct.pack(
+            "<IiiHH4sIiiII",
+            40,
+            width,
+            height,
+            1,
+            24,
+            b"MJPG",
+            width * height * 3,
+            0,
+            0,
+            0,
+            0,
+        )
+
+        strl = _list(b"strl", _chunk(b"strh", strh) + _chunk(b"strf", strf))
+        hdrl = _list(b"hdrl", _chunk(b"avih", avih) + strl)
+        header = b"RIFF" + struct.pack("<I", riff_size) + b"AVI " + hdrl
+        header += b"LIST" + struct.pack("<I", movi_size) + b"movi"
+        assert len(header) == AVI_HEADER_SIZE
+        return header
+
+
+def _chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack("<I", len(data)) + data
+
+
+def _list(list_type: bytes, data: bytes) -> bytes:
+    return b"LIST" + struct.pack("<I", len(data) + 4) + list_type + data
+
+
+def render_video(
+    paths: List[str], dest: str, size: Tuple[int, int], fps: int, quality: int
+) -> int:
+    """
+    Render image files into a Motion JPEG AVI at dest, one frame per image,
+    decoding and resizing one image at a time. Unreadable images are skipped.
+    Written atomically, leaving nothing behind on failure, and kept free of app imports so it can run in a worker process.
+    Returns the number of frames written.
+    """
+    tmp_dest = f"{dest}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_dest, "wb") as file:
+            writer = AviWriter(file, fps)
+            for path in paths:
+                try:
+                    jpeg = resize_and_encode(path, size, "jpeg", quality)
+                except OSError:
+                    continue
+
+                with Image.open(io.BytesIO(jpeg)) as img:
+                    frame_size = img.size
+                # Frames must all be the same size, so skip any odd ones out
+                if writer.size not in ((0, 0), frame_size):
+                    continue
+                writer.add_frame(jpeg, frame_size)
+
+            writer.close()
+            frames = len(writer._index)
+
+        os.replace(tmp_dest, dest)
+    except BaseException:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+        raise
+
+    return frames